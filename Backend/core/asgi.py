@@ -3,6 +3,11 @@ ASGI config for hands project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The async vista02 endpoints (samples_batch, progress, model, last-detected, reset)
+only avoid tying up a worker when served through this entry point, e.g.:
+
+    uvicorn core.asgi:application --host 127.0.0.1 --port 8000
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -109,6 +112,9 @@ CORS_ALLOWED_ORIGINS = [
     "https://www.devproyectos.com",
 ]
 CORS_ALLOW_CREDENTIALS = True
+# X-Client-Id: identifica la pestaña para agrupar frames de predict
+# X-Profile-Id: perfil (propietario) de las muestras y del modelo
+CORS_ALLOW_HEADERS = (*default_headers, "x-client-id", "x-profile-id")
 
 CSRF_TRUSTED_ORIGINS = [
     "https://devproyectos.com",
@@ -122,3 +128,92 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
 X_FRAME_OPTIONS = 'DENY'
+
+# ===== Vista02: snapshot columnar de muestras =====
+# Copia float32 por letra de HandSample (memmap) usada por entrenamiento y evaluación.
+# La BD sigue siendo la fuente de verdad; el snapshot se sincroniza de forma incremental.
+VISTA02_SNAPSHOT_DIR = BASE_DIR / 'snapshots' / 'samples'
+VISTA02_TRAIN_FROM_SNAPSHOT = True
+# Hilos para la extracción de features desde vistas async (acota el trabajo de CPU concurrente)
+VISTA02_CPU_WORKERS = 4
+# Control de admisión de predict: predicciones simultáneas, cola de espera y espera máxima (s).
+# Por cliente solo espera el frame más reciente: el anterior que aún esperaba responde 200 con
+# {"status": "superseded"}. Solo las peticiones descartadas (cola llena o espera agotada) reciben 503.
+VISTA02_PREDICT_MAX_ACTIVE = 8
+VISTA02_PREDICT_MAX_WAITING = 32
+VISTA02_PREDICT_WAIT_TIMEOUT = 0.5
+# Micro-lotes de predict: las clasificaciones que llegan dentro de la ventana (ms) se agrupan
+# en una pasada vectorizada de hasta BATCH_MAX filas (0 = apagado; cada petición espera como
+# mucho la ventana). El tamaño útil del lote también lo limita VISTA02_PREDICT_MAX_ACTIVE.
+# Funciona bajo ASGI y bajo WSGI: la espera del lote es async y no ocupa un hilo.
+VISTA02_PREDICT_BATCH_WINDOW_MS = 0
+VISTA02_PREDICT_BATCH_MAX = 32
+# Modelos por perfil: caché LRU de modelos cargados (entradas y bytes aproximados)
+VISTA02_MODEL_CACHE_ENTRIES = 256
+VISTA02_MODEL_CACHE_BYTES = 64 * 1024 * 1024
+# Entrenamientos simultáneos entre todos los perfiles (el resto espera en cola)
+VISTA02_MAX_TRAINING_JOBS = 2
+# Perfilador opcional: fracción de peticiones perfiladas (0 = apagado) en las vistas listadas.
+# Con un token, la cabecera X-Profiler-Token fuerza el perfilado de esa petición y habilita
+# /api/profiler. Modos: "cprofile" (pstats) o "sample" (pilas colapsadas, menor sobrecarga).
+VISTA02_PROFILER_SAMPLE_RATE = 0.0
+VISTA02_PROFILER_VIEWS = ("predict", "train_model", "samples_batch")
+VISTA02_PROFILER_MODE = "cprofile"
+VISTA02_PROFILER_INTERVAL = 0.005
+VISTA02_PROFILER_TOKEN = os.environ.get("VISTA02_PROFILER_TOKEN", "")
+# Registro de predicciones para análisis offline: fracción muestreada (0 = apagado),
+# destino ("db" -> tabla PredictionLog, "file" -> JSONL rotativo) y buffer en memoria.
+# Con el buffer lleno los registros nuevos se descartan (predict nunca espera al log).
+VISTA02_PREDICTION_LOG_SAMPLE_RATE = 0.0
+VISTA02_PREDICTION_LOG_SINK = "db"
+VISTA02_PREDICTION_LOG_BUFFER = 10000
+VISTA02_PREDICTION_LOG_BATCH = 500
+VISTA02_PREDICTION_LOG_FLUSH_SECONDS = 2.0
+VISTA02_PREDICTION_LOG_FEATURES = True
+VISTA02_PREDICTION_LOG_FILE = BASE_DIR / 'logs' / 'predictions.jsonl'
+VISTA02_PREDICTION_LOG_FILE_MAX_BYTES = 50 * 1024 * 1024
+VISTA02_PREDICTION_LOG_FILE_BACKUPS = 5
+# Retención de la tabla PredictionLog (SINK = "db"): filas con más de RETENTION_SECONDS y,
+# por encima de MAX_ROWS, las más antiguas se borran en lotes desde el hilo de escritura
+# cada PURGE_SECONDS (0 = solo con `manage.py purge_prediction_logs`). None desactiva cada criterio.
+VISTA02_PREDICTION_LOG_RETENTION_SECONDS = 30 * 24 * 3600
+VISTA02_PREDICTION_LOG_MAX_ROWS = 1_000_000
+VISTA02_PREDICTION_LOG_PURGE_SECONDS = 3600
+VISTA02_PREDICTION_LOG_PURGE_BATCH = 500
+# Reentrenamiento automático: tras VISTA02_AUTOTRAIN_NEW_SAMPLES muestras nuevas o una
+# deriva por letra >= VISTA02_AUTOTRAIN_DRIFT, entrena cuando la ingesta lleva DEBOUNCE
+# segundos en calma (como mucho MAX_DELAY tras el primer aviso, y con MIN_INTERVAL entre
+# reentrenamientos). El planificador vive en cada proceso: con varios workers, activarlo en uno.
+# Desactivado salvo que se pida (VISTA02_AUTOTRAIN_ENABLED=1 en el entorno).
+VISTA02_AUTOTRAIN_ENABLED = os.environ.get("VISTA02_AUTOTRAIN_ENABLED", "0") == "1"
+VISTA02_AUTOTRAIN_NEW_SAMPLES = 200
+VISTA02_AUTOTRAIN_DRIFT = 0.25
+VISTA02_AUTOTRAIN_DEBOUNCE_SECONDS = 30
+VISTA02_AUTOTRAIN_MAX_DELAY_SECONDS = 300
+VISTA02_AUTOTRAIN_MIN_INTERVAL_SECONDS = 120
+VISTA02_AUTOTRAIN_TICK_SECONDS = 5
+# Suavizado por sesión en predict ("smooth": true): ventana de frames recientes por cliente
+# en un bloque de memoria fijo (SESSIONS x WINDOW_FRAMES x 14 bytes).
+VISTA02_SMOOTHING_SESSIONS = 10000
+VISTA02_SMOOTHING_WINDOW_FRAMES = 8
+VISTA02_SMOOTHING_WINDOW_SECONDS = 0.5
+VISTA02_SMOOTHING_TTL_SECONDS = 60
+VISTA02_SMOOTHING_STABLE_RATIO = 0.7
+# Umbrales por percentil con sketches KLL (una pasada, fusionables) en lugar del cálculo
+# exacto por refinamiento; K controla el error de rango (~1.7/K) y la memoria (~3*K valores por letra).
+VISTA02_THRESHOLD_SKETCH = False
+VISTA02_THRESHOLD_SKETCH_K = 200
+# Archivo de muestras viejas (manage.py archive_samples): salen de la tabla a segmentos
+# float32 comprimidos. Política por antigüedad (días) y/o tope de muestras por letra
+# (None desactiva cada criterio); el entrenamiento las incluye solo si se activa.
+VISTA02_ARCHIVE_DIR = BASE_DIR / 'archive' / 'samples'
+VISTA02_ARCHIVE_AFTER_DAYS = None
+VISTA02_ARCHIVE_PER_LETTER_CAP = None
+VISTA02_TRAIN_INCLUDE_ARCHIVE = False
+
+# ===== Vista01: retención de datos temporales =====
+# Los datos de Vista01 se eliminan por antigüedad (ya no en cada carga de página).
+VISTA01_RETENTION_SECONDS = 3600
+# Intervalo del barrido en proceso; 0 lo desactiva (usar `manage.py purge_vista01` desde cron)
+VISTA01_RETENTION_SWEEP_SECONDS = 300
+VISTA01_RETENTION_BATCH_SIZE = 500
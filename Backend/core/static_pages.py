@@ -0,0 +1,115 @@
+"""
+Caché en memoria para las páginas HTML servidas por vistas (demo de vista02 y frontend de vista01).
+
+Cada archivo se lee una vez y se vuelve a cargar solo si cambia su mtime. Se precalculan
+las variantes gzip y brotli (si el paquete `brotli` está instalado) y se responde con
+ETag/Last-Modified, devolviendo 304 cuando el navegador ya tiene la versión vigente
+en la codificación que se le serviría.
+"""
+import gzip
+import hashlib
+import os
+import threading
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se sirve gzip/identidad
+    brotli = None
+
+_LOCK = threading.Lock()
+_PAGES = {}  # ruta -> _CachedPage
+
+# Preferencia de codificación cuando el cliente acepta varias
+_ENCODINGS = ('br', 'gzip')
+
+
+class _CachedPage:
+    def __init__(self, path, mtime_ns, size, body):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.mtime = mtime_ns // 1_000_000_000
+        digest = hashlib.sha1(body).hexdigest()[:20]
+        self.variants = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(body, quality=11)
+        # ETag distinto por codificación (cada representación es distinta en bytes)
+        self.etags = {enc: f'"{digest}-{enc}"' if enc != 'identity' else f'"{digest}"' for enc in self.variants}
+        self.last_modified = http_date(self.mtime)
+
+
+def _load(path):
+    st = os.stat(path)
+    page = _PAGES.get(path)
+    if page is not None and page.mtime_ns == st.st_mtime_ns and page.size == st.st_size:
+        return page
+    with _LOCK:
+        page = _PAGES.get(path)
+        if page is not None and page.mtime_ns == st.st_mtime_ns and page.size == st.st_size:
+            return page
+        with open(path, 'rb') as f:
+            body = f.read()
+        page = _CachedPage(path, st.st_mtime_ns, st.st_size, body)
+        _PAGES[path] = page
+        return page
+
+
+def _pick_encoding(request, page):
+    accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    tokens = {}
+    for part in accepted.split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            tokens[name.lower()] = q
+    for enc in _ENCODINGS:
+        if enc in page.variants and tokens.get(enc, tokens.get('*', 0.0)) > 0:
+            return enc
+    return 'identity'
+
+
+def _not_modified(request, page, encoding):
+    inm = request.META.get('HTTP_IF_NONE_MATCH')
+    if inm is not None:
+        if inm.strip() == '*':
+            return True
+        # Solo vale el ETag de la representación que se serviría ahora: la caché del
+        # cliente puede tener otra codificación guardada para otro Accept-Encoding.
+        # Acepta ETags débiles (W/"...") que algunos proxies generan al recomprimir
+        tags = {t.strip().removeprefix('W/') for t in inm.split(',')}
+        return page.etags[encoding] in tags
+    ims = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    if ims is not None:
+        since = parse_http_date_safe(ims)
+        return since is not None and page.mtime <= since
+    return False
+
+
+def serve_static_page(request, path, content_type='text/html; charset=utf-8'):
+    """
+    Respuesta para el archivo `path` desde la caché. Lanza FileNotFoundError si no existe.
+    """
+    page = _load(str(path))
+    encoding = _pick_encoding(request, page)
+    if _not_modified(request, page, encoding):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(page.variants[encoding], content_type=content_type)
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+        response['Content-Length'] = str(len(page.variants[encoding]))
+    response['ETag'] = page.etags[encoding]
+    response['Last-Modified'] = page.last_modified
+    response['Vary'] = 'Accept-Encoding'
+    # El navegador guarda la página pero revalida siempre (respuesta 304 si no cambió)
+    response['Cache-Control'] = 'no-cache'
+    return response
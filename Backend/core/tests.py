@@ -0,0 +1,80 @@
+import gzip
+import os
+import tempfile
+
+from django.test import Client, RequestFactory, SimpleTestCase
+
+from .static_pages import brotli, serve_static_page
+
+BODY = ("<!doctype html><title>demo</title>" + "<p>señas</p>" * 200).encode("utf-8")
+
+
+class StaticPageTests(SimpleTestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".html")
+        with os.fdopen(fd, "wb") as f:
+            f.write(BODY)
+        self.addCleanup(os.unlink, self.path)
+        self.rf = RequestFactory()
+
+    def _get(self, **headers):
+        return serve_static_page(self.rf.get("/", **headers), self.path)
+
+    def test_precompressed_variants_by_accept_encoding(self):
+        plain = self._get()
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertEqual(plain.content, BODY)
+
+        gz = self._get(HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(gz["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(gz.content), BODY)
+        self.assertEqual(int(gz["Content-Length"]), len(gz.content))
+        self.assertLess(len(gz.content), len(BODY))
+        self.assertEqual(gz["Vary"], "Accept-Encoding")
+        self.assertNotEqual(gz["ETag"], plain["ETag"])
+
+        # q=0 excluye la codificación
+        self.assertNotIn("Content-Encoding", self._get(HTTP_ACCEPT_ENCODING="gzip;q=0"))
+        if brotli is not None:
+            br = self._get(HTTP_ACCEPT_ENCODING="gzip, br")
+            self.assertEqual(br["Content-Encoding"], "br")
+            self.assertEqual(brotli.decompress(br.content), BODY)
+
+    def test_etag_round_trip_and_reload_on_change(self):
+        first = self._get(HTTP_ACCEPT_ENCODING="gzip")
+        again = self._get(HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b"")
+        weak = self._get(HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH="W/" + first["ETag"])
+        self.assertEqual(weak.status_code, 304)
+        self.assertEqual(self._get(HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]).status_code, 304)
+
+        with open(self.path, "ab") as f:
+            f.write(b"<p>nuevo</p>")
+        changed = self._get(HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertTrue(gzip.decompress(changed.content).endswith(b"<p>nuevo</p>"))
+
+    def test_etag_only_matches_the_negotiated_encoding(self):
+        gz = self._get(HTTP_ACCEPT_ENCODING="gzip")
+        plain = self._get()
+        # Con la variante gzip en caché, un cliente sin gzip recibe el cuerpo sin comprimir
+        other = self._get(HTTP_IF_NONE_MATCH=gz["ETag"])
+        self.assertEqual(other.status_code, 200)
+        self.assertEqual((other.content, other["ETag"]), (BODY, plain["ETag"]))
+        self.assertEqual(self._get(HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=plain["ETag"]).status_code, 200)
+        # Si la lista incluye el ETag vigente, 304 con el ETag y el Vary de esa representación
+        both = self._get(HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=f'{plain["ETag"]}, {gz["ETag"]}')
+        self.assertEqual(both.status_code, 304)
+        self.assertEqual((both["ETag"], both["Vary"]), (gz["ETag"], "Accept-Encoding"))
+
+    def test_missing_file_raises(self):
+        with self.assertRaises(FileNotFoundError):
+            serve_static_page(self.rf.get("/"), self.path + ".nope")
+
+    def test_pages_are_served_compressed_through_the_views(self):
+        client = Client(HTTP_HOST="localhost")
+        for url in ("/vista01/", "/vista02/demo/"):
+            r = client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+            self.assertEqual((r.status_code, r["Content-Encoding"]), (200, "gzip"), url)
+            self.assertEqual(client.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=r["ETag"]).status_code, 304)
@@ -24,10 +24,20 @@ urlpatterns = [
     path('vista02/', include('vista02.urls.urls')),
     # ===== Fallbacks de API (por si el proxy quita el prefijo '/vista02/api/') =====
     path('predict', v2views.predict, name='v2_predict_fallback'),
+    path('predict/stats', v2views.predict_stats, name='v2_predict_stats_fallback'),
     path('samples/batch', v2views.samples_batch, name='v2_samples_batch_fallback'),
     path('train', v2views.train_model, name='v2_train_fallback'),
+    path('train/schedule', v2views.autotrain_status, name='v2_autotrain_status_fallback'),
+    path('train/<str:job_id>', v2views.train_status, name='v2_train_status_fallback'),
     path('progress', v2views.progress, name='v2_progress_fallback'),
     path('model', v2views.get_model, name='v2_model_fallback'),
+    path('model/cache', v2views.model_cache_stats, name='v2_model_cache_fallback'),
+    path('model/rethreshold', v2views.rethreshold_model, name='v2_rethreshold_fallback'),
+    path('model/bundle', v2views.get_model_bundle, name='v2_model_bundle_fallback'),
+    path('model/bundle/<str:digest>', v2views.model_bundle_by_digest, name='v2_model_bundle_digest_fallback'),
+    path('profiler', v2views.profiler_summary, name='v2_profiler_fallback'),
+    path('profiler/reset', v2views.profiler_reset, name='v2_profiler_reset_fallback'),
+    path('profiler/<str:view_name>', v2views.profiler_view, name='v2_profiler_view_fallback'),
     path('reset', v2views.reset_data, name='v2_reset_fallback'),
     path('last-detected', v2views.last_detected, name='v2_last_detected_fallback'),
 ]
@@ -1,6 +1,43 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
+# Comandos de manage.py que sirven peticiones (el resto, como migrate o test, no barre)
+_SERVER_COMMANDS = {'runserver'}
+# Nombres con los que se invoca la línea de comandos de Django
+_MANAGEMENT_PROGRAMS = {'manage.py', 'django-admin', 'django-admin.py'}
+
+
+def _is_management_command(argv):
+    if not argv:
+        return False
+    prog = os.path.basename(argv[0])
+    if prog in _MANAGEMENT_PROGRAMS:
+        return True
+    # python -m django <comando>
+    return prog == '__main__.py' and os.path.basename(os.path.dirname(argv[0])) == 'django'
+
+
+def _is_serving_process(argv, environ):
+    """True si este proceso atiende peticiones: WSGI/ASGI, o el hijo de runserver que sirve."""
+    if not _is_management_command(argv):
+        return True
+    if len(argv) < 2 or argv[1] not in _SERVER_COMMANDS:
+        return False
+    # Con autoreload, runserver arranca un padre que solo vigila archivos y relanza un
+    # hijo con RUN_MAIN=true; el barrido va únicamente en el hijo
+    return '--noreload' in argv or environ.get('RUN_MAIN') == 'true'
+
 
 class Vista01Config(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'vista01'
\ No newline at end of file
+    name = 'vista01'
+
+    def ready(self):
+        # La expiración no depende de que alguien cargue /vista01/: el barrido arranca con
+        # el proceso web (WSGI/ASGI o runserver). Solo se arma el hilo; no toca la BD aquí.
+        if not _is_serving_process(sys.argv, os.environ):
+            return
+        from . import retention
+        retention.ensure_sweeper()
@@ -0,0 +1,24 @@
+"""Elimina los datos de Vista01 más antiguos que el periodo de retención (para cron)."""
+
+from django.core.management.base import BaseCommand
+
+from ...retention import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Elimina en lotes los datos temporales/entrenados de Vista01 expirados."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-seconds', type=int, default=None,
+                            help="Antigüedad máxima; por defecto settings.VISTA01_RETENTION_SECONDS.")
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help="Límite de lotes por tabla en esta ejecución.")
+
+    def handle(self, *args, **opts):
+        counts = purge_expired(
+            retention_seconds=opts['retention_seconds'],
+            batch_size=opts['batch_size'],
+            max_batches=opts['max_batches'],
+        )
+        self.stdout.write(f"Temporales eliminados: {counts['temporales']}, Entrenados eliminados: {counts['entrenados']}")
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.6 on 2026-10-19 04:36
+
+import base64
+import binascii
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mover_imagenes(apps, schema_editor):
+    """Copia imagen_base64 a ImagenTemporal, decodificada y comprimida."""
+    DatosTemporales = apps.get_model('vista01', 'DatosTemporales')
+    ImagenTemporal = apps.get_model('vista01', 'ImagenTemporal')
+    lote = []
+    for pk, b64 in DatosTemporales.objects.values_list('pk', 'imagen_base64').iterator(chunk_size=500):
+        prefijo, datos = '', b64 or ''
+        if datos.startswith('data:') and ',' in datos:
+            cabecera, datos = datos.split(',', 1)
+            prefijo = cabecera + ','
+        try:
+            contenido = base64.b64decode(datos)
+        except (binascii.Error, ValueError):
+            continue
+        lote.append(ImagenTemporal(dato_id=pk, prefijo=prefijo[:64], contenido=zlib.compress(contenido, 6)))
+        if len(lote) >= 500:
+            ImagenTemporal.objects.bulk_create(lote)
+            lote = []
+    if lote:
+        ImagenTemporal.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vista01', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImagenTemporal',
+            fields=[
+                ('dato', models.OneToOneField(help_text='Dato temporal al que pertenece la imagen', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='imagen', serialize=False, to='vista01.datostemporales')),
+                ('prefijo', models.CharField(blank=True, default='', help_text='Cabecera data: original, si existía', max_length=64)),
+                ('contenido', models.BinaryField(help_text='Imagen decodificada y comprimida con zlib')),
+            ],
+            options={
+                'verbose_name': 'Imagen Temporal',
+                'verbose_name_plural': 'Imágenes Temporales',
+                'db_table': 'bd_temporal_imagen',
+            },
+        ),
+        migrations.RunPython(mover_imagenes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='datostemporales',
+            name='imagen_base64',
+        ),
+        migrations.AddIndex(
+            model_name='datosentrenados',
+            index=models.Index(fields=['timestamp_entrenamiento'], name='bd_entrenada_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='datostemporales',
+            index=models.Index(fields=['timestamp'], name='bd_temporal_ts_idx'),
+        ),
+    ]
@@ -1,12 +1,16 @@
+import base64
+import zlib
+
 from django.db import models
 from django.utils import timezone
 
 
 class DatosTemporales(models.Model):
     """
-    Modelo para bd.temporal - Almacena datos de reconocimiento temporal
+    Modelo para bd.temporal - Almacena datos de reconocimiento temporal.
+    La imagen se guarda comprimida en ImagenTemporal, fuera de esta fila.
+    Las filas expiran por antigüedad (ver vista01/retention.py).
     """
-    imagen_base64 = models.TextField(help_text="Imagen en formato base64")
     letra_detectada = models.CharField(max_length=1, help_text="Letra vocal detectada (A, E, I, O, U)")
     confianza = models.FloatField(help_text="Nivel de confianza de la detección (0.0 - 1.0)")
     coordenadas_mano = models.JSONField(help_text="Coordenadas de los puntos de la mano detectada")
@@ -18,10 +22,60 @@ class DatosTemporales(models.Model):
         verbose_name = 'Dato Temporal'
         verbose_name_plural = 'Datos Temporales'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp'], name='bd_temporal_ts_idx'),
+        ]
     
     def __str__(self):
         return f"Detección {self.letra_detectada} - {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
 
+    @property
+    def imagen_base64(self):
+        """Reconstruye la imagen en base64 (con su prefijo data: si lo tenía)."""
+        try:
+            img = self.imagen
+        except ImagenTemporal.DoesNotExist:
+            return ""
+        return img.prefijo + base64.b64encode(zlib.decompress(img.contenido)).decode('ascii')
+
+    def guardar_imagen(self, imagen_base64):
+        """Guarda la imagen base64 decodificada y comprimida en ImagenTemporal."""
+        prefijo, contenido = _split_data_url(imagen_base64)
+        return ImagenTemporal.objects.update_or_create(
+            dato=self,
+            defaults={'prefijo': prefijo, 'contenido': zlib.compress(contenido, 6)},
+        )[0]
+
+
+def _split_data_url(imagen_base64):
+    """Separa 'data:image/...;base64,' del contenido y decodifica este último."""
+    prefijo = ''
+    datos = imagen_base64 or ''
+    if datos.startswith('data:') and ',' in datos:
+        cabecera, datos = datos.split(',', 1)
+        prefijo = cabecera + ','
+    return prefijo, base64.b64decode(datos)
+
+
+class ImagenTemporal(models.Model):
+    """
+    Imagen de un DatosTemporales, fuera de la fila principal: bytes decodificados y comprimidos con zlib
+    """
+    dato = models.OneToOneField(
+        DatosTemporales,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='imagen',
+        help_text="Dato temporal al que pertenece la imagen"
+    )
+    prefijo = models.CharField(max_length=64, blank=True, default='', help_text="Cabecera data: original, si existía")
+    contenido = models.BinaryField(help_text="Imagen decodificada y comprimida con zlib")
+
+    class Meta:
+        db_table = 'bd_temporal_imagen'
+        verbose_name = 'Imagen Temporal'
+        verbose_name_plural = 'Imágenes Temporales'
+
 
 class DatosEntrenados(models.Model):
     """
@@ -51,6 +105,9 @@ class DatosEntrenados(models.Model):
         verbose_name = 'Dato Entrenado'
         verbose_name_plural = 'Datos Entrenados'
         ordering = ['-timestamp_entrenamiento']
+        indexes = [
+            models.Index(fields=['timestamp_entrenamiento'], name='bd_entrenada_ts_idx'),
+        ]
     
     def __str__(self):
         return f"Entrenamiento {self.letra_vocal} - {self.timestamp_entrenamiento.strftime('%Y-%m-%d %H:%M:%S')}"
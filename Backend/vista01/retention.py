@@ -0,0 +1,92 @@
+"""
+Retención por tiempo de los datos de Vista01.
+
+Sustituye al borrado total en cada carga de página: las filas más antiguas que
+VISTA01_RETENTION_SECONDS se eliminan en lotes acotados usando los índices por fecha.
+El barrido corre en un hilo periódico del proceso web, que Vista01Config.ready arranca
+al iniciar el servidor (VISTA01_RETENTION_SWEEP_SECONDS, 0 lo desactiva), o con
+`python manage.py purge_vista01` desde cron; con el hilo desactivado el comando es obligatorio.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .models import DatosEntrenados, DatosTemporales
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_SECONDS = 3600
+DEFAULT_SWEEP_SECONDS = 300
+DEFAULT_BATCH_SIZE = 500
+
+_sweeper_lock = threading.Lock()
+_sweeper_thread = None
+_stop_event = threading.Event()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _purge_model(model, field, cutoff, batch_size, max_batches):
+    """Borra filas con `field < cutoff` en lotes de `batch_size` ids (recorriendo el índice)."""
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = list(
+            model.objects.filter(**{f'{field}__lt': cutoff})
+            .order_by(field)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        model.objects.filter(id__in=ids).delete()
+        total += len(ids)
+        batches += 1
+        if len(ids) < batch_size:
+            break
+    return total
+
+
+def purge_expired(now=None, retention_seconds=None, batch_size=None, max_batches=None):
+    """
+    Elimina los datos expirados y devuelve cuántas filas principales se borraron por tabla.
+    Las imágenes comprimidas se van en cascada con su DatosTemporales.
+    """
+    now = now or timezone.now()
+    retention = _setting('VISTA01_RETENTION_SECONDS', DEFAULT_RETENTION_SECONDS) if retention_seconds is None else retention_seconds
+    batch_size = batch_size or _setting('VISTA01_RETENTION_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    cutoff = now - timedelta(seconds=retention)
+    return {
+        'entrenados': _purge_model(DatosEntrenados, 'timestamp_entrenamiento', cutoff, batch_size, max_batches),
+        'temporales': _purge_model(DatosTemporales, 'timestamp', cutoff, batch_size, max_batches),
+    }
+
+
+def _sweep_loop(interval):
+    while not _stop_event.wait(interval):
+        try:
+            close_old_connections()
+            counts = purge_expired()
+            if any(counts.values()):
+                logger.info(f"Vista01: datos expirados eliminados. Temporales={counts['temporales']}, Entrenados={counts['entrenados']}")
+        except Exception as e:
+            logger.warning(f"Vista01: fallo en el barrido de expiración: {e}")
+        finally:
+            connection.close()
+
+
+def ensure_sweeper():
+    """Arranca (una sola vez por proceso) el hilo de barrido periódico. No toca la BD."""
+    global _sweeper_thread
+    interval = _setting('VISTA01_RETENTION_SWEEP_SECONDS', DEFAULT_SWEEP_SECONDS)
+    if not interval or _sweeper_thread is not None:
+        return
+    with _sweeper_lock:
+        if _sweeper_thread is None:
+            _sweeper_thread = threading.Thread(target=_sweep_loop, args=(interval,), name='vista01-retention', daemon=True)
+            _sweeper_thread.start()
@@ -1,3 +1,97 @@
-from django.test import TestCase
+import base64
+import os
+import zlib
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from . import retention
+from .apps import Vista01Config
+from .models import DatosEntrenados, DatosTemporales, ImagenTemporal
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(64))
+
+
+def _temporal(ts, imagen=True):
+    d = DatosTemporales.objects.create(letra_detectada="A", confianza=0.9, coordenadas_mano=[], timestamp=ts)
+    if imagen:
+        d.guardar_imagen("data:image/png;base64," + base64.b64encode(PNG).decode("ascii"))
+    return d
+
+
+class RetentionTests(TestCase):
+    def test_purge_in_bounded_batches(self):
+        now = timezone.now()
+        old = now - timedelta(hours=2)
+        for _ in range(7):
+            _temporal(old)
+        keep = _temporal(now)
+        for ts in (old, old, now):
+            DatosEntrenados.objects.create(letra_vocal="E", coordenadas_mano=[], caracteristicas=[], timestamp_entrenamiento=ts)
+
+        counts = retention.purge_expired(now=now, retention_seconds=3600, batch_size=3, max_batches=2)
+        self.assertEqual(counts, {"entrenados": 2, "temporales": 6})
+        counts = retention.purge_expired(now=now, retention_seconds=3600, batch_size=3)
+        self.assertEqual(counts, {"entrenados": 0, "temporales": 1})
+
+        self.assertEqual(list(DatosTemporales.objects.values_list("id", flat=True)), [keep.id])
+        self.assertEqual(DatosEntrenados.objects.count(), 1)
+        # Las imágenes se van en cascada con su dato temporal
+        self.assertEqual(list(ImagenTemporal.objects.values_list("dato_id", flat=True)), [keep.id])
+
+    def test_sweeper_starts_with_the_server_not_with_other_commands(self):
+        config = Vista01Config("vista01", __import__("vista01"))
+        cases = [
+            (["manage.py", "migrate"], {}, False),
+            (["manage.py", "test"], {}, False),
+            (["/srv/Backend/manage.py", "purge_vista01"], {}, False),
+            (["/venv/bin/django-admin", "migrate"], {}, False),
+            (["/usr/lib/python3/site-packages/django/__main__.py", "shell"], {}, False),
+            # Padre de runserver con autoreload: solo vigila archivos
+            (["manage.py", "runserver"], {}, False),
+            (["manage.py", "runserver"], {"RUN_MAIN": "true"}, True),
+            (["manage.py", "runserver", "--noreload"], {}, True),
+            (["/venv/bin/gunicorn", "core.wsgi"], {}, True),
+            (["/venv/bin/uvicorn", "core.asgi:application"], {}, True),
+        ]
+        for argv, env, starts in cases:
+            with self.subTest(argv=argv, env=env):
+                with mock.patch.object(retention, "ensure_sweeper") as ensure, \
+                        mock.patch("sys.argv", argv), mock.patch.dict("os.environ", env, clear=False):
+                    if "RUN_MAIN" not in env:
+                        os.environ.pop("RUN_MAIN", None)
+                    config.ready()
+                self.assertEqual(ensure.called, starts)
+
+
+class ImageMigrationTests(TransactionTestCase):
+    before = [("vista01", "0001_initial")]
+    after = [("vista01", "0002_imagen_temporal_y_retencion")]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_images_are_moved_decoded_and_compressed(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        old = executor.loader.project_state(self.before).apps.get_model("vista01", "DatosTemporales")
+        b64 = base64.b64encode(PNG).decode("ascii")
+        fields = {"letra_detectada": "O", "confianza": 0.5, "coordenadas_mano": []}
+        with_prefix = old.objects.create(imagen_base64="data:image/png;base64," + b64, **fields).pk
+        raw = old.objects.create(imagen_base64=b64, **fields).pk
+        broken = old.objects.create(imagen_base64="abc", **fields).pk
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        new = executor.loader.project_state(self.after).apps.get_model("vista01", "ImagenTemporal")
+        imgs = {i.dato_id: i for i in new.objects.all()}
+        self.assertEqual(set(imgs), {with_prefix, raw})  # relleno base64 inválido: no se migra
+        self.assertEqual(imgs[with_prefix].prefijo, "data:image/png;base64,")
+        self.assertEqual(imgs[raw].prefijo, "")
+        self.assertEqual(zlib.decompress(imgs[raw].contenido), PNG)
+        self.assertNotIn(broken, imgs)
@@ -3,7 +3,7 @@ import os
 from django.http import JsonResponse, HttpResponse
 from django.conf import settings
 import logging
-from .models import DatosTemporales, DatosEntrenados
+from core.static_pages import serve_static_page
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -21,21 +21,11 @@ def frontend_view(request):
     Vista para servir el archivo HTML del frontend
     """
     try:
-        # Limpiar datos de Vista01 en cada carga para que no persistan entre recargas
-        try:
-            deleted_temp, _ = DatosTemporales.objects.all().delete()
-            deleted_train, _ = DatosEntrenados.objects.all().delete()
-            logger.info(f"Vista01: datos limpiados. Temporales={deleted_temp}, Entrenados={deleted_train}")
-        except Exception as e:
-            logger.warning(f"Vista01: no se pudieron limpiar datos: {e}")
-
-        # Ruta al archivo HTML del frontend
+        # Los datos de Vista01 expiran por tiempo en un barrido en segundo plano que arranca
+        # con el proceso (Vista01Config.ready); la carga de la página no escribe en la BD
+        # Ruta al archivo HTML del frontend (servido desde caché precomprimida, con ETag)
         html_path = os.path.join(settings.BASE_DIR, 'ejemplo_frontend.html')
-        
-        with open(html_path, 'r', encoding='utf-8') as file:
-            html_content = file.read()
-        
-        return HttpResponse(html_content, content_type='text/html')
+        return serve_static_page(request, html_path, content_type='text/html')
         
     except FileNotFoundError:
         return HttpResponse('Archivo frontend no encontrado', status=404)
@@ -4,7 +4,12 @@ from django.utils import timezone
 # Letras válidas A..Z
 LETTER_CHOICES = [(chr(c), chr(c)) for c in range(ord('A'), ord('Z') + 1)]
 
+# Propietario (perfil) de muestras y modelos; '' es el conjunto compartido
+DEFAULT_OWNER = ''
+OWNER_MAX_LENGTH = 64
+
 class HandSample(models.Model):
+    owner = models.CharField(max_length=OWNER_MAX_LENGTH, default=DEFAULT_OWNER, blank=True)
     letter = models.CharField(max_length=1, choices=LETTER_CHOICES)
     # Landmarks crudos de MediaPipe: lista de 21 elementos con x,y,z normalizados
     landmarks = models.JSONField()
@@ -15,10 +20,12 @@ class HandSample(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=["letter", "created_at"]),
+            models.Index(fields=["owner", "id"], name="hs_owner_id_idx"),
         ]
         ordering = ["-created_at"]
 
 class TrainingModel(models.Model):
+    owner = models.CharField(max_length=OWNER_MAX_LENGTH, default=DEFAULT_OWNER, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
     feature_version = models.CharField(max_length=32, default="v1")
     # Centroides por letra: {"A": [...], "B": [...], ...}
@@ -31,6 +38,41 @@ class TrainingModel(models.Model):
     # Metadata opcional sobre cómo fueron calculados los umbrales
     threshold_method = models.CharField(max_length=32, default="percentile")
     threshold_param = models.FloatField(default=0.88)  # p.ej., percentil usado
+    # Datos con los que se entrenó: mayor HandSample.id leído y muestras por letra
+    trained_max_sample_id = models.BigIntegerField(null=True, blank=True)
+    letter_counts = models.JSONField(default=dict)
+    # Umbral mínimo aplicado y distribución de distancias al centroide por letra
+    # (sketch KLL compacto) para recalcular umbrales sin releer las muestras
+    min_threshold = models.FloatField(null=True, blank=True)
+    distance_sketches = models.JSONField(default=dict)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["owner", "created_at"], name="tm_owner_created_idx"),
+        ]
+
+
+class PredictionLog(models.Model):
+    """Resultado de una predicción muestreada, para análisis offline de errores de reconocimiento."""
+    owner = models.CharField(max_length=OWNER_MAX_LENGTH, default=DEFAULT_OWNER, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    model_id = models.BigIntegerField(null=True, blank=True)
+    letter = models.CharField(max_length=1, null=True, blank=True)
+    distance = models.FloatField(null=True, blank=True)
+    threshold = models.FloatField(null=True, blank=True)
+    shape_ok = models.BooleanField(default=False)
+    candidate = models.CharField(max_length=1, null=True, blank=True)
+    candidate_distance = models.FloatField(null=True, blank=True)
+    dynamic = models.BooleanField(default=False)
+    accepted_dynamic = models.BooleanField(default=False)
+    # Vector de características de la predicción (opcional, para reunir ejemplos difíciles)
+    feature_vector = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["owner", "created_at"], name="pl_owner_created_idx"),
+            models.Index(fields=["candidate", "created_at"], name="pl_candidate_created_idx"),
+            # Purga por antigüedad de todos los perfiles
+            models.Index(fields=["created_at"], name="pl_created_idx"),
+        ]
@@ -0,0 +1,56 @@
+"""Archiva las muestras viejas de HandSample en segmentos comprimidos y las borra de la BD.
+
+Ejemplos:
+    python manage.py archive_samples --older-than-days 180
+    python manage.py archive_samples --per-letter-cap 5000 --dry-run
+    python manage.py archive_samples --all-owners
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import HandSample
+from ...services import archive
+
+
+class Command(BaseCommand):
+    help = "Mueve muestras antiguas (o por encima del tope por letra) a segmentos comprimidos (features y landmarks)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--owner", default="", help="Perfil cuyas muestras se archivan ('' = compartido).")
+        parser.add_argument("--all-owners", action="store_true", help="Aplica la política a todos los perfiles.")
+        parser.add_argument("--older-than-days", type=float, default=None,
+                            help="Archiva muestras con más de N días (por defecto VISTA02_ARCHIVE_AFTER_DAYS).")
+        parser.add_argument("--per-letter-cap", type=int, default=None,
+                            help="Deja como máximo N muestras por letra (por defecto VISTA02_ARCHIVE_PER_LETTER_CAP).")
+        parser.add_argument("--dry-run", action="store_true", help="Solo cuenta lo que se archivaría.")
+
+    def handle(self, *args, **opts):
+        days = opts["older_than_days"]
+        if days is None:
+            days = getattr(settings, "VISTA02_ARCHIVE_AFTER_DAYS", None)
+        cap = opts["per_letter_cap"]
+        if cap is None:
+            cap = getattr(settings, "VISTA02_ARCHIVE_PER_LETTER_CAP", None)
+        if days is None and cap is None:
+            raise CommandError("Sin política: indica --older-than-days o --per-letter-cap (o configúralos en settings).")
+        if cap is not None and cap < 0:
+            raise CommandError("--per-letter-cap debe ser >= 0")
+
+        if opts["all_owners"]:
+            owners = list(HandSample.objects.values_list("owner", flat=True).distinct().order_by("owner"))
+        else:
+            owners = [opts["owner"]]
+        verb = "Se archivarían" if opts["dry_run"] else "Archivadas"
+        for owner in owners:
+            t0 = time.perf_counter()
+            res = archive.archive_samples(owner, older_than_days=days, per_letter_cap=cap, dry_run=opts["dry_run"])
+            elapsed = time.perf_counter() - t0
+            self.stdout.write(
+                f"Perfil '{owner}': {verb} {res['archived']} muestras, omitidas (siguen en la tabla)={res['skipped']}, "
+                f"segmentos={res['segments']} ({elapsed:.2f}s)"
+            )
+            for L, n in sorted(res["by_letter"].items()):
+                self.stdout.write(f"  {L}: {n}")
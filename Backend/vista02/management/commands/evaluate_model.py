@@ -0,0 +1,130 @@
+"""Validación cruzada del clasificador y barrido de percentil/tolerancias de forma.
+
+Ejemplos:
+    python manage.py evaluate_model
+    python manage.py evaluate_model --folds 10 --percentiles 0.8,0.85,0.9,0.95 --tol-scales 0.75,1,1.5
+    python manage.py evaluate_model --max-rejection 0.2 --json resultados.json
+    python manage.py evaluate_model --source db
+    python manage.py evaluate_model --owner usuario42
+"""
+
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...services import evaluation, snapshot
+from ...services.training import sample_stream
+
+
+def _floats(value: str):
+    try:
+        return [float(x) for x in value.split(",") if x.strip()]
+    except ValueError:
+        raise CommandError(f"Lista de números inválida: {value!r}")
+
+
+class Command(BaseCommand):
+    help = "Evalúa el clasificador de centroides con k-fold estratificado y barre percentil y tolerancias."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            choices=["snapshot", "db"],
+            default="snapshot",
+            help="Leer las muestras del snapshot columnar (sincronizado antes) o directamente de la BD.",
+        )
+        parser.add_argument("--owner", default="", help="Perfil cuyas muestras se evalúan ('' = compartido).")
+        parser.add_argument("--folds", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--percentiles",
+            default=",".join(str(p) for p in evaluation.DEFAULT_PERCENTILES),
+            help="Percentiles a probar para los umbrales, separados por comas.",
+        )
+        parser.add_argument(
+            "--tol-scales",
+            default=",".join(str(s) for s in evaluation.DEFAULT_TOL_SCALES),
+            help="Factores aplicados a las tolerancias de forma actuales, separados por comas.",
+        )
+        parser.add_argument("--max-rejection", type=float, default=1.0, help="Rechazo máximo al elegir la mejor configuración.")
+        parser.add_argument("--top", type=int, default=10, help="Configuraciones a mostrar.")
+        parser.add_argument("--json", dest="json_path", default=None, help="Ruta donde guardar el resultado completo.")
+
+    def handle(self, *args, **opts):
+        if opts["folds"] < 2:
+            raise CommandError("--folds debe ser >= 2")
+        percentiles = _floats(opts["percentiles"])
+        scales = _floats(opts["tol_scales"])
+        if not percentiles or not scales:
+            raise CommandError("Se necesita al menos un percentil y una escala de tolerancia")
+
+        t0 = time.perf_counter()
+        if opts["source"] == "snapshot":
+            root = snapshot.snapshot_dir(opts["owner"])
+            man = snapshot.refresh(root, owner=opts["owner"])
+            X, y, letters, skipped = evaluation.load_feature_matrix(snapshot.snapshot_stream(man=man, root=root))
+            skipped += man["skipped"]
+        else:
+            X, y, letters, skipped = evaluation.load_feature_matrix(sample_stream(owner=opts["owner"]))
+        if not letters:
+            raise CommandError("No hay muestras para evaluar")
+        t_load = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        result = evaluation.sweep(
+            X, y, letters,
+            k=opts["folds"],
+            percentiles=percentiles,
+            tolerances=evaluation.tolerance_grid(scales),
+            seed=opts["seed"],
+        )
+        t_sweep = time.perf_counter() - t0
+
+        n_configs = len(percentiles) * len(scales)
+        self.stdout.write(
+            f"{result['samples']} muestras ({skipped} descartadas por dimensión), {len(letters)} letras, "
+            f"{opts['folds']} folds, {n_configs} configuraciones. Carga {t_load:.2f}s, barrido {t_sweep:.2f}s"
+        )
+        if not result["shape_check"]:
+            self.stdout.write(self.style.WARNING("Vectores demasiado cortos para la verificación de forma: todo se rechaza"))
+
+        order = sorted(
+            ((p, t) for p in range(len(percentiles)) for t in range(len(scales))),
+            key=lambda pt: (-result["accuracy"][pt], result["rejection"][pt]),
+        )
+        self.stdout.write("percentil  escala_tol  exactitud  rechazo")
+        for p, t in order[: opts["top"]]:
+            self.stdout.write(
+                f"{percentiles[p]:9.3f}  {scales[t]:10.3f}  {result['accuracy'][p, t]:9.4f}  {result['rejection'][p, t]:7.4f}"
+            )
+
+        p_idx, t_idx = evaluation.best_config(result, opts["max_rejection"])
+        best = evaluation.config_summary(result, p_idx, t_idx)
+        best["tol_scale"] = scales[t_idx]
+        self.stdout.write(self.style.SUCCESS(
+            f"Mejor: percentil={best['percentile']} escala_tol={scales[t_idx]} "
+            f"exactitud={best['accuracy']:.4f} rechazo={best['rejection']:.4f}"
+        ))
+        self.stdout.write("letra  n      exactitud  rechazo  confusiones")
+        for L, m in best["per_letter"].items():
+            errs = {k: v for k, v in best["confusion"].get(L, {}).items() if k != L}
+            self.stdout.write(f"{L:5}  {m['support']:5d}  {m['accuracy']:9.4f}  {m['rejection']:7.4f}  {errs}")
+
+        if opts["json_path"]:
+            out = {
+                "samples": result["samples"],
+                "skipped": skipped,
+                "folds": result["folds"],
+                "letters": letters,
+                "percentiles": percentiles,
+                "tol_scales": scales,
+                "accuracy": result["accuracy"].tolist(),
+                "rejection": result["rejection"].tolist(),
+                "letter_accuracy": {L: result["letter_accuracy"][i].tolist() for i, L in enumerate(letters)},
+                "letter_rejection": {L: result["letter_rejection"][i].tolist() for i, L in enumerate(letters)},
+                "best": best,
+            }
+            with open(opts["json_path"], "w", encoding="utf-8") as f:
+                json.dump(out, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Resultado completo en {opts['json_path']}")
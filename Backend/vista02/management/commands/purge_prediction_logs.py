@@ -0,0 +1,34 @@
+"""Purga la tabla PredictionLog por antigüedad y tope de filas (para cron).
+
+Ejemplos:
+    python manage.py purge_prediction_logs
+    python manage.py purge_prediction_logs --retention-seconds 604800 --max-rows 200000
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...services.prediction_log import purge_prediction_logs
+
+
+class Command(BaseCommand):
+    help = "Elimina en lotes los registros de predicciones expirados o por encima del tope de filas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--retention-seconds", type=float, default=None,
+                            help="Antigüedad máxima; por defecto VISTA02_PREDICTION_LOG_RETENTION_SECONDS.")
+        parser.add_argument("--max-rows", type=int, default=None,
+                            help="Filas que se conservan; por defecto VISTA02_PREDICTION_LOG_MAX_ROWS.")
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--max-batches", type=int, default=None,
+                            help="Límite de lotes por criterio en esta ejecución.")
+
+    def handle(self, *args, **opts):
+        if opts["max_rows"] is not None and opts["max_rows"] < 0:
+            raise CommandError("--max-rows debe ser >= 0")
+        counts = purge_prediction_logs(
+            retention_seconds=opts["retention_seconds"],
+            max_rows=opts["max_rows"],
+            batch_size=opts["batch_size"],
+            max_batches=opts["max_batches"],
+        )
+        self.stdout.write(f"Expirados eliminados: {counts['expired']}, por encima del tope: {counts['over_cap']}")
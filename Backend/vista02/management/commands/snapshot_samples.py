@@ -0,0 +1,56 @@
+"""Sincroniza (o reconstruye) el snapshot columnar de HandSample y mide su lectura.
+
+Ejemplos:
+    python manage.py snapshot_samples
+    python manage.py snapshot_samples --rebuild
+    python manage.py snapshot_samples --bench
+    python manage.py snapshot_samples --owner usuario42
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...services import snapshot
+from ...services.training import sample_stream
+
+
+def _scan(stream):
+    rows = nbytes = 0
+    t0 = time.perf_counter()
+    for groups in stream:
+        for _L, X in groups:
+            rows += len(X)
+            nbytes += X.nbytes
+    return rows, nbytes, time.perf_counter() - t0
+
+
+class Command(BaseCommand):
+    help = "Sincroniza el snapshot columnar de muestras (float32 por letra, memmap) con la BD."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--owner", default="", help="Perfil cuyo snapshot se sincroniza ('' = compartido).")
+        parser.add_argument("--rebuild", action="store_true", help="Borra el snapshot y lo genera desde cero.")
+        parser.add_argument("--bench", action="store_true", help="Compara el tiempo de lectura completa snapshot vs BD.")
+
+    def handle(self, *args, **opts):
+        owner = opts["owner"]
+        root = snapshot.snapshot_dir(owner)
+        if opts["rebuild"]:
+            snapshot.clear(root)
+        t0 = time.perf_counter()
+        man = snapshot.refresh(root, owner=owner)
+        elapsed = time.perf_counter() - t0
+        rows = sum(info["rows"] for info in man["letters"].values())
+        self.stdout.write(
+            f"Snapshot en {root}: {rows} filas, dim={man['dim']}, "
+            f"high_water_id={man['high_water_id']}, descartadas={man['skipped']} ({elapsed:.2f}s)"
+        )
+        for L, info in man["letters"].items():
+            self.stdout.write(f"  {L}: {info['rows']}")
+
+        if opts["bench"]:
+            for name, stream in (("snapshot", snapshot.snapshot_stream(man=man, root=root)), ("bd", sample_stream(owner=owner))):
+                n, nbytes, secs = _scan(stream)
+                rate = (nbytes / 1e6) / secs if secs > 0 else float("inf")
+                self.stdout.write(f"Lectura {name}: {n} filas en {secs:.3f}s ({rate:.1f} MB/s de features)")
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-19 04:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vista02', '0002_trainingmodel_feature_stds_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='handsample',
+            name='owner',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='trainingmodel',
+            name='owner',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='handsample',
+            index=models.Index(fields=['owner', 'id'], name='hs_owner_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trainingmodel',
+            index=models.Index(fields=['owner', 'created_at'], name='tm_owner_created_idx'),
+        ),
+    ]
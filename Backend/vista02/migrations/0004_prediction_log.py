@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-19 04:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vista02', '0003_owner_scope'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PredictionLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(blank=True, default='', max_length=64)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('model_id', models.BigIntegerField(blank=True, null=True)),
+                ('letter', models.CharField(blank=True, max_length=1, null=True)),
+                ('distance', models.FloatField(blank=True, null=True)),
+                ('threshold', models.FloatField(blank=True, null=True)),
+                ('shape_ok', models.BooleanField(default=False)),
+                ('candidate', models.CharField(blank=True, max_length=1, null=True)),
+                ('candidate_distance', models.FloatField(blank=True, null=True)),
+                ('dynamic', models.BooleanField(default=False)),
+                ('accepted_dynamic', models.BooleanField(default=False)),
+                ('feature_vector', models.JSONField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', 'created_at'], name='pl_owner_created_idx'), models.Index(fields=['candidate', 'created_at'], name='pl_candidate_created_idx')],
+            },
+        ),
+    ]
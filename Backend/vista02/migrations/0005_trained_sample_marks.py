@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 04:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vista02', '0004_prediction_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingmodel',
+            name='letter_counts',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name='trainingmodel',
+            name='trained_max_sample_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
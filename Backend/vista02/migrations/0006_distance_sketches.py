@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vista02', '0005_trained_sample_marks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingmodel',
+            name='distance_sketches',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name='trainingmodel',
+            name='min_threshold',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
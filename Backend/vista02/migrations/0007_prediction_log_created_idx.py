@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vista02', '0006_distance_sketches'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='predictionlog',
+            index=models.Index(fields=['created_at'], name='pl_created_idx'),
+        ),
+    ]
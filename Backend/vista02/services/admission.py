@@ -0,0 +1,153 @@
+"""Control de admisión para `predict`: la última imagen gana y se descarta la carga sobrante.
+
+- Límite global de predicciones en curso (`max_active`). Las que no caben esperan en una
+  cola acotada (`max_waiting`) un tiempo máximo (`wait_timeout`).
+- Por cliente solo espera la petición más reciente: si llega una imagen nueva del mismo
+  cliente mientras la anterior espera, la anterior se responde al instante como "superseded".
+- Si la cola está llena o se agota la espera, la petición se rechaza (503) sin procesarla.
+
+`enter` es una corrutina: bajo ASGI las peticiones esperan turno en el event loop sin
+ocupar un hilo, así que la cola se llena y se descarta de verdad. Bajo WSGI cada vista
+async corre en su propio loop; por eso el estado se protege con un lock de hilos y cada
+espera se despierta con `call_soon_threadsafe` en el loop de su petición.
+"""
+
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from django.conf import settings
+
+ADMITTED = "admitted"
+SUPERSEDED = "superseded"
+SHED = "shed"
+
+
+class _Waiter:
+    __slots__ = ("loop", "future", "client_id", "verdict")
+
+    def __init__(self, loop, client_id: Optional[str]):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.client_id = client_id
+        self.verdict: Optional[str] = None
+
+
+def _set_result(future, verdict: str) -> None:
+    if not future.done():
+        future.set_result(verdict)
+
+
+class PredictGate:
+    def __init__(self, max_active: int, max_waiting: int, wait_timeout: float):
+        self.max_active = max(1, int(max_active))
+        self.max_waiting = max(0, int(max_waiting))
+        self.wait_timeout = float(wait_timeout)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._next_ticket = 0
+        # Esperas en orden de llegada: ticket -> _Waiter
+        self._waiters: "OrderedDict[int, _Waiter]" = OrderedDict()
+        self._waiting_by_client: Dict[str, int] = {}
+        self._counters = {"admitted": 0, "coalesced": 0, "shed_queue_full": 0, "shed_timeout": 0}
+
+    def _resolve(self, ticket: int, verdict: str) -> None:
+        """Con el lock tomado: saca la espera de la cola y le entrega su veredicto."""
+        w = self._waiters.pop(ticket)
+        if w.client_id and self._waiting_by_client.get(w.client_id) == ticket:
+            del self._waiting_by_client[w.client_id]
+        w.verdict = verdict
+        try:
+            w.loop.call_soon_threadsafe(_set_result, w.future, verdict)
+        except RuntimeError:
+            # Loop ya cerrado: la petición se abandonó; su plaza no debe quedar ocupada
+            if verdict == ADMITTED:
+                self._active -= 1
+
+    def _admit_next(self) -> None:
+        while self._waiters and self._active < self.max_active:
+            self._active += 1
+            self._counters["admitted"] += 1
+            self._resolve(next(iter(self._waiters)), ADMITTED)
+
+    async def enter(self, client_id: Optional[str] = None) -> str:
+        """Espera turno. Devuelve ADMITTED, SUPERSEDED o SHED.
+
+        Tras ADMITTED el llamador debe invocar `leave()` al terminar.
+        """
+        with self._lock:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            if client_id:
+                prev = self._waiting_by_client.get(client_id)
+                if prev is not None:
+                    # Solo la imagen más reciente de cada cliente merece esperar
+                    self._counters["coalesced"] += 1
+                    self._resolve(prev, SUPERSEDED)
+            if self._active < self.max_active and not self._waiters:
+                self._active += 1
+                self._counters["admitted"] += 1
+                return ADMITTED
+            if len(self._waiters) >= self.max_waiting:
+                self._counters["shed_queue_full"] += 1
+                return SHED
+            waiter = _Waiter(asyncio.get_running_loop(), client_id)
+            self._waiters[ticket] = waiter
+            if client_id:
+                self._waiting_by_client[client_id] = ticket
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter.future), self.wait_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if ticket in self._waiters:
+                    self._counters["shed_timeout"] += 1
+                    self._resolve(ticket, SHED)
+                    return SHED
+            # Se resolvió justo al agotarse la espera: su veredicto ya está en camino
+            return await waiter.future
+        except asyncio.CancelledError:
+            # El cliente se fue: se libera su puesto en la cola o la plaza que se le dio
+            with self._lock:
+                if ticket in self._waiters:
+                    self._resolve(ticket, SHED)
+                elif waiter.verdict == ADMITTED:
+                    self._active -= 1
+                    self._admit_next()
+            raise
+
+    def leave(self) -> None:
+        with self._lock:
+            self._active -= 1
+            self._admit_next()
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self._counters)
+            c["shed"] = c["shed_queue_full"] + c["shed_timeout"]
+            c.update(
+                active=self._active,
+                waiting=len(self._waiters),
+                max_active=self.max_active,
+                max_waiting=self.max_waiting,
+                wait_timeout=self.wait_timeout,
+            )
+            return c
+
+
+_GATE: Optional[PredictGate] = None
+_GATE_LOCK = threading.Lock()
+
+
+def get_predict_gate() -> PredictGate:
+    global _GATE
+    if _GATE is None:
+        with _GATE_LOCK:
+            if _GATE is None:
+                _GATE = PredictGate(
+                    getattr(settings, "VISTA02_PREDICT_MAX_ACTIVE", 8),
+                    getattr(settings, "VISTA02_PREDICT_MAX_WAITING", 32),
+                    getattr(settings, "VISTA02_PREDICT_WAIT_TIMEOUT", 0.5),
+                )
+    return _GATE
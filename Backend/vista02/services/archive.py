@@ -0,0 +1,341 @@
+"""Archivo por niveles de HandSample: las muestras viejas salen de la tabla caliente a
+segmentos comprimidos en disco y el entrenamiento puede seguir leyéndolas.
+
+Estructura del directorio (settings.VISTA02_ARCHIVE_DIR):
+    manifest.json          versión, dimensión y lista de segmentos confirmados, cada uno con
+                           la versión y el checksum del extractor que calculó sus features
+    seg_000001.npz         un segmento: por letra, features float32 (filas x dim, NaN si la
+                           fila no tenía), landmarks float32 (filas x 21 x 3, NaN si no tenía) y
+                           sus HandSample.id, comprimido con np.savez_compressed; nunca se modifica
+    owners/<perfil>/       mismo formato para las muestras de cada propietario
+
+Política (`archive_samples`): se archivan las muestras con más de `older_than_days`
+días y, por letra, las más antiguas por encima de `per_letter_cap`. Se guardan el feature
+y los landmarks, así que un cambio de extractor puede recalcular los features archivados.
+Las filas sin feature se re-extraen; las que no tienen ni feature ni landmarks utilizables
+se quedan en la tabla (nunca se borra una fila que no se haya escrito en un segmento).
+
+Cada segmento se escribe y se añade al manifest antes de borrar sus filas de la BD; el
+borrado se confirma después en el manifest ("deleted"). Si el proceso se interrumpe,
+la siguiente ejecución repite los borrados pendientes, y los lectores solo ven los
+segmentos confirmados, así que ninguna fila se cuenta dos veces.
+
+Al leer (`archive_stream`), los segmentos del extractor vigente devuelven sus features; los
+de otra versión o checksum los recalculan desde los landmarks (las filas sin landmarks se
+omiten) y nunca mezclan features de dos extractores.
+"""
+
+import json
+import os
+import shutil
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from ..models import DEFAULT_OWNER, HandSample
+from .feature_extractor import FEATURE_DIM, FEATURE_VERSION, extract_feature_vector, extractor_checksum
+from .snapshot import LOCK_FILE, MANIFEST, OWNERS_DIR, _dir_lock, _letter_file, _write_manifest
+from .training import CHUNK_SIZE, LetterArrays, _decode
+
+FORMAT_VERSION = 1
+# Filas máximas por segmento (acota la memoria del archivado y de la lectura)
+SEGMENT_ROWS = 50000
+DELETE_BATCH = 500
+# Landmarks de MediaPipe Hands: 21 puntos (x, y, z)
+LANDMARKS_SHAPE = (21, 3)
+
+
+def archive_dir(owner: str = DEFAULT_OWNER) -> Path:
+    root = Path(getattr(settings, "VISTA02_ARCHIVE_DIR", Path(settings.BASE_DIR) / "archive" / "samples"))
+    return root / OWNERS_DIR / owner if owner else root
+
+
+def _empty_manifest() -> dict:
+    return {"version": FORMAT_VERSION, "dim": None, "segments": []}
+
+
+def _load(root: Path) -> dict:
+    try:
+        with open(root / MANIFEST, "r", encoding="utf-8") as f:
+            man = json.load(f)
+    except (OSError, ValueError):
+        return _empty_manifest()
+    if man.get("version") != FORMAT_VERSION:
+        return _empty_manifest()
+    return man
+
+
+def generation(owner: str = DEFAULT_OWNER) -> int:
+    """Cambia con cada segmento archivado (mtime del manifest); 0 si no hay archivo."""
+    try:
+        return (archive_dir(owner) / MANIFEST).stat().st_mtime_ns
+    except OSError:
+        return 0
+
+
+def totals(owner: str = DEFAULT_OWNER) -> Dict[str, int]:
+    """Filas archivadas por letra (solo segmentos confirmados)."""
+    out: Dict[str, int] = {}
+    for seg in _load(archive_dir(owner))["segments"]:
+        if seg["deleted"]:
+            for L, n in seg["rows"].items():
+                out[L] = out.get(L, 0) + n
+    return out
+
+
+# ========== Escritura ==========
+def _candidates(owner: str, cutoff, per_letter_cap: Optional[int]) -> Q:
+    cond = Q()
+    if cutoff is not None:
+        cond |= Q(created_at__lt=cutoff)
+    if per_letter_cap is not None:
+        for letter in HandSample.objects.filter(owner=owner).values_list("letter", flat=True).distinct():
+            # id de la muestra más nueva que ya no cabe en el tope de su letra
+            boundary = (
+                HandSample.objects.filter(owner=owner, letter=letter)
+                .order_by("-id")
+                .values_list("id", flat=True)[per_letter_cap:per_letter_cap + 1]
+            )
+            boundary = list(boundary)
+            if boundary:
+                cond |= Q(letter=letter, id__lte=boundary[0])
+    return cond
+
+
+def _iter_candidate_chunks(owner: str, cond: Q, chunk_size: int) -> Iterator[list]:
+    qs = HandSample.objects.filter(owner=owner).filter(cond).order_by("id")
+    last_id = 0
+    while True:
+        rows = list(qs.filter(id__gt=last_id).values_list("id", "letter", "feature_vector")[:chunk_size])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield rows
+
+
+def _delete_ids(ids: List[int]) -> None:
+    for i in range(0, len(ids), DELETE_BATCH):
+        with transaction.atomic():
+            HandSample.objects.filter(id__in=ids[i:i + DELETE_BATCH]).delete()
+
+
+def _segment_ids(root: Path, seg: dict) -> List[int]:
+    with np.load(root / seg["file"]) as z:
+        return [int(i) for name in z.files if name.startswith("ids_") for i in z[name]]
+
+
+def _finish_pending(root: Path, man: dict) -> int:
+    """Repite los borrados de segmentos escritos pero no confirmados."""
+    done = 0
+    for seg in man["segments"]:
+        if not seg["deleted"]:
+            _delete_ids(_segment_ids(root, seg))
+            seg["deleted"] = True
+            done += 1
+    if done:
+        _write_manifest(root, man)
+    return done
+
+
+def _landmark_array(landmarks) -> Optional[np.ndarray]:
+    """Landmarks guardados (lista de 21 {x, y, z}) como matriz 21 x 3; None si no son utilizables."""
+    if not isinstance(landmarks, list) or len(landmarks) != LANDMARKS_SHAPE[0]:
+        return None
+    try:
+        arr = np.asarray([[float(p["x"]), float(p["y"]), float(p.get("z", 0.0))] for p in landmarks], dtype=np.float32)
+    except (TypeError, ValueError, KeyError, AttributeError):
+        return None
+    return arr if np.isfinite(arr).all() else None
+
+
+def _landmark_dicts(arr: np.ndarray) -> List[Dict[str, float]]:
+    return [{"x": float(x), "y": float(y), "z": float(z)} for x, y, z in arr]
+
+
+def _write_segment(root: Path, man: dict, buf: Dict[str, list], lms: Dict[str, list], ids: Dict[str, list]) -> dict:
+    seq = max((s["seq"] for s in man["segments"]), default=0) + 1
+    name = f"seg_{seq:06d}.npz"
+    arrays = {}
+    for L, vecs in buf.items():
+        key = _letter_file(L)[:-4]  # letter_XXXX
+        suffix = key[len("letter_"):]
+        arrays[key] = np.asarray(vecs, dtype=np.float32).reshape(len(vecs), FEATURE_DIM)
+        arrays["lm_" + suffix] = np.asarray(lms[L], dtype=np.float32).reshape((len(vecs),) + LANDMARKS_SHAPE)
+        arrays["ids_" + suffix] = np.asarray(ids[L], dtype=np.int64)
+    tmp = root / (name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, root / name)
+    all_ids = [i for L in ids for i in ids[L]]
+    without_feature = sum(int(np.isnan(X).any(axis=1).sum()) for k, X in arrays.items() if k.startswith("letter_"))
+    seg = {
+        "seq": seq,
+        "file": name,
+        "created_at": timezone.now().isoformat(),
+        "feature_version": FEATURE_VERSION,
+        "feature_checksum": extractor_checksum(),
+        "rows": {L: len(v) for L, v in sorted(buf.items())},
+        "dim": FEATURE_DIM,
+        "without_feature": without_feature,
+        "min_id": min(all_ids),
+        "max_id": max(all_ids),
+        "bytes": (root / name).stat().st_size,
+        "deleted": False,
+    }
+    man["segments"].append(seg)
+    _write_manifest(root, man)
+    return seg
+
+
+def archive_samples(
+    owner: str = DEFAULT_OWNER,
+    older_than_days: Optional[float] = None,
+    per_letter_cap: Optional[int] = None,
+    now=None,
+    chunk_size: int = CHUNK_SIZE,
+    segment_rows: int = SEGMENT_ROWS,
+    dry_run: bool = False,
+) -> dict:
+    """Mueve al archivo las muestras de `owner` que cumplen la política y las borra de la BD.
+
+    Devuelve {"archived": n, "skipped": n, "segments": n, "by_letter": {...}}; `skipped`
+    cuenta las filas sin feature ni landmarks utilizables, que se quedan en la tabla. Con
+    `dry_run` solo cuenta lo que se archivaría.
+    """
+    cutoff = None
+    if older_than_days is not None:
+        cutoff = (now or timezone.now()) - timedelta(days=float(older_than_days))
+    result = {"archived": 0, "skipped": 0, "segments": 0, "by_letter": {}}
+    if cutoff is None and per_letter_cap is None:
+        return result
+    cond = _candidates(owner, cutoff, per_letter_cap)
+    if not cond:
+        # Ninguna letra supera el tope (un Q vacío seleccionaría todas las filas)
+        return result
+    if dry_run:
+        counts = HandSample.objects.filter(owner=owner).filter(cond).values_list("letter").annotate(n=Count("id"))
+        result["by_letter"] = dict(counts.order_by())
+        result["archived"] = sum(result["by_letter"].values())
+        return result
+
+    root = archive_dir(owner)
+    root.mkdir(parents=True, exist_ok=True)
+    missing_fv = [float("nan")] * FEATURE_DIM
+    missing_lm = np.full(LANDMARKS_SHAPE, np.nan, dtype=np.float32)
+    with _dir_lock(root):
+        man = _load(root)
+        _finish_pending(root, man)
+        man["dim"] = FEATURE_DIM
+        buf: Dict[str, list] = {}
+        lms: Dict[str, list] = {}
+        ids: Dict[str, list] = {}
+        pending_rows = 0
+
+        def flush():
+            nonlocal buf, lms, ids, pending_rows
+            if not buf:
+                return
+            seg = _write_segment(root, man, buf, lms, ids)
+            # Solo se borran las filas que están en el segmento recién escrito
+            _delete_ids([i for L in ids for i in ids[L]])
+            seg["deleted"] = True
+            _write_manifest(root, man)
+            result["segments"] += 1
+            for L, n in seg["rows"].items():
+                result["by_letter"][L] = result["by_letter"].get(L, 0) + n
+                result["archived"] += n
+            buf, lms, ids, pending_rows = {}, {}, {}, 0
+
+        for rows in _decode(_iter_candidate_chunks(owner, cond, chunk_size)):
+            landmarks = dict(HandSample.objects.filter(id__in=[r[0] for r in rows]).values_list("id", "landmarks"))
+            for sid, letter, fv in rows:
+                lm = _landmark_array(landmarks.get(sid))
+                if fv is not None and len(fv) != FEATURE_DIM:
+                    fv = None
+                if fv is None and lm is not None:
+                    try:
+                        fv = extract_feature_vector(landmarks[sid])
+                    except Exception:
+                        fv = None
+                if fv is None and lm is None:
+                    result["skipped"] += 1
+                    continue
+                buf.setdefault(letter, []).append(missing_fv if fv is None else fv)
+                lms.setdefault(letter, []).append(missing_lm if lm is None else lm)
+                ids.setdefault(letter, []).append(sid)
+                pending_rows += 1
+            if pending_rows >= segment_rows:
+                flush()
+        flush()
+    return result
+
+
+def clear(root: Optional[Path] = None) -> None:
+    """Elimina el archivo de un propietario (no toca los de otros, en owners/)."""
+    root = root or archive_dir()
+    if not root.exists():
+        return
+    with _dir_lock(root):
+        for name in os.listdir(root):
+            if name in (LOCK_FILE, OWNERS_DIR):
+                continue
+            p = root / name
+            if p.is_dir():
+                shutil.rmtree(p)
+            else:
+                p.unlink()
+
+
+# ========== Lectura ==========
+def _reextract_rows(LM: np.ndarray) -> np.ndarray:
+    """Features recalculados desde landmarks archivados; NaN en las filas sin landmarks."""
+    X = np.full((len(LM), FEATURE_DIM), np.nan)
+    for r, lm in enumerate(LM):
+        if np.isfinite(lm).all():
+            try:
+                fv = extract_feature_vector(_landmark_dicts(lm))
+            except Exception:
+                continue
+            if len(fv) == FEATURE_DIM:
+                X[r] = fv
+    return X
+
+
+def archive_stream(chunk_size: int = CHUNK_SIZE, owner: str = DEFAULT_OWNER) -> Iterator[LetterArrays]:
+    """Mismo formato que training.sample_stream, leído de los segmentos confirmados.
+
+    Descomprime un segmento a la vez, así que la memoria depende de SEGMENT_ROWS. Los
+    features de un segmento escrito con otro extractor (versión o checksum distintos) no se
+    usan: se recalculan desde sus landmarks, y si no los guarda el segmento se omite.
+    """
+    root = archive_dir(owner)
+    man = _load(root)
+    current = (FEATURE_VERSION, extractor_checksum())
+    for seg in man["segments"]:
+        if not seg["deleted"]:
+            continue
+        same_extractor = (seg.get("feature_version"), seg.get("feature_checksum")) == current
+        with np.load(root / seg["file"]) as z:
+            for L in seg["rows"]:
+                suffix = _letter_file(L)[len("letter_"):-4]
+                lm_key = "lm_" + suffix
+                if same_extractor:
+                    X = np.asarray(z["letter_" + suffix], dtype=np.float64)
+                    missing = ~np.isfinite(X).all(axis=1)
+                    if missing.any() and lm_key in z.files:
+                        X[missing] = _reextract_rows(z[lm_key][missing])
+                elif lm_key in z.files:
+                    X = _reextract_rows(z[lm_key])
+                else:
+                    continue
+                X = X[np.isfinite(X).all(axis=1)]
+                for start in range(0, len(X), chunk_size):
+                    yield [(L, X[start:start + chunk_size])]
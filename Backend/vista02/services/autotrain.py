@@ -0,0 +1,215 @@
+"""Reentrenamiento automático con rebote (debounce) por propietario.
+
+`samples_batch` avisa con `notify_samples(owner)` cada vez que entran muestras. Un hilo
+en segundo plano revisa cada VISTA02_AUTOTRAIN_TICK_SECONDS a los propietarios con
+avisos pendientes y lanza un entrenamiento cuando, respecto al modelo activo:
+
+- hay al menos VISTA02_AUTOTRAIN_NEW_SAMPLES muestras nuevas (id mayor que el último
+  leído por ese modelo), o
+- alguna letra cambió su número de muestras en al menos VISTA02_AUTOTRAIN_DRIFT
+  (fracción; una letra nueva cuenta contra una base de DRIFT_MIN_BASE muestras).
+
+El disparo espera VISTA02_AUTOTRAIN_DEBOUNCE_SECONDS sin ingesta, para no entrenar en
+mitad de una ráfaga, pero nunca más de VISTA02_AUTOTRAIN_MAX_DELAY_SECONDS desde el
+primer aviso; y entre dos reentrenamientos automáticos del mismo propietario pasan al
+menos VISTA02_AUTOTRAIN_MIN_INTERVAL_SECONDS. El trabajo se lanza con
+`jobs.start_training_job`, que ya impide dos entrenamientos del mismo propietario a la
+vez; al terminar se invalida el modelo cacheado para que `predict` use el nuevo.
+
+El estado vive en memoria del proceso: con varios workers, conviene activarlo solo en uno.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Count
+
+from ..models import HandSample, TrainingModel
+from . import archive
+from .jobs import start_training_job
+from .model_cache import get_model_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NEW_SAMPLES = 200
+DEFAULT_DRIFT = 0.25
+DEFAULT_DEBOUNCE_SECONDS = 30.0
+DEFAULT_MAX_DELAY_SECONDS = 300.0
+DEFAULT_MIN_INTERVAL_SECONDS = 120.0
+DEFAULT_TICK_SECONDS = 5.0
+# Base mínima para la deriva relativa de una letra (evita que 1 muestra nueva dispare)
+DRIFT_MIN_BASE = 10
+
+_LOCK = threading.Lock()
+_PENDING: Dict[str, dict] = {}     # propietario -> {"first": t, "last": t}
+_LAST_RUN: Dict[str, dict] = {}    # propietario -> {"at": t, "job_id": ..., "reason": ...}
+_thread: Optional[threading.Thread] = None
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _config() -> dict:
+    return {
+        "enabled": bool(_setting("VISTA02_AUTOTRAIN_ENABLED", False)),
+        "new_samples": int(_setting("VISTA02_AUTOTRAIN_NEW_SAMPLES", DEFAULT_NEW_SAMPLES)),
+        "drift": float(_setting("VISTA02_AUTOTRAIN_DRIFT", DEFAULT_DRIFT)),
+        "debounce": float(_setting("VISTA02_AUTOTRAIN_DEBOUNCE_SECONDS", DEFAULT_DEBOUNCE_SECONDS)),
+        "max_delay": float(_setting("VISTA02_AUTOTRAIN_MAX_DELAY_SECONDS", DEFAULT_MAX_DELAY_SECONDS)),
+        "min_interval": float(_setting("VISTA02_AUTOTRAIN_MIN_INTERVAL_SECONDS", DEFAULT_MIN_INTERVAL_SECONDS)),
+        "tick": float(_setting("VISTA02_AUTOTRAIN_TICK_SECONDS", DEFAULT_TICK_SECONDS)),
+    }
+
+
+# ========== Criterios ==========
+def letter_drift(trained: Dict[str, int], current: Dict[str, int]) -> float:
+    """Mayor cambio relativo de muestras por letra entre el modelo y la BD."""
+    drift = 0.0
+    for L in set(trained) | set(current):
+        old = int(trained.get(L, 0))
+        drift = max(drift, abs(int(current.get(L, 0)) - old) / max(old, DRIFT_MIN_BASE))
+    return drift
+
+
+def due_at(pending: dict, last_run_at: Optional[float], cfg: dict) -> float:
+    """Momento en que puede dispararse un reentrenamiento ya justificado."""
+    due = min(pending["last"] + cfg["debounce"], pending["first"] + cfg["max_delay"])
+    if last_run_at is not None:
+        due = max(due, last_run_at + cfg["min_interval"])
+    return due
+
+
+def _measure(owner: str) -> dict:
+    """Muestras nuevas y deriva por letra frente al modelo activo de `owner`."""
+    model = (
+        TrainingModel.objects.filter(owner=owner)
+        .only("id", "trained_max_sample_id", "letter_counts")
+        .order_by("-created_at")
+        .first()
+    )
+    hwm = (model.trained_max_sample_id or 0) if model is not None else 0
+    trained = (model.letter_counts or {}) if model is not None else {}
+    qs = HandSample.objects.filter(owner=owner)
+    current = dict(qs.values_list("letter").annotate(n=Count("id")).order_by())
+    if _setting("VISTA02_TRAIN_INCLUDE_ARCHIVE", False):
+        # El modelo también contó las muestras archivadas
+        for L, n in archive.totals(owner).items():
+            current[L] = current.get(L, 0) + n
+    return {
+        "model_id": model.id if model is not None else None,
+        "new_samples": qs.filter(id__gt=hwm).count(),
+        "drift": round(letter_drift(trained, current), 4),
+    }
+
+
+def evaluate(owner: str, now: Optional[float] = None, cfg: Optional[dict] = None) -> dict:
+    """Estado del reentrenamiento automático de `owner` (consulta la BD)."""
+    cfg = cfg or _config()
+    now = time.time() if now is None else now
+    with _LOCK:
+        pending = dict(_PENDING[owner]) if owner in _PENDING else None
+        last = dict(_LAST_RUN[owner]) if owner in _LAST_RUN else None
+    m = _measure(owner)
+    reasons = []
+    if m["new_samples"] >= cfg["new_samples"]:
+        reasons.append("new_samples")
+    if m["drift"] >= cfg["drift"]:
+        reasons.append("drift")
+    due = None
+    if reasons and pending is not None:
+        due = due_at(pending, last["at"] if last else None, cfg)
+    return {
+        "enabled": cfg["enabled"],
+        **m,
+        "thresholds": {"new_samples": cfg["new_samples"], "drift": cfg["drift"]},
+        "reasons": reasons,
+        "pending_since": pending["first"] if pending else None,
+        "last_ingest": pending["last"] if pending else None,
+        "due_at": due,
+        "due_in": round(max(0.0, due - now), 3) if due is not None else None,
+        "last_run": last,
+    }
+
+
+# ========== Disparo ==========
+def _trigger(owner: str, reasons: list, now: float) -> int:
+    job, created = start_training_job(on_success=lambda: get_model_cache().invalidate(owner), owner=owner)
+    if not created:
+        # Ya corre otro entrenamiento del perfil (p. ej. manual): el aviso sigue pendiente, así
+        # las muestras que lleguen mientras tanto se vuelven a evaluar contra el modelo que deje
+        return 0
+    with _LOCK:
+        _PENDING.pop(owner, None)
+        _LAST_RUN[owner] = {"at": now, "job_id": job["job_id"], "reason": ",".join(reasons)}
+    logger.info(f"Vista02: reentrenamiento automático de '{owner}' ({', '.join(reasons)}): {job['job_id']}")
+    return 1
+
+
+def tick(now: Optional[float] = None) -> int:
+    """Revisa los propietarios pendientes y lanza los reentrenamientos vencidos."""
+    cfg = _config()
+    if not cfg["enabled"]:
+        return 0
+    now = time.time() if now is None else now
+    with _LOCK:
+        candidates = [
+            o for o, p in _PENDING.items()
+            if now >= due_at(p, _LAST_RUN[o]["at"] if o in _LAST_RUN else None, cfg)
+        ]
+    launched = 0
+    for owner in candidates:
+        st = evaluate(owner, now, cfg)
+        if not st["reasons"]:
+            # Sin umbral alcanzado: olvidar hasta la próxima ingesta
+            with _LOCK:
+                _PENDING.pop(owner, None)
+        elif st["due_at"] is not None and now >= st["due_at"]:
+            launched += _trigger(owner, st["reasons"], now)
+    return launched
+
+
+def _loop() -> None:
+    while True:
+        time.sleep(_config()["tick"])
+        try:
+            close_old_connections()
+            tick()
+        except Exception as e:
+            logger.warning(f"Vista02: fallo en el reentrenamiento automático: {e}")
+        finally:
+            # El hilo abre su propia conexión a la BD; no mantenerla entre revisiones
+            connection.close()
+
+
+def ensure_scheduler() -> None:
+    """Arranca (una sola vez por proceso) el hilo del planificador. No toca la BD."""
+    global _thread
+    if _thread is not None:
+        return
+    with _LOCK:
+        if _thread is None:
+            _thread = threading.Thread(target=_loop, name="vista02-autotrain", daemon=True)
+            _thread.start()
+
+
+def notify_samples(owner: str) -> None:
+    """Registra una ingesta de muestras de `owner`. Barato: solo toca memoria."""
+    if not _setting("VISTA02_AUTOTRAIN_ENABLED", False):
+        return
+    now = time.time()
+    with _LOCK:
+        p = _PENDING.setdefault(owner, {"first": now, "last": now})
+        p["last"] = now
+    ensure_scheduler()
+
+
+def forget(owner: str) -> None:
+    """Descarta el estado de `owner` (p. ej. tras borrar sus datos)."""
+    with _LOCK:
+        _PENDING.pop(owner, None)
+        _LAST_RUN.pop(owner, None)
@@ -0,0 +1,350 @@
+"""Micro-lotes para `predict`: las clasificaciones concurrentes se agrupan en una matriz.
+
+Con muchas cámaras a la vez cada `predict` clasifica un solo vector y domina el coste por
+llamada de Python. Con VISTA02_PREDICT_BATCH_WINDOW_MS > 0, la primera petición que llega
+pasa a ser líder: espera como mucho esa ventana (o hasta reunir VISTA02_PREDICT_BATCH_MAX
+vectores), toma la cola, clasifica cada grupo del mismo modelo en una pasada vectorizada en
+el pool de CPU y reparte los resultados; las demás esperan el suyo. Si al tomar el lote
+quedan peticiones en cola, la más antigua pasa a ser la líder del lote siguiente.
+
+`classify` es una corrutina y las esperas no ocupan hilos, así que bajo ASGI las
+peticiones de un mismo event loop se agrupan. Bajo WSGI cada vista async tiene su propio
+loop: el estado va bajo un lock de hilos y cada espera se despierta con
+`call_soon_threadsafe` en el loop de su petición.
+
+Cada resultado es idéntico al de `classify_one` (el camino sin lotes): las distancias se
+acumulan dimensión a dimensión en el mismo orden que `trainer._l2`, la raíz final se
+calcula con `** 0.5` en Python sobre la fila ganadora y los empates se resuelven por el
+orden de las letras del modelo. Las filas con valores no finitos o los modelos con
+centroides de distinta longitud usan el camino escalar.
+
+La extracción del feature sigue haciéndose en cada petición: el extractor es escalar y
+reescribirlo en numpy cambiaría el redondeo de los vectores.
+"""
+
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from . import profiling
+from .executor import run_cpu
+from .trainer import SHAPE_GROUPS, SHAPE_MIN_DIM, SHAPE_TOLERANCES, _l2, predict_with_thresholds
+
+# (letra, distancia, umbral, forma_ok, candidato, distancia_candidato)
+Classification = Tuple[Optional[str], float, float, bool, Optional[str], float]
+
+# Límites superiores (ms) de los cubos del histograma de espera en cola
+DELAY_BUCKETS_MS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0)
+# Matrices de centroides recordadas (una por entrada de modelo en caché)
+MAX_MODELS = 64
+
+_SHAPE_IDX = np.asarray([i for idxs in SHAPE_GROUPS.values() for i in idxs], dtype=np.intp)
+_SHAPE_TOL = np.asarray([SHAPE_TOLERANCES[g] for g, idxs in SHAPE_GROUPS.items() for _ in idxs])
+
+
+def classify_one(fv: List[float], centroids: dict, thresholds: dict) -> Classification:
+    """Clasificación sin lotes: `predict_with_thresholds` más el candidato más cercano."""
+    letter, dist, thr, shape_ok = predict_with_thresholds(fv, centroids, thresholds)
+    # Candidato más cercano (aunque no pase umbral) para diagnóstico
+    bestL = None
+    bestD = float("inf")
+    for L, c in centroids.items():
+        dL = _l2(fv, c)
+        if dL < bestD:
+            bestD = dL
+            bestL = L
+    return letter, dist, thr, shape_ok, bestL, bestD
+
+
+def _model_matrix(centroids: dict):
+    """(letras, matriz k x dim) o None si el modelo no admite la pasada vectorizada."""
+    letters = list(centroids)
+    if not letters:
+        return None
+    dims = {len(centroids[L]) for L in letters}
+    if len(dims) != 1:
+        return None
+    return letters, np.asarray([centroids[L] for L in letters], dtype=np.float64)
+
+
+def classify_many(X: np.ndarray, letters: list, C: np.ndarray, thresholds: dict) -> List[Classification]:
+    """Clasifica las filas de X (n x dim) contra los centroides C (k x dim) de una vez."""
+    m = min(X.shape[1], C.shape[1])
+    D2 = np.zeros((X.shape[0], C.shape[0]))
+    # Mismo orden de suma que trainer._l2 (sumar de golpe cambiaría el redondeo)
+    for i in range(m):
+        d = X[:, i, None] - C[None, :, i]
+        D2 += d * d
+
+    rows = []
+    for r in range(X.shape[0]):
+        s = D2[r]
+        j = int(np.argmin(s))
+        # Letras cuya raíz podría empatar con la mínima: gana la primera en orden
+        best, best_d = None, float("inf")
+        for c in np.flatnonzero(s <= s[j] * (1.0 + 1e-12)):
+            dc = float(s[c]) ** 0.5
+            if dc < best_d:
+                best, best_d = int(c), dc
+        rows.append((best, best_d))
+
+    # Sin ganador (todas las distancias infinitas) la fila se verifica contra la letra 0 y se descarta
+    best_idx = np.asarray([b or 0 for b, _d in rows], dtype=np.intp)
+    if m >= SHAPE_MIN_DIM:
+        diff = np.abs(X[:, _SHAPE_IDX] - C[best_idx][:, _SHAPE_IDX])
+        shape = ~np.any(diff > _SHAPE_TOL, axis=1)
+    else:
+        shape = np.zeros(X.shape[0], dtype=bool)
+
+    out = []
+    for r, (b, d) in enumerate(rows):
+        if b is None:
+            out.append((None, float("inf"), 0.0, False, None, float("inf")))
+            continue
+        L = letters[b]
+        thr = thresholds.get(L, 0.0)
+        if d <= thr and thr > 0 and shape[r]:
+            out.append((L, d, thr, True, L, d))
+        else:
+            out.append((None, d, thr, False, L, d))
+    return out
+
+
+# Veredictos de la espera de un item: su resultado ya está listo, o le toca liderar un lote
+_DONE = "done"
+_LEAD = "lead"
+
+
+def _set_result(future, value) -> None:
+    if not future.done():
+        future.set_result(value)
+
+
+def _wake(loop, future, value) -> None:
+    try:
+        loop.call_soon_threadsafe(_set_result, future, value)
+    except RuntimeError:
+        pass  # loop cerrado: la petición ya no espera
+
+
+class _Item:
+    __slots__ = ("model", "fv", "t0", "loop", "future", "result", "error", "profile")
+
+    def __init__(self, model: dict, fv: List[float], loop):
+        self.model = model
+        self.fv = fv
+        self.t0 = time.perf_counter()
+        self.loop = loop
+        self.future = loop.create_future()
+        self.result = None
+        self.error = None
+        # Perfil de la petición, si se está perfilando: su lote se perfila aunque lo lidere otra
+        self.profile = profiling.current_run()
+
+
+class PredictBatcher:
+    def __init__(self, window_ms: float, max_batch: int):
+        self.window = max(0.0, float(window_ms)) / 1000.0
+        self.max_batch = max(1, int(max_batch))
+        self._lock = threading.Lock()
+        self._queue: List[_Item] = []
+        self._leader = False
+        self._designated: Optional[_Item] = None
+        # (loop, future) del líder mientras espera la ventana; se despierta con la cola llena
+        self._full = None
+        self._models: "OrderedDict[int, tuple]" = OrderedDict()
+        self._batches = 0
+        self._items = 0
+        self._scalar = 0
+        self._sizes = [0] * (self.max_batch + 1)
+        self._delay_sum = 0.0
+        self._delay_max = 0.0
+        self._delay_hist = [0] * (len(DELAY_BUCKETS_MS) + 1)
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0 and self.max_batch > 1
+
+    async def classify(self, model: dict, fv: List[float]) -> Classification:
+        """Clasifica `fv` con el modelo en caché `model`; agrupa con peticiones concurrentes."""
+        if not self.enabled:
+            return await run_cpu(classify_one, fv, model.get("centroids") or {}, model.get("thresholds") or {})
+        item = _Item(model, fv, asyncio.get_running_loop())
+        with self._lock:
+            self._queue.append(item)
+            lead = not self._leader
+            if lead:
+                self._leader = True
+                self._designated = item
+            elif len(self._queue) >= self.max_batch and self._full is not None:
+                _wake(*self._full, None)
+        if not lead:
+            try:
+                lead = await item.future == _LEAD
+            except asyncio.CancelledError:
+                with self._lock:
+                    if item in self._queue:
+                        self._queue.remove(item)
+                    if self._designated is item:
+                        self._handover()
+                raise
+        if lead:
+            await self._lead(item)
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    async def _lead(self, item: _Item) -> None:
+        """Espera la ventana del item más antiguo, saca el lote de la cola y lo clasifica."""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                with self._lock:
+                    remaining = self._queue[0].t0 + self.window - time.perf_counter()
+                    if len(self._queue) >= self.max_batch or remaining <= 0:
+                        batch = self._take()
+                        break
+                    full = self._full = (loop, loop.create_future())
+                try:
+                    await asyncio.wait_for(full[1], remaining)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    with self._lock:
+                        self._full = None
+        except asyncio.CancelledError:
+            with self._lock:
+                if item in self._queue:
+                    self._queue.remove(item)
+                self._handover()
+            raise
+        # Los resultados se reparten aunque se cancele la petición del líder
+        await asyncio.shield(asyncio.ensure_future(self._finish(batch)))
+
+    def _take(self) -> List[_Item]:
+        """Con el lock tomado: saca el lote de la cola y cede el liderazgo."""
+        batch = self._queue[:self.max_batch]
+        del self._queue[:self.max_batch]
+        now = time.perf_counter()
+        for it in batch:
+            self._record_delay((now - it.t0) * 1000.0)
+        self._batches += 1
+        self._items += len(batch)
+        self._sizes[len(batch)] += 1
+        self._handover()
+        return batch
+
+    def _handover(self) -> None:
+        """Con el lock tomado: si quedó cola, su item más antiguo lidera el lote siguiente."""
+        self._leader = bool(self._queue)
+        self._designated = self._queue[0] if self._queue else None
+        if self._queue:
+            _wake(self._designated.loop, self._designated.future, _LEAD)
+
+    async def _finish(self, batch: List[_Item]) -> None:
+        # Tarea propia: adoptar el perfil de un item del lote no afecta a la petición líder
+        profiling.adopt(next((it.profile for it in batch if it.profile is not None), None))
+        try:
+            await run_cpu(self._run, batch)
+        except BaseException as e:
+            for it in batch:
+                if it.result is None and it.error is None:
+                    it.error = e
+            raise
+        finally:
+            for it in batch:
+                _wake(it.loop, it.future, _DONE)
+
+    def _record_delay(self, ms: float) -> None:
+        self._delay_sum += ms
+        self._delay_max = max(self._delay_max, ms)
+        self._delay_hist[bisect_left(DELAY_BUCKETS_MS, ms)] += 1
+
+    def _matrix(self, model: dict):
+        # Clave: identidad de la entrada en caché (se guarda la referencia, así no se reutiliza);
+        # un modelo nuevo o con umbrales recalculados llega como otra entrada
+        key = id(model)
+        with self._lock:
+            hit = self._models.get(key)
+            if hit is not None:
+                self._models.move_to_end(key)
+                return hit[1]
+        mat = _model_matrix(model.get("centroids") or {})
+        with self._lock:
+            self._models[key] = (model, mat)
+            while len(self._models) > MAX_MODELS:
+                self._models.popitem(last=False)
+        return mat
+
+    def _run(self, batch: List[_Item]) -> None:
+        groups: "OrderedDict[tuple, List[_Item]]" = OrderedDict()
+        for it in batch:
+            groups.setdefault((id(it.model), len(it.fv)), []).append(it)
+        scalar = 0
+        for items in groups.values():
+            model = items[0].model
+            thresholds = model.get("thresholds") or {}
+            try:
+                mat = self._matrix(model)
+                X = np.asarray([it.fv for it in items], dtype=np.float64)
+                if mat is None:
+                    finite = np.zeros(len(items), dtype=bool)
+                else:
+                    finite = np.isfinite(X).all(axis=1) & np.isfinite(mat[1]).all()
+                if finite.any():
+                    letters, C = mat
+                    for it, res in zip([it for it, ok in zip(items, finite) if ok], classify_many(X[finite], letters, C, thresholds)):
+                        it.result = res
+                for it, ok in zip(items, finite):
+                    if not ok:
+                        it.result = classify_one(it.fv, model.get("centroids") or {}, thresholds)
+                        scalar += 1
+            except Exception as e:
+                for it in items:
+                    it.error = e
+        with self._lock:
+            self._scalar += scalar
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = self._items
+            return {
+                "enabled": self.enabled,
+                "window_ms": self.window * 1000.0,
+                "max_batch": self.max_batch,
+                "batches": self._batches,
+                "items": n,
+                "scalar_fallback": self._scalar,
+                "avg_batch": round(n / self._batches, 3) if self._batches else 0.0,
+                "batch_sizes": {str(s): c for s, c in enumerate(self._sizes) if c},
+                "queue_delay_ms": {
+                    "avg": round(self._delay_sum / n, 4) if n else 0.0,
+                    "max": round(self._delay_max, 4),
+                    "buckets": {
+                        **{f"<={b}": c for b, c in zip(DELAY_BUCKETS_MS, self._delay_hist)},
+                        f">{DELAY_BUCKETS_MS[-1]}": self._delay_hist[-1],
+                    },
+                },
+            }
+
+
+_BATCHER: Optional[PredictBatcher] = None
+_BATCHER_LOCK = threading.Lock()
+
+
+def get_predict_batcher() -> PredictBatcher:
+    global _BATCHER
+    if _BATCHER is None:
+        with _BATCHER_LOCK:
+            if _BATCHER is None:
+                _BATCHER = PredictBatcher(
+                    getattr(settings, "VISTA02_PREDICT_BATCH_WINDOW_MS", 0),
+                    getattr(settings, "VISTA02_PREDICT_BATCH_MAX", 32),
+                )
+    return _BATCHER
@@ -0,0 +1,220 @@
+"""Evaluación del clasificador de centroides y barrido de umbrales/tolerancias.
+
+Validación cruzada estratificada k-fold: por cada fold se calculan una sola vez las
+matrices de distancias (muestra de prueba -> centroides) y las desviaciones por grupo
+de forma respecto al centroide más cercano. Después todas las combinaciones de
+percentil y tolerancias se evalúan en bloque con operaciones vectorizadas sobre
+esas matrices, sin volver a recorrer los datos.
+"""
+
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .trainer import MIN_THRESH, SHAPE_GROUPS, SHAPE_MIN_DIM, SHAPE_TOLERANCES, percentile_rank
+from .training import LetterArrays
+
+DEFAULT_PERCENTILES = [0.50, 0.60, 0.70, 0.75, 0.80, 0.85, 0.88, 0.90, 0.92, 0.95, 0.97, 0.99]
+DEFAULT_TOL_SCALES = [0.50, 0.75, 0.90, 1.00, 1.10, 1.25, 1.50, 1.75, 2.00, 2.50, 3.00]
+# Muestras de prueba por bloque al evaluar las combinaciones (acota la memoria del barrido)
+SWEEP_BLOCK = 4096
+
+_GROUP_NAMES = list(SHAPE_GROUPS.keys())
+
+
+def load_feature_matrix(stream: Iterable[LetterArrays]) -> Tuple[np.ndarray, np.ndarray, List[str], int]:
+    """Concatena el stream en (X, y, letras, descartadas).
+
+    Solo se conservan vectores de la dimensión más frecuente (features de otra versión
+    del extractor no son comparables).
+    """
+    parts: Dict[int, List[Tuple[str, np.ndarray]]] = {}
+    for groups in stream:
+        for letter, X in groups:
+            parts.setdefault(X.shape[1], []).append((letter, X))
+    if not parts:
+        return np.zeros((0, 0), np.float64), np.zeros(0, np.int64), [], 0
+    dims = Counter({d: sum(len(X) for _L, X in items) for d, items in parts.items()})
+    dim = dims.most_common(1)[0][0]
+    skipped = sum(dims.values()) - dims[dim]
+    letters = sorted({L for L, _X in parts[dim]})
+    index = {L: i for i, L in enumerate(letters)}
+    X = np.concatenate([X for _L, X in parts[dim]])
+    y = np.concatenate([np.full(len(X), index[L], dtype=np.int64) for L, X in parts[dim]])
+    return X, y, letters, skipped
+
+
+def stratified_folds(y: np.ndarray, k: int, seed: int = 0) -> np.ndarray:
+    """Asigna a cada muestra un fold 0..k-1 repartiendo cada letra por igual."""
+    rng = np.random.default_rng(seed)
+    folds = np.empty(len(y), dtype=np.int64)
+    for cls in np.unique(y):
+        idx = np.flatnonzero(y == cls)
+        rng.shuffle(idx)
+        folds[idx] = np.arange(len(idx)) % k
+    return folds
+
+
+def tolerance_grid(scales: Sequence[float]) -> np.ndarray:
+    """Matriz (T, grupos) de tolerancias: las actuales de trainer.py escaladas."""
+    base = np.array([SHAPE_TOLERANCES[g] for g in _GROUP_NAMES], dtype=np.float64)
+    return np.outer(np.asarray(scales, dtype=np.float64), base)
+
+
+def _group_deviation(X: np.ndarray, C: np.ndarray) -> np.ndarray:
+    """Máxima |x_i - c_i| por grupo de forma -> (n, grupos)."""
+    diff = np.abs(X - C)
+    return np.stack([diff[:, idxs].max(axis=1) for idxs in SHAPE_GROUPS.values()], axis=1)
+
+
+def _fold_tables(
+    X: np.ndarray, y: np.ndarray, train: np.ndarray, test: np.ndarray, n_letters: int, percentiles: np.ndarray
+) -> Optional[dict]:
+    """Precalcula lo que necesita el barrido para un fold."""
+    Xtr, ytr = X[train], y[train]
+    counts = np.bincount(ytr, minlength=n_letters)
+    present = counts > 0
+    if not present.any():
+        return None
+    C = np.zeros((n_letters, X.shape[1]), dtype=np.float64)
+    np.add.at(C, ytr, Xtr)
+    C[present] /= counts[present, None]
+
+    # Umbral por letra y percentil, con la misma regla de rango que compute_thresholds
+    own = np.sqrt(((Xtr - C[ytr]) ** 2).sum(axis=1))
+    thr = np.zeros((n_letters, len(percentiles)), dtype=np.float64)
+    for cls in np.flatnonzero(present):
+        ds = np.sort(own[ytr == cls])
+        ranks = [percentile_rank(len(ds), p) for p in percentiles]
+        thr[cls] = np.maximum(MIN_THRESH, ds[ranks])
+
+    # Distancias al cuadrado a todos los centroides vía |x|^2 - 2x·c + |c|^2 (sin tensor n x L x d)
+    Xte = X[test]
+    D2 = (Xte ** 2).sum(axis=1)[:, None] - 2.0 * (Xte @ C.T) + (C ** 2).sum(axis=1)[None, :]
+    D2[:, ~present] = np.inf
+    best = D2.argmin(axis=1)
+    return {
+        "y": y[test],
+        "best": best,
+        "dist": np.sqrt(((Xte - C[best]) ** 2).sum(axis=1)),
+        "dev": _group_deviation(Xte, C[best]),
+        "thr": thr,
+    }
+
+
+def _accepted(table: dict, sl: slice, tols: np.ndarray, shape_check: bool) -> np.ndarray:
+    """Matriz booleana (n, P, T) de aceptación para un bloque de muestras."""
+    best = table["best"][sl]
+    dist_ok = table["dist"][sl, None] <= table["thr"][best]
+    dist_ok &= table["thr"][best] > 0
+    if shape_check:
+        shape_ok = (table["dev"][sl, None, :] <= tols[None, :, :]).all(axis=2)
+    else:
+        shape_ok = np.zeros((len(best), len(tols)), dtype=bool)
+    return dist_ok[:, :, None] & shape_ok[:, None, :]
+
+
+def sweep(
+    X: np.ndarray,
+    y: np.ndarray,
+    letters: List[str],
+    k: int = 5,
+    percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+    tolerances: Optional[np.ndarray] = None,
+    seed: int = 0,
+) -> dict:
+    """Validación cruzada k-fold y barrido de percentil x tolerancias.
+
+    Devuelve métricas globales (P, T) y por letra (L, P, T), más las tablas por fold
+    para calcular la matriz de confusión de cualquier configuración.
+    """
+    pcts = np.asarray(percentiles, dtype=np.float64)
+    tols = tolerance_grid([1.0]) if tolerances is None else np.asarray(tolerances, dtype=np.float64)
+    L, P, T = len(letters), len(pcts), len(tols)
+    shape_check = X.shape[1] >= SHAPE_MIN_DIM
+    folds = stratified_folds(y, k, seed)
+
+    correct = np.zeros((L, P * T), dtype=np.float64)
+    accepted = np.zeros((L, P * T), dtype=np.float64)
+    tables = []
+    for f in range(k):
+        table = _fold_tables(X, y, folds != f, folds == f, L, pcts)
+        if table is None:
+            continue
+        tables.append(table)
+        n = len(table["y"])
+        for start in range(0, n, SWEEP_BLOCK):
+            sl = slice(start, min(n, start + SWEEP_BLOCK))
+            acc = _accepted(table, sl, tols, shape_check).reshape(-1, P * T)
+            hit = acc & (table["best"][sl] == table["y"][sl])[:, None]
+            # Agregación por letra verdadera como producto matricial one-hot
+            onehot = np.zeros((L, acc.shape[0]), dtype=np.float32)
+            onehot[table["y"][sl], np.arange(acc.shape[0])] = 1.0
+            accepted += onehot @ acc.astype(np.float32)
+            correct += onehot @ hit.astype(np.float32)
+
+    support = np.bincount(y, minlength=L).astype(np.float64)
+    denom = np.maximum(1.0, support)[:, None]
+    total = max(1.0, support.sum())
+    return {
+        "letters": letters,
+        "samples": int(len(y)),
+        "folds": k,
+        "percentiles": pcts,
+        "tolerances": tols,
+        "support": support,
+        "accuracy": (correct.sum(axis=0) / total).reshape(P, T),
+        "rejection": (1.0 - accepted.sum(axis=0) / total).reshape(P, T),
+        "letter_accuracy": (correct / denom).reshape(L, P, T),
+        "letter_rejection": (1.0 - accepted / denom).reshape(L, P, T),
+        "shape_check": shape_check,
+        "_tables": tables,
+    }
+
+
+def confusion_matrix(result: dict, p_idx: int, t_idx: int) -> Dict[str, Dict[str, int]]:
+    """Matriz de confusión {real: {predicha|'rechazo': n}} para una configuración del barrido."""
+    letters = result["letters"]
+    L = len(letters)
+    tols = result["tolerances"][t_idx:t_idx + 1]
+    cm = np.zeros((L, L + 1), dtype=np.int64)
+    for table in result["_tables"]:
+        n = len(table["y"])
+        for start in range(0, n, SWEEP_BLOCK):
+            sl = slice(start, min(n, start + SWEEP_BLOCK))
+            acc = _accepted(table, sl, tols, result["shape_check"])[:, p_idx, 0]
+            pred = np.where(acc, table["best"][sl], L)
+            np.add.at(cm, (table["y"][sl], pred), 1)
+    cols = letters + ["rechazo"]
+    return {letters[i]: {cols[j]: int(cm[i, j]) for j in range(L + 1) if cm[i, j]} for i in range(L)}
+
+
+def best_config(result: dict, max_rejection: float = 1.0) -> Tuple[int, int]:
+    """Índices (percentil, tolerancia) con mayor exactitud dentro del rechazo permitido.
+
+    En caso de empate gana la configuración con menor rechazo.
+    """
+    acc = np.where(result["rejection"] <= max_rejection, result["accuracy"], -1.0).ravel()
+    order = np.lexsort((result["rejection"].ravel(), -acc))
+    p_idx, t_idx = np.unravel_index(int(order[0]), result["accuracy"].shape)
+    return int(p_idx), int(t_idx)
+
+
+def config_summary(result: dict, p_idx: int, t_idx: int) -> dict:
+    """Resumen serializable de una configuración: métricas globales, por letra y confusión."""
+    return {
+        "percentile": float(result["percentiles"][p_idx]),
+        "tolerances": {g: float(v) for g, v in zip(_GROUP_NAMES, result["tolerances"][t_idx])},
+        "accuracy": float(result["accuracy"][p_idx, t_idx]),
+        "rejection": float(result["rejection"][p_idx, t_idx]),
+        "per_letter": {
+            L: {
+                "support": int(result["support"][i]),
+                "accuracy": float(result["letter_accuracy"][i, p_idx, t_idx]),
+                "rejection": float(result["letter_rejection"][i, p_idx, t_idx]),
+            }
+            for i, L in enumerate(result["letters"])
+        },
+        "confusion": confusion_matrix(result, p_idx, t_idx),
+    }
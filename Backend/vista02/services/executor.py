@@ -0,0 +1,45 @@
+"""Pool acotado de hilos para trabajo de CPU lanzado desde vistas async.
+
+Las vistas async no deben bloquear el event loop con la extracción de features;
+la delegan aquí. El tamaño del pool (settings.VISTA02_CPU_WORKERS) limita cuántas
+extracciones corren a la vez para que no compitan sin límite con `predict`.
+"""
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+from django.conf import settings
+
+from . import profiling
+
+T = TypeVar("T")
+
+_LOCK = threading.Lock()
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+
+
+def cpu_workers() -> int:
+    default = min(4, os.cpu_count() or 1)
+    return max(1, int(getattr(settings, "VISTA02_CPU_WORKERS", default) or default))
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ThreadPoolExecutor(max_workers=cpu_workers(), thread_name_prefix="vista02-cpu")
+    return _EXECUTOR
+
+
+async def run_cpu(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Ejecuta `fn(*args, **kwargs)` en el pool de CPU y espera su resultado sin bloquear el loop.
+
+    Si la petición se está perfilando, el hilo del pool se perfila mientras ejecuta `fn`.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(profiling.bind(fn), *args, **kwargs))
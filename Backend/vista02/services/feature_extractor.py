@@ -1,9 +1,14 @@
+from functools import lru_cache
 from typing import List, Dict
 import math
 
 # Landmarks: list of 21 dicts with keys x,y,z in normalized image coordinates
 # Output: richer, normalized feature vector robust to translation/scale and sensitive a la forma (A..Z)
 
+# Versión y dimensión del vector. Cambiar FEATURE_VERSION cuando cambie el descriptor.
+FEATURE_VERSION = "v1"
+FEATURE_DIM = 19
+
 def _dist(a, b):
     dx = a[0] - b[0]
     dy = a[1] - b[1]
@@ -150,3 +155,41 @@ def extract_feature_vector(landmarks: List[Dict[str, float]]) -> List[float]:
     feat.append(var_z)
 
     return feat
+
+
+# ===== Huella del extractor (negociación con clientes que calculan el feature) =====
+def probe_landmarks() -> List[Dict[str, float]]:
+    """Landmarks fijos, solo con aritmética exacta, para comparar extractores entre plataformas."""
+    return [
+        {"x": 0.3 + ((i * 7) % 11) / 25, "y": 0.2 + ((i * 5) % 13) / 20, "z": ((i * 3) % 7 - 3) / 100}
+        for i in range(21)
+    ]
+
+
+def fingerprint(values: List[float]) -> str:
+    """FNV-1a de 32 bits sobre los valores redondeados a 6 decimales (misma fórmula en el frontend)."""
+    text = ",".join(f"{v + 0.0:.6f}" for v in values)
+    h = 0x811C9DC5
+    for b in text.encode("ascii"):
+        h ^= b
+        h = (h * 0x01000193) & 0xFFFFFFFF
+    return f"{h:08x}"
+
+
+@lru_cache(maxsize=1)
+def extractor_checksum() -> str:
+    """Checksum del extractor: huella de su salida sobre `probe_landmarks()`.
+
+    Un cliente cuyo extractor produce el mismo vector obtiene el mismo checksum.
+    """
+    return fingerprint(extract_feature_vector(probe_landmarks()))
+
+
+def validate_client_feature(fv) -> List[float]:
+    """Convierte el feature enviado por un cliente negociado; ValueError si no es utilizable."""
+    if not isinstance(fv, list) or len(fv) != FEATURE_DIM:
+        raise ValueError(f"feature debe tener {FEATURE_DIM} valores")
+    out = [float(x) for x in fv]
+    if not all(math.isfinite(x) for x in out):
+        raise ValueError("feature con valores no finitos")
+    return out
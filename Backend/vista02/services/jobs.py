@@ -0,0 +1,171 @@
+"""Trabajos de entrenamiento en segundo plano (hilo en proceso).
+
+Cada propietario tiene a lo sumo un entrenamiento activo: si ya hay uno en curso,
+`start_training_job` devuelve ese mismo trabajo en lugar de lanzar otro. Entre todos
+los propietarios corren como máximo settings.VISTA02_MAX_TRAINING_JOBS a la vez; el
+resto queda en estado "queued" hasta que se libera un hueco.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+
+from ..models import DEFAULT_OWNER
+from .training import train_from_samples
+
+# Estados posibles de un trabajo
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Trabajos terminados que se conservan para consulta
+MAX_FINISHED_JOBS = 20
+DEFAULT_MAX_CONCURRENT = 2
+
+_LOCK = threading.Lock()
+_JOBS: "OrderedDict[str, dict]" = OrderedDict()
+_ACTIVE_JOBS: Dict[str, str] = {}  # propietario -> job_id
+_SLOTS: Optional[threading.BoundedSemaphore] = None
+
+
+def _slots() -> threading.BoundedSemaphore:
+    global _SLOTS
+    with _LOCK:
+        if _SLOTS is None:
+            _SLOTS = threading.BoundedSemaphore(
+                max(1, int(getattr(settings, "VISTA02_MAX_TRAINING_JOBS", DEFAULT_MAX_CONCURRENT)))
+            )
+        return _SLOTS
+
+
+def _snapshot(job: dict) -> dict:
+    started = job["started_at"]
+    finished = job["finished_at"]
+    elapsed = None
+    if started is not None:
+        elapsed = round((finished or time.time()) - started, 3)
+    return {
+        "job_id": job["id"],
+        "owner": job["owner"],
+        "state": job["state"],
+        "samples_read": job["samples_read"],
+        "letters_total": job["letters_total"],
+        "letters_done": job["letters_done"],
+        "elapsed": elapsed,
+        "model_id": job["model_id"],
+        "error": job["error"],
+        "include_archive": job["include_archive"],
+    }
+
+
+def _update(job_id: str, **fields) -> None:
+    with _LOCK:
+        job = _JOBS.get(job_id)
+        if job is not None:
+            job.update(fields)
+
+
+def _prune_finished() -> None:
+    finished = [jid for jid, j in _JOBS.items() if j["state"] in (SUCCEEDED, FAILED)]
+    for jid in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _JOBS[jid]
+
+
+def _run_job(job_id: str, on_success: Optional[Callable[[], None]] = None) -> None:
+    """Ejecuta el entrenamiento y registra su resultado en el trabajo."""
+    with _LOCK:
+        owner = _JOBS[job_id]["owner"]
+        include_archive = _JOBS[job_id]["include_archive"]
+    _update(job_id, state=RUNNING, started_at=time.time())
+    try:
+        model = train_from_samples(
+            progress=lambda **kw: _update(job_id, **kw), owner=owner, include_archive=include_archive
+        )
+        if model is None:
+            _update(job_id, state=FAILED, error="No hay muestras para entrenar")
+        else:
+            _update(job_id, state=SUCCEEDED, model_id=model.id)
+            # Solo invalidar cachés cuando el modelo nuevo ya está persistido
+            if on_success is not None:
+                on_success()
+    except Exception as e:
+        _update(job_id, state=FAILED, error=str(e))
+    finally:
+        with _LOCK:
+            job = _JOBS.get(job_id)
+            if job is not None:
+                job["finished_at"] = time.time()
+            if _ACTIVE_JOBS.get(owner) == job_id:
+                del _ACTIVE_JOBS[owner]
+            _prune_finished()
+
+
+def _thread_main(job_id: str, on_success: Optional[Callable[[], None]]) -> None:
+    slots = _slots()
+    try:
+        with slots:
+            _run_job(job_id, on_success)
+    finally:
+        # El hilo abre su propia conexión a la BD; cerrarla al terminar
+        connection.close()
+
+
+def _spawn(job_id: str, on_success: Optional[Callable[[], None]]) -> None:
+    t = threading.Thread(target=_thread_main, args=(job_id, on_success), name=f"train-{job_id[:8]}", daemon=True)
+    t.start()
+
+
+def start_training_job(
+    on_success: Optional[Callable[[], None]] = None,
+    owner: str = DEFAULT_OWNER,
+    include_archive: Optional[bool] = None,
+) -> Tuple[dict, bool]:
+    """Lanza en segundo plano el entrenamiento del modelo de `owner`.
+
+    Devuelve (estado_del_trabajo, creado). Si ese propietario ya tiene uno activo,
+    `creado` es False y se devuelve el trabajo existente (con sus propias opciones).
+    `include_archive` se pasa a `train_from_samples`; None usa
+    settings.VISTA02_TRAIN_INCLUDE_ARCHIVE.
+    """
+    with _LOCK:
+        active_id = _ACTIVE_JOBS.get(owner)
+        if active_id is not None and active_id in _JOBS:
+            return _snapshot(_JOBS[active_id]), False
+        job_id = uuid.uuid4().hex
+        _JOBS[job_id] = {
+            "id": job_id,
+            "owner": owner,
+            "state": QUEUED,
+            "samples_read": 0,
+            "letters_total": 0,
+            "letters_done": 0,
+            "started_at": None,
+            "finished_at": None,
+            "model_id": None,
+            "error": None,
+            "include_archive": include_archive,
+        }
+        _ACTIVE_JOBS[owner] = job_id
+        snap = _snapshot(_JOBS[job_id])
+    _spawn(job_id, on_success)
+    return snap, True
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    with _LOCK:
+        job = _JOBS.get(job_id)
+        return _snapshot(job) if job is not None else None
+
+
+def active_job(owner: str = DEFAULT_OWNER) -> Optional[dict]:
+    with _LOCK:
+        job_id = _ACTIVE_JOBS.get(owner)
+        if job_id is None or job_id not in _JOBS:
+            return None
+        return _snapshot(_JOBS[job_id])
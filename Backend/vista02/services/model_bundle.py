@@ -0,0 +1,140 @@
+"""Paquete binario compacto del modelo para inferencia en el cliente.
+
+Formato (little-endian, versión FORMAT_VERSION):
+
+    "V2MB"  u16 versión  u32 largo_cabecera
+    cabecera JSON utf-8 (rellena con espacios hasta múltiplo de 4)
+    payload:
+      int8     float32 offset[dim], float32 scale[dim], int8 q[letras x dim]
+               centroide = offset + (q + 128) * scale   (cuantización afín por dimensión)
+      float16  float16 c[letras x dim]
+
+La cabecera lleva letras (en el orden de las filas), umbrales, las tolerancias de forma de
+`trainer._matches_shape` y la huella del extractor, así que el cliente tiene todo lo que
+usa `predict_with_thresholds`. El contenido es determinista para un modelo y codificación:
+su sha256 lo identifica y puede servirse como inmutable.
+"""
+
+import hashlib
+import json
+import struct
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .feature_extractor import FEATURE_DIM, extractor_checksum
+from .trainer import SHAPE_GROUPS, SHAPE_MIN_DIM, SHAPE_TOLERANCES
+
+MAGIC = b"V2MB"
+FORMAT_VERSION = 1
+ENCODINGS = ("int8", "float16")
+_PREFIX = struct.Struct("<4sHI")
+# Paquetes recordados por digest (pocos modelos activos a la vez)
+MAX_BUNDLES = 256
+
+_LOCK = threading.Lock()
+_BUNDLES: "OrderedDict[str, bytes]" = OrderedDict()      # digest -> bytes
+_BY_MODEL: Dict[Tuple[int, str], str] = {}                # (model_id, codificación) -> digest
+
+
+def _quantize_int8(C: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    if not len(C):
+        return np.zeros(C.shape[1], np.float32), np.ones(C.shape[1], np.float32), np.zeros(C.shape, np.int8)
+    lo = C.min(axis=0)
+    span = C.max(axis=0) - lo
+    scale = np.where(span > 0, span / 255.0, 1.0).astype(np.float32)
+    offset = lo.astype(np.float32)
+    q = np.clip(np.rint((C - offset) / scale) - 128, -128, 127).astype(np.int8)
+    return offset, scale, q
+
+
+def encode(model: dict, encoding: str = "int8") -> bytes:
+    """Serializa una entrada de modelo (centroides y umbrales) en el formato del paquete."""
+    if encoding not in ENCODINGS:
+        raise ValueError(f"codificación no soportada: {encoding}")
+    centroids = model.get("centroids") or {}
+    thresholds = model.get("thresholds") or {}
+    letters = sorted(centroids)
+    dim = min((len(centroids[L]) for L in letters), default=0)
+    C = np.asarray([centroids[L][:dim] for L in letters], dtype=np.float64).reshape(len(letters), dim)
+
+    if encoding == "int8":
+        offset, scale, q = _quantize_int8(C)
+        payload = offset.astype("<f4").tobytes() + scale.astype("<f4").tobytes() + q.tobytes()
+    else:
+        payload = C.astype("<f2").tobytes()
+
+    created = model.get("created_at")
+    header = {
+        "model_id": model.get("id"),
+        "owner": model.get("owner"),
+        "created_at": created.isoformat() if hasattr(created, "isoformat") else created,
+        "feature_version": model.get("feature_version"),
+        "feature_checksum": extractor_checksum(),
+        "feature_dim": FEATURE_DIM,
+        "encoding": encoding,
+        "dim": dim,
+        "letters": letters,
+        "thresholds": [float(thresholds.get(L, 0.0) or 0.0) for L in letters],
+        "shape": {
+            "min_dim": SHAPE_MIN_DIM,
+            "groups": {g: {"tol": SHAPE_TOLERANCES[g], "idx": idxs} for g, idxs in SHAPE_GROUPS.items()},
+        },
+    }
+    raw = json.dumps(header, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    raw += b" " * (-(len(raw) + _PREFIX.size) % 4)
+    return _PREFIX.pack(MAGIC, FORMAT_VERSION, len(raw)) + raw + payload
+
+
+def decode(data: bytes) -> dict:
+    """Inverso de `encode`: cabecera más centroides (listas de float) y umbrales por letra."""
+    magic, version, hlen = _PREFIX.unpack_from(data, 0)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError("paquete de modelo no reconocido")
+    start = _PREFIX.size
+    header = json.loads(data[start:start + hlen].decode("utf-8"))
+    pos = start + hlen
+    n, dim = len(header["letters"]), header["dim"]
+    if header["encoding"] == "int8":
+        offset = np.frombuffer(data, "<f4", dim, pos)
+        scale = np.frombuffer(data, "<f4", dim, pos + 4 * dim)
+        q = np.frombuffer(data, np.int8, n * dim, pos + 8 * dim).reshape(n, dim)
+        C = offset.astype(np.float64) + (q.astype(np.float64) + 128) * scale.astype(np.float64)
+    else:
+        C = np.frombuffer(data, "<f2", n * dim, pos).reshape(n, dim).astype(np.float64)
+    return {
+        **header,
+        "centroids": {L: C[i].tolist() for i, L in enumerate(header["letters"])},
+        "thresholds": dict(zip(header["letters"], header["thresholds"])),
+    }
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def bundle_for(model: dict, encoding: str = "int8") -> Tuple[str, bytes]:
+    """(digest, bytes) del paquete de `model`; se calcula una vez por modelo y codificación."""
+    key = (model["id"], encoding)
+    with _LOCK:
+        d = _BY_MODEL.get(key)
+        if d is not None and d in _BUNDLES:
+            _BUNDLES.move_to_end(d)
+            return d, _BUNDLES[d]
+    data = encode(model, encoding)
+    d = digest(data)
+    with _LOCK:
+        _BUNDLES[d] = data
+        _BY_MODEL[key] = d
+        while len(_BUNDLES) > MAX_BUNDLES:
+            old, _ = _BUNDLES.popitem(last=False)
+            for k in [k for k, v in _BY_MODEL.items() if v == old]:
+                del _BY_MODEL[k]
+    return d, data
+
+
+def lookup(d: str) -> Optional[bytes]:
+    with _LOCK:
+        return _BUNDLES.get(d)
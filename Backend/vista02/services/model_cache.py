@@ -0,0 +1,121 @@
+"""Caché LRU en memoria de modelos entrenados, acotada por número de entradas y por bytes.
+
+Cada propietario (perfil) tiene su propio TrainingModel; solo los usados recientemente
+se mantienen cargados. Al superar `max_entries` o `max_bytes` se expulsan los menos
+recientes. También se cachea la ausencia de modelo para no consultar la BD en cada frame.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from django.conf import settings
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def estimate_size(obj: Any) -> int:
+    """Tamaño aproximado en bytes de una estructura de dicts/listas/escalares."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(estimate_size(v) for v in obj)
+    return size
+
+
+class ModelCache:
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # clave -> (valor, bytes)
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _lookup(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return True, entry[0]
+
+    def put(self, key: str, value: Optional[dict]) -> None:
+        nbytes = estimate_size(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            # Un modelo mayor que todo el presupuesto no se cachea
+            if self.max_bytes and nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            while len(self._entries) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes):
+                _k, (_v, n) = self._entries.popitem(last=False)
+                self._bytes -= n
+                self._evictions += 1
+
+    def get(self, key: str, loader: Callable[[], Optional[dict]]) -> Optional[dict]:
+        found, value = self._lookup(key)
+        if found:
+            return value
+        value = loader()
+        self.put(key, value)
+        return value
+
+    async def aget(self, key: str, loader: Callable[[], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        found, value = self._lookup(key)
+        if found:
+            return value
+        value = await loader()
+        self.put(key, value)
+        return value
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """Descarta la entrada de `key` o, sin clave, todas."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else None,
+            }
+
+
+_CACHE: Optional[ModelCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_model_cache() -> ModelCache:
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = ModelCache(
+                    getattr(settings, "VISTA02_MODEL_CACHE_ENTRIES", DEFAULT_MAX_ENTRIES),
+                    getattr(settings, "VISTA02_MODEL_CACHE_BYTES", DEFAULT_MAX_BYTES),
+                )
+    return _CACHE
@@ -0,0 +1,306 @@
+"""Registro opcional y asíncrono de las predicciones para análisis offline.
+
+`predict` solo añade el resultado a un buffer en memoria acotado (sin tocar la BD ni el
+disco); un hilo en segundo plano lo vacía en lotes grandes a la tabla PredictionLog o a
+un archivo JSONL rotativo. Si el buffer está lleno, el registro nuevo se descarta y se
+cuenta en `dropped`: la predicción nunca espera al log.
+
+Ajustes (settings):
+    VISTA02_PREDICTION_LOG_SAMPLE_RATE   fracción de predicciones registradas (0 = apagado)
+    VISTA02_PREDICTION_LOG_SINK          "db" o "file"
+    VISTA02_PREDICTION_LOG_BUFFER        capacidad del buffer
+    VISTA02_PREDICTION_LOG_BATCH         filas por escritura
+    VISTA02_PREDICTION_LOG_FLUSH_SECONDS intervalo máximo entre escrituras
+    VISTA02_PREDICTION_LOG_FEATURES      guardar también el vector de características
+    VISTA02_PREDICTION_LOG_FILE, VISTA02_PREDICTION_LOG_FILE_MAX_BYTES, VISTA02_PREDICTION_LOG_FILE_BACKUPS
+    VISTA02_PREDICTION_LOG_RETENTION_SECONDS antigüedad máxima de las filas de PredictionLog (None = sin límite)
+    VISTA02_PREDICTION_LOG_MAX_ROWS       tope de filas de PredictionLog (None = sin tope)
+    VISTA02_PREDICTION_LOG_PURGE_SECONDS  cada cuánto el hilo de escritura purga la tabla (0 = nunca)
+    VISTA02_PREDICTION_LOG_PURGE_BATCH    filas borradas por sentencia
+
+Con SINK = "db" la tabla se purga como los datos de vista01: por antigüedad y, por
+encima del tope, las filas más antiguas, en lotes acotados. Lo hace el propio hilo de
+escritura cada PURGE_SECONDS, o `python manage.py purge_prediction_logs` desde cron.
+"""
+
+import atexit
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from ..models import PredictionLog
+
+logger = logging.getLogger(__name__)
+
+SINKS = ("db", "file")
+DEFAULT_BUFFER = 10000
+DEFAULT_BATCH = 500
+DEFAULT_FLUSH_SECONDS = 2.0
+DEFAULT_FILE_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_FILE_BACKUPS = 5
+DEFAULT_RETENTION_SECONDS = 30 * 24 * 3600
+DEFAULT_MAX_ROWS = 1_000_000
+DEFAULT_PURGE_SECONDS = 3600
+DEFAULT_PURGE_BATCH = 500
+
+# Campos del resultado de predict que se registran
+_RESULT_FIELDS = (
+    "letter", "distance", "threshold", "shape_ok", "candidate",
+    "candidate_distance", "dynamic", "accepted_dynamic",
+)
+_BOOL_FIELDS = ("shape_ok", "dynamic", "accepted_dynamic")
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _delete_oldest(qs, limit: Optional[int], batch_size: int, max_batches: Optional[int]) -> int:
+    """Borra por id ascendente hasta `limit` filas de `qs` (todas si es None), en lotes."""
+    total = 0
+    batches = 0
+    while (max_batches is None or batches < max_batches) and (limit is None or total < limit):
+        n = batch_size if limit is None else min(batch_size, limit - total)
+        ids = list(qs.order_by("id").values_list("id", flat=True)[:n])
+        if not ids:
+            break
+        PredictionLog.objects.filter(id__in=ids).delete()
+        total += len(ids)
+        batches += 1
+        if len(ids) < n:
+            break
+    return total
+
+
+def purge_prediction_logs(
+    now=None,
+    retention_seconds: Optional[float] = None,
+    max_rows: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    max_batches: Optional[int] = None,
+) -> dict:
+    """Borra de PredictionLog las filas expiradas y, por encima de `max_rows`, las más antiguas.
+
+    Sin argumentos usa VISTA02_PREDICTION_LOG_RETENTION_SECONDS y VISTA02_PREDICTION_LOG_MAX_ROWS
+    (None en el ajuste desactiva ese criterio). `max_batches` acota los lotes por criterio.
+    Devuelve {"expired": n, "over_cap": n}.
+    """
+    if retention_seconds is None:
+        retention_seconds = _setting("VISTA02_PREDICTION_LOG_RETENTION_SECONDS", DEFAULT_RETENTION_SECONDS)
+    if max_rows is None:
+        max_rows = _setting("VISTA02_PREDICTION_LOG_MAX_ROWS", DEFAULT_MAX_ROWS)
+    batch_size = max(1, int(batch_size or _setting("VISTA02_PREDICTION_LOG_PURGE_BATCH", DEFAULT_PURGE_BATCH)))
+    counts = {"expired": 0, "over_cap": 0}
+    if retention_seconds is not None:
+        cutoff = (now or timezone.now()) - timedelta(seconds=retention_seconds)
+        counts["expired"] = _delete_oldest(
+            PredictionLog.objects.filter(created_at__lt=cutoff), None, batch_size, max_batches
+        )
+    if max_rows is not None:
+        excess = PredictionLog.objects.count() - max(0, int(max_rows))
+        if excess > 0:
+            counts["over_cap"] = _delete_oldest(PredictionLog.objects.all(), excess, batch_size, max_batches)
+    return counts
+
+
+class PredictionLogger:
+    def __init__(
+        self,
+        sample_rate: float,
+        sink: str = "db",
+        capacity: int = DEFAULT_BUFFER,
+        batch_size: int = DEFAULT_BATCH,
+        flush_seconds: float = DEFAULT_FLUSH_SECONDS,
+        with_features: bool = True,
+        file_path: Optional[Path] = None,
+        file_max_bytes: int = DEFAULT_FILE_MAX_BYTES,
+        file_backups: int = DEFAULT_FILE_BACKUPS,
+        purge_seconds: float = 0.0,
+    ):
+        self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+        self.sink = sink if sink in SINKS else "db"
+        self.capacity = max(1, int(capacity))
+        self.batch_size = max(1, int(batch_size))
+        self.flush_seconds = float(flush_seconds)
+        self.with_features = bool(with_features)
+        self.file_path = Path(file_path) if file_path else None
+        self.file_max_bytes = int(file_max_bytes)
+        self.file_backups = int(file_backups)
+        self.purge_seconds = float(purge_seconds or 0.0)
+        self._last_purge = time.monotonic()
+        self._buf: deque = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flush_lock = threading.Lock()  # una escritura a la vez (hilo o flush manual)
+        self._thread: Optional[threading.Thread] = None
+        self._handler: Optional[RotatingFileHandler] = None
+        self._counters = {"enqueued": 0, "dropped": 0, "written": 0, "failed": 0, "flushes": 0, "purged": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def record(self, owner: str, model_id: Optional[int], result: dict, feature=None) -> bool:
+        """Encola el resultado de una predicción si toca muestrearla. Nunca bloquea."""
+        if self.sample_rate <= 0 or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            return False
+        row = {f: result.get(f) for f in _RESULT_FIELDS}
+        for f in _BOOL_FIELDS:
+            row[f] = bool(row[f])  # columnas NOT NULL
+        row["owner"] = owner
+        row["model_id"] = model_id
+        row["created_at"] = timezone.now()
+        row["feature_vector"] = list(feature) if (self.with_features and feature is not None) else None
+        with self._lock:
+            if len(self._buf) >= self.capacity:
+                self._counters["dropped"] += 1
+                return False
+            self._buf.append(row)
+            self._counters["enqueued"] += 1
+            full = len(self._buf) >= self.batch_size
+        self._ensure_thread()
+        if full:
+            self._wake.set()
+        return True
+
+    # ----- escritura -----
+    def _take(self) -> list:
+        with self._lock:
+            n = min(len(self._buf), self.batch_size)
+            return [self._buf.popleft() for _ in range(n)]
+
+    def _write_db(self, rows: list) -> None:
+        PredictionLog.objects.bulk_create([PredictionLog(**r) for r in rows], batch_size=self.batch_size)
+
+    def _write_file(self, rows: list) -> None:
+        if self._handler is None:
+            path = self.file_path or Path(settings.BASE_DIR) / "logs" / "predictions.jsonl"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._handler = RotatingFileHandler(
+                path, maxBytes=self.file_max_bytes, backupCount=self.file_backups, encoding="utf-8"
+            )
+        h = self._handler
+        for r in rows:
+            line = json.dumps({**r, "created_at": r["created_at"].isoformat()}, ensure_ascii=False)
+            h.emit(logging.makeLogRecord({"msg": line, "levelno": logging.INFO, "levelname": "INFO"}))
+        h.flush()
+
+    def flush(self) -> int:
+        """Escribe todo lo pendiente en lotes. Devuelve las filas escritas."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                rows = self._take()
+                if not rows:
+                    break
+                try:
+                    if self.sink == "file":
+                        self._write_file(rows)
+                    else:
+                        self._write_db(rows)
+                except Exception as e:
+                    with self._lock:
+                        self._counters["failed"] += len(rows)
+                    logger.warning(f"Vista02: no se pudo escribir el log de predicciones: {e}")
+                    break
+                written += len(rows)
+                with self._lock:
+                    self._counters["written"] += len(rows)
+                    self._counters["flushes"] += 1
+        return written
+
+    def _maybe_purge(self) -> None:
+        # Solo la tabla se purga aquí; el JSONL ya rota por tamaño
+        if self.sink != "db" or self.purge_seconds <= 0:
+            return
+        if time.monotonic() - self._last_purge < self.purge_seconds:
+            return
+        self._last_purge = time.monotonic()
+        counts = purge_prediction_logs()
+        with self._lock:
+            self._counters["purged"] += counts["expired"] + counts["over_cap"]
+
+    def _flush_once(self) -> None:
+        """Una vuelta del hilo: cualquier error se registra y el hilo sigue vivo."""
+        try:
+            close_old_connections()
+            self.flush()
+            self._maybe_purge()
+        except Exception as e:
+            logger.warning(f"Vista02: fallo en el hilo del log de predicciones: {e}")
+        finally:
+            # El hilo abre su propia conexión a la BD; no mantenerla entre lotes
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _loop(self) -> None:
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self._flush_once()
+
+    def _ensure_thread(self) -> None:
+        t = self._thread
+        if t is not None and t.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                # Primer uso, o el hilo anterior murió: se lanza uno nuevo
+                self._thread = threading.Thread(target=self._loop, name="vista02-prediction-log", daemon=True)
+                self._thread.start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "buffered": len(self._buf),
+                "capacity": self.capacity,
+                "sample_rate": self.sample_rate,
+                "sink": self.sink,
+            }
+
+
+_LOGGER: Optional[PredictionLogger] = None
+_LOGGER_LOCK = threading.Lock()
+
+
+def get_prediction_logger() -> PredictionLogger:
+    global _LOGGER
+    if _LOGGER is None:
+        with _LOGGER_LOCK:
+            if _LOGGER is None:
+                _LOGGER = PredictionLogger(
+                    sample_rate=_setting("VISTA02_PREDICTION_LOG_SAMPLE_RATE", 0.0),
+                    sink=_setting("VISTA02_PREDICTION_LOG_SINK", "db"),
+                    capacity=_setting("VISTA02_PREDICTION_LOG_BUFFER", DEFAULT_BUFFER),
+                    batch_size=_setting("VISTA02_PREDICTION_LOG_BATCH", DEFAULT_BATCH),
+                    flush_seconds=_setting("VISTA02_PREDICTION_LOG_FLUSH_SECONDS", DEFAULT_FLUSH_SECONDS),
+                    with_features=_setting("VISTA02_PREDICTION_LOG_FEATURES", True),
+                    file_path=_setting("VISTA02_PREDICTION_LOG_FILE", None),
+                    file_max_bytes=_setting("VISTA02_PREDICTION_LOG_FILE_MAX_BYTES", DEFAULT_FILE_MAX_BYTES),
+                    file_backups=_setting("VISTA02_PREDICTION_LOG_FILE_BACKUPS", DEFAULT_FILE_BACKUPS),
+                    purge_seconds=_setting("VISTA02_PREDICTION_LOG_PURGE_SECONDS", DEFAULT_PURGE_SECONDS),
+                )
+                atexit.register(_flush_at_exit)
+    return _LOGGER
+
+
+def _flush_at_exit() -> None:
+    if _LOGGER is not None and _LOGGER.enabled:
+        try:
+            _LOGGER.flush()
+        except Exception:
+            pass
@@ -0,0 +1,313 @@
+"""Perfilado opcional de vistas de vista02 en producción.
+
+Una fracción de las peticiones a las vistas elegidas (settings.VISTA02_PROFILER_VIEWS)
+se ejecuta bajo un perfilador y sus estadísticas se acumulan en memoria por vista:
+
+- modo "cprofile": cProfile, agregado con pstats (volcable en formato .pstats);
+- modo "sample": muestreo de la pila del hilo cada VISTA02_PROFILER_INTERVAL segundos,
+  agregado como pilas colapsadas ("a;b;c N", formato de flamegraph).
+
+Se activa con VISTA02_PROFILER_SAMPLE_RATE > 0 o, petición a petición, enviando la
+cabecera X-Profiler-Token con el valor de VISTA02_PROFILER_TOKEN. Sin ninguno de los
+dos el envoltorio solo comprueba un booleano y llama a la vista.
+
+Solo se perfila una petición a la vez; si otra ya lo está, la nueva corre sin perfilar.
+En vistas async el perfil cubre el hilo del event loop mientras la vista está en curso,
+así que puede incluir trabajo de otras corrutinas intercaladas. El trabajo que la petición
+manda al pool de CPU (`executor.run_cpu`, lotes de `batching`) también se perfila: `bind`
+envuelve la función para que el hilo del pool active su propio cProfile, o se registre en
+el muestreador, mientras la ejecuta; al terminar la petición todo se suma al agregado.
+"""
+
+import asyncio
+import contextvars
+import cProfile
+import functools
+import hmac
+import io
+import marshal
+import pstats
+import random
+import sys
+import threading
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+MODES = ("cprofile", "sample")
+DEFAULT_INTERVAL = 0.005
+# Profundidad máxima de pila registrada por muestra
+MAX_STACK_DEPTH = 64
+
+_config: Optional[dict] = None
+_BUSY = threading.Lock()      # una petición perfilada a la vez
+_STATS_LOCK = threading.Lock()
+_PSTATS: Dict[str, pstats.Stats] = {}
+_STACKS: Dict[str, Counter] = {}
+_COUNTS: Counter = Counter()  # peticiones perfiladas por vista
+# Perfil en curso de la petición (lo heredan sus corrutinas; `bind` lo lleva al pool)
+_ACTIVE: contextvars.ContextVar = contextvars.ContextVar("vista02_profiler_run", default=None)
+# Criterios de orden admitidos por `pstats_text`
+SORT_KEYS = frozenset(k.value for k in pstats.SortKey)
+
+
+def _load_config() -> dict:
+    global _config
+    rate = float(getattr(settings, "VISTA02_PROFILER_SAMPLE_RATE", 0.0) or 0.0)
+    token = getattr(settings, "VISTA02_PROFILER_TOKEN", "") or ""
+    mode = getattr(settings, "VISTA02_PROFILER_MODE", "cprofile")
+    _config = {
+        "active": rate > 0 or bool(token),
+        "rate": rate,
+        "token": token,
+        "views": frozenset(getattr(settings, "VISTA02_PROFILER_VIEWS", ())),
+        "mode": mode if mode in MODES else "cprofile",
+        "interval": float(getattr(settings, "VISTA02_PROFILER_INTERVAL", DEFAULT_INTERVAL)),
+    }
+    return _config
+
+
+def _on_setting_changed(setting, **kwargs):
+    global _config
+    if setting.startswith("VISTA02_PROFILER_"):
+        _config = None
+
+
+setting_changed.connect(_on_setting_changed)
+
+
+def token_matches(request) -> bool:
+    cfg = _config or _load_config()
+    if not cfg["token"]:
+        return False
+    # Comparación en tiempo constante: no revela cuántos caracteres coinciden
+    sent = request.META.get("HTTP_X_PROFILER_TOKEN") or ""
+    return hmac.compare_digest(sent.encode("utf-8"), str(cfg["token"]).encode("utf-8"))
+
+
+def _should_profile(name: str, request) -> bool:
+    cfg = _config or _load_config()
+    if not cfg["active"] or name not in cfg["views"]:
+        return False
+    if token_matches(request):
+        return True
+    return cfg["rate"] > 0 and random.random() < cfg["rate"]
+
+
+# ========== Perfiladores ==========
+class _CProfileRun:
+    def __init__(self, name: str, _interval: float):
+        self.name = name
+        self.prof = cProfile.Profile()
+        self._lock = threading.Lock()
+        self._extra = []  # perfiles de los hilos del pool
+        self._closed = False
+
+    def start(self):
+        self.prof.enable()
+
+    def call(self, fn, *args, **kwargs):
+        """Ejecuta `fn` en el hilo actual (del pool) con un cProfile propio."""
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            prof.disable()
+            with self._lock:
+                if not self._closed:
+                    self._extra.append(prof)
+
+    def stop(self):
+        self.prof.disable()
+        with self._lock:
+            self._closed = True
+            extra = self._extra
+        with _STATS_LOCK:
+            agg = _PSTATS.get(self.name)
+            if agg is None:
+                _PSTATS[self.name] = pstats.Stats(self.prof, *extra)
+            else:
+                agg.add(self.prof, *extra)
+
+
+def _collapse(frame) -> str:
+    parts = []
+    while frame is not None and len(parts) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class _SamplerRun:
+    """Muestrea la pila del hilo que atiende la petición (y de los hilos del pool que
+    trabajan para ella) desde un hilo auxiliar."""
+
+    def __init__(self, name: str, interval: float):
+        self.name = name
+        self.interval = max(0.0005, interval)
+        self.targets = Counter({threading.get_ident(): 1})
+        self.stacks: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="vista02-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                targets = list(self.targets)
+            frames = sys._current_frames()
+            for ident in targets:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[_collapse(frame)] += 1
+
+    def call(self, fn, *args, **kwargs):
+        """Ejecuta `fn` con el hilo actual (del pool) registrado en el muestreador."""
+        ident = threading.get_ident()
+        with self._lock:
+            self.targets[ident] += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.targets[ident] -= 1
+                if self.targets[ident] <= 0:
+                    del self.targets[ident]
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        with _STATS_LOCK:
+            _STACKS.setdefault(self.name, Counter()).update(self.stacks)
+
+
+def current_run():
+    """Perfil en curso de la petición actual, o None."""
+    return _ACTIVE.get()
+
+
+def adopt(run) -> None:
+    """Hace de `run` el perfil en curso del contexto actual (p. ej. una tarea que trabaja
+    para una petición perfilada que no la creó)."""
+    if run is not None:
+        _ACTIVE.set(run)
+
+
+def bind(fn: Callable, run=None) -> Callable:
+    """`fn` preparada para otro hilo: si hay un perfil en curso (`run` o el de la petición
+    actual), el hilo que la ejecute se perfila bajo él. Sin perfil devuelve `fn` tal cual."""
+    run = run or _ACTIVE.get()
+    if run is None:
+        return fn
+    return functools.partial(run.call, fn)
+
+
+def _begin(name: str):
+    if not _BUSY.acquire(blocking=False):
+        return None
+    cfg = _config or _load_config()
+    run = (_SamplerRun if cfg["mode"] == "sample" else _CProfileRun)(name, cfg["interval"])
+    run.start()
+    return run
+
+
+def _end(run) -> None:
+    try:
+        run.stop()
+        with _STATS_LOCK:
+            _COUNTS[run.name] += 1
+    finally:
+        _BUSY.release()
+
+
+def profiled(name: str):
+    """Decorador para vistas (sync o async) que pueden perfilarse bajo el nombre `name`."""
+
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                run = _begin(name) if (_config or _load_config())["active"] and _should_profile(name, request) else None
+                if run is None:
+                    return await view(request, *args, **kwargs)
+                token = _ACTIVE.set(run)
+                try:
+                    return await view(request, *args, **kwargs)
+                finally:
+                    _ACTIVE.reset(token)
+                    _end(run)
+
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            run = _begin(name) if (_config or _load_config())["active"] and _should_profile(name, request) else None
+            if run is None:
+                return view(request, *args, **kwargs)
+            token = _ACTIVE.set(run)
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                _ACTIVE.reset(token)
+                _end(run)
+
+        return wrapper
+
+    return decorator
+
+
+# ========== Consulta y volcado ==========
+def summary() -> dict:
+    cfg = _config or _load_config()
+    with _STATS_LOCK:
+        return {
+            "mode": cfg["mode"],
+            "sample_rate": cfg["rate"],
+            "views": sorted(cfg["views"]),
+            "profiled_requests": dict(_COUNTS),
+            "pstats_views": sorted(_PSTATS),
+            "sampled_views": sorted(_STACKS),
+        }
+
+
+def pstats_text(name: str, limit: int = 40, sort: str = "cumulative") -> Optional[str]:
+    """Top de funciones de la vista; ValueError si `sort` no es un valor de pstats.SortKey."""
+    if sort not in SORT_KEYS:
+        raise ValueError(f"sort debe ser uno de: {', '.join(sorted(SORT_KEYS))}")
+    with _STATS_LOCK:
+        agg = _PSTATS.get(name)
+        if agg is None:
+            return None
+        out = io.StringIO()
+        agg.stream = out
+        agg.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+def pstats_bytes(name: str) -> Optional[bytes]:
+    """Estadísticas agregadas en el formato de `pstats.Stats.dump_stats` (legible con `python -m pstats`)."""
+    with _STATS_LOCK:
+        agg = _PSTATS.get(name)
+        return marshal.dumps(agg.stats) if agg is not None else None
+
+
+def collapsed_stacks(name: str) -> Optional[str]:
+    with _STATS_LOCK:
+        stacks = _STACKS.get(name)
+        if stacks is None:
+            return None
+        return "".join(f"{stack} {n}\n" for stack, n in stacks.most_common())
+
+
+def reset() -> None:
+    with _STATS_LOCK:
+        _PSTATS.clear()
+        _STACKS.clear()
+        _COUNTS.clear()
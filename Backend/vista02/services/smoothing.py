@@ -0,0 +1,181 @@
+"""Suavizado temporal de predicciones por sesión, en el servidor.
+
+Replica en el backend la ventana de estabilidad del frontend (useOptimizedRecognition):
+de los últimos frames de una sesión dentro de `window_seconds`, gana la letra con mayor
+suma de confianza y `stability` es la fracción de frames de la ventana que la votan.
+
+Memoria acotada: todas las sesiones comparten un bloque numpy preasignado de
+`max_sessions` x `window_frames` (código de letra int16, confianza float32, instante
+float64; 14 bytes por frame). Cada sesión ocupa una fila como buffer circular. Las sesiones
+sin frames en `ttl` segundos se liberan y, con el bloque lleno, se recicla la menos reciente.
+
+Ajustes (settings):
+    VISTA02_SMOOTHING_SESSIONS        sesiones simultáneas como máximo
+    VISTA02_SMOOTHING_WINDOW_FRAMES   frames por sesión (tamaño del buffer circular)
+    VISTA02_SMOOTHING_WINDOW_SECONDS  antigüedad máxima de un frame para votar
+    VISTA02_SMOOTHING_TTL_SECONDS     inactividad tras la que se olvida una sesión
+    VISTA02_SMOOTHING_STABLE_RATIO    `stability` mínima para marcar el resultado estable
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+import numpy as np
+from django.conf import settings
+
+DEFAULT_SESSIONS = 10000
+DEFAULT_WINDOW_FRAMES = 8
+DEFAULT_WINDOW_SECONDS = 0.5
+DEFAULT_TTL_SECONDS = 60.0
+DEFAULT_STABLE_RATIO = 0.7
+NO_LETTER = -1
+
+
+def confidence(distance: Optional[float], threshold: Optional[float]) -> float:
+    """Confianza en [0.5, 1] para una letra aceptada (distancia <= umbral), 0 si no hay umbral."""
+    if distance is None or not threshold:
+        return 0.0
+    return max(0.0, min(1.0, 1.0 - 0.5 * float(distance) / float(threshold)))
+
+
+class SessionSmoother:
+    def __init__(
+        self,
+        max_sessions: int = DEFAULT_SESSIONS,
+        window_frames: int = DEFAULT_WINDOW_FRAMES,
+        window_seconds: float = DEFAULT_WINDOW_SECONDS,
+        ttl: float = DEFAULT_TTL_SECONDS,
+        stable_ratio: float = DEFAULT_STABLE_RATIO,
+    ):
+        self.max_sessions = max(1, int(max_sessions))
+        self.window_frames = max(1, int(window_frames))
+        self.window_seconds = float(window_seconds)
+        self.ttl = float(ttl)
+        self.stable_ratio = float(stable_ratio)
+        shape = (self.max_sessions, self.window_frames)
+        self._codes = np.full(shape, NO_LETTER, dtype=np.int16)
+        self._conf = np.zeros(shape, dtype=np.float32)
+        self._times = np.zeros(shape, dtype=np.float64)
+        self._head = np.zeros(self.max_sessions, dtype=np.int32)  # próxima posición a escribir
+        self._slots: "OrderedDict[Hashable, int]" = OrderedDict()  # sesión -> fila, de más a menos antigua
+        self._last_seen: Dict[Hashable, float] = {}
+        self._free = list(range(self.max_sessions - 1, -1, -1))
+        self._letters: Dict[str, int] = {}
+        self._names: list = []
+        self._lock = threading.Lock()
+        self._counters = {"updates": 0, "expired": 0, "recycled": 0}
+
+    def _code(self, letter: Optional[str]) -> int:
+        if not letter:
+            return NO_LETTER
+        code = self._letters.get(letter)
+        if code is None:
+            code = len(self._names)
+            self._letters[letter] = code
+            self._names.append(letter)
+        return code
+
+    def _release(self, session: Hashable) -> None:
+        row = self._slots.pop(session)
+        self._last_seen.pop(session, None)
+        self._free.append(row)
+
+    def _expire(self, now: float) -> None:
+        # Las sesiones están ordenadas por último uso: basta mirar las primeras
+        while self._slots:
+            oldest = next(iter(self._slots))
+            if now - self._last_seen[oldest] < self.ttl:
+                break
+            self._release(oldest)
+            self._counters["expired"] += 1
+
+    def _slot(self, session: Hashable) -> int:
+        row = self._slots.get(session)
+        if row is not None:
+            self._slots.move_to_end(session)
+            return row
+        if not self._free:
+            self._release(next(iter(self._slots)))
+            self._counters["recycled"] += 1
+        row = self._free.pop()
+        self._codes[row].fill(NO_LETTER)
+        self._times[row].fill(0.0)
+        self._head[row] = 0
+        self._slots[session] = row
+        return row
+
+    def update(self, session: Hashable, letter: Optional[str], conf: float, now: Optional[float] = None) -> dict:
+        """Añade el frame de `session` y devuelve la letra estabilizada de su ventana."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            row = self._slot(session)
+            self._last_seen[session] = now
+            pos = int(self._head[row])
+            self._codes[row, pos] = self._code(letter)
+            self._conf[row, pos] = conf
+            self._times[row, pos] = now
+            self._head[row] = (pos + 1) % self.window_frames
+            self._counters["updates"] += 1
+            codes = self._codes[row].tolist()
+            confs = self._conf[row].tolist()
+            times = self._times[row].tolist()
+            names = self._names
+
+        frames = 0
+        scores: Dict[int, float] = {}
+        votes: Dict[int, int] = {}
+        for c, w, t in zip(codes, confs, times):
+            if t <= 0.0 or now - t > self.window_seconds:
+                continue
+            frames += 1
+            if c != NO_LETTER:
+                scores[c] = scores.get(c, 0.0) + w
+                votes[c] = votes.get(c, 0) + 1
+        if not votes:
+            return {"letter": None, "confidence": 0.0, "stability": 0.0, "stable": False, "frames": frames}
+        best = max(votes, key=lambda c: (scores[c], votes[c]))
+        stability = votes[best] / frames
+        return {
+            "letter": names[best],
+            "confidence": round(scores[best] / votes[best], 4),
+            "stability": round(stability, 4),
+            "stable": stability >= self.stable_ratio,
+            "frames": frames,
+        }
+
+    def forget(self, session: Hashable) -> None:
+        with self._lock:
+            if session in self._slots:
+                self._release(session)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "sessions": len(self._slots),
+                "max_sessions": self.max_sessions,
+                "window_frames": self.window_frames,
+                "bytes": int(self._codes.nbytes + self._conf.nbytes + self._times.nbytes + self._head.nbytes),
+            }
+
+
+_SMOOTHER: Optional[SessionSmoother] = None
+_SMOOTHER_LOCK = threading.Lock()
+
+
+def get_smoother() -> SessionSmoother:
+    global _SMOOTHER
+    if _SMOOTHER is None:
+        with _SMOOTHER_LOCK:
+            if _SMOOTHER is None:
+                _SMOOTHER = SessionSmoother(
+                    max_sessions=getattr(settings, "VISTA02_SMOOTHING_SESSIONS", DEFAULT_SESSIONS),
+                    window_frames=getattr(settings, "VISTA02_SMOOTHING_WINDOW_FRAMES", DEFAULT_WINDOW_FRAMES),
+                    window_seconds=getattr(settings, "VISTA02_SMOOTHING_WINDOW_SECONDS", DEFAULT_WINDOW_SECONDS),
+                    ttl=getattr(settings, "VISTA02_SMOOTHING_TTL_SECONDS", DEFAULT_TTL_SECONDS),
+                    stable_ratio=getattr(settings, "VISTA02_SMOOTHING_STABLE_RATIO", DEFAULT_STABLE_RATIO),
+                )
+    return _SMOOTHER
@@ -0,0 +1,235 @@
+"""Snapshot columnar en disco de HandSample para entrenar y evaluar sin releer SQLite.
+
+Estructura del directorio (settings.VISTA02_SNAPSHOT_DIR):
+    manifest.json      versión, dimensión, high-water mark de HandSample.id,
+                       filas por letra e índice de offsets por segmento añadido
+    letter_XXXX.f32    features float32 contiguos de una letra (filas x dim), solo se añade
+    owners/<perfil>/   mismo formato para las muestras de cada propietario
+
+La BD sigue siendo la fuente de verdad: `refresh()` añade las muestras con id mayor
+que el high-water mark y reconstruye el snapshot si detecta borrados. Los lectores solo
+ven las filas que cuenta el manifest, que se reemplaza de forma atómica tras escribir
+los datos, así que una escritura interrumpida nunca queda visible.
+"""
+
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+
+from ..models import DEFAULT_OWNER, HandSample
+from .training import CHUNK_SIZE, LetterArrays, _decode, _reextract, iter_sample_chunks
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+LOCK_FILE = ".lock"
+# Segmentos recordados en el índice de offsets (los más antiguos se descartan)
+MAX_SEGMENTS = 1000
+LOCK_TIMEOUT = 30.0
+STALE_LOCK = 300.0
+OWNERS_DIR = "owners"
+
+
+def snapshot_dir(owner: str = DEFAULT_OWNER) -> Path:
+    root = Path(getattr(settings, "VISTA02_SNAPSHOT_DIR", Path(settings.BASE_DIR) / "snapshots" / "samples"))
+    return root / OWNERS_DIR / owner if owner else root
+
+
+def _letter_file(letter: str) -> str:
+    # Nombre por código de carácter para admitir 'Ñ' en cualquier sistema de archivos
+    return f"letter_{ord(letter):04x}.f32"
+
+
+def _empty_manifest() -> dict:
+    return {
+        "version": FORMAT_VERSION,
+        "dim": None,
+        "high_water_id": 0,
+        "db_rows": 0,    # filas de HandSample cubiertas (incluye las descartadas)
+        "skipped": 0,    # filas sin feature utilizable o de otra dimensión
+        "letters": {},   # {"A": {"file": ..., "rows": n}}
+        "segments": [],  # [{"high_water_id": id, "offsets": {"A": fila_inicial, ...}, "rows": {...}}]
+    }
+
+
+def load_manifest(root: Optional[Path] = None) -> Optional[dict]:
+    path = (root or snapshot_dir()) / MANIFEST
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            man = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if man.get("version") != FORMAT_VERSION:
+        return None
+    return man
+
+
+def _write_manifest(root: Path, man: dict) -> None:
+    tmp = root / (MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(man, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, root / MANIFEST)
+
+
+@contextmanager
+def _dir_lock(root: Path):
+    """Candado entre procesos con O_EXCL (portable también a Windows)."""
+    path = root / LOCK_FILE
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - path.stat().st_mtime > STALE_LOCK:
+                    path.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"snapshot bloqueado: {path}")
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def clear(root: Optional[Path] = None) -> None:
+    """Elimina el snapshot completo (p. ej. tras reiniciar los datos).
+
+    Los snapshots de otros propietarios (subdirectorio owners/) no se tocan.
+    """
+    root = root or snapshot_dir()
+    if not root.exists():
+        return
+    with _dir_lock(root):
+        for name in os.listdir(root):
+            if name in (LOCK_FILE, OWNERS_DIR):
+                continue
+            p = root / name
+            if p.is_dir():
+                shutil.rmtree(p)
+            else:
+                p.unlink()
+
+
+def _is_stale(man: dict, owner: str) -> bool:
+    """True si se borraron muestras ya incluidas en el snapshot."""
+    hwm = man["high_water_id"]
+    if not hwm:
+        return False
+    return HandSample.objects.filter(owner=owner, id__lte=hwm).count() != man["db_rows"]
+
+
+def refresh(root: Optional[Path] = None, chunk_size: int = CHUNK_SIZE, owner: str = DEFAULT_OWNER) -> dict:
+    """Sincroniza el snapshot de `owner` con HandSample añadiendo solo las filas nuevas.
+
+    Devuelve el manifest vigente tras la sincronización.
+    """
+    root = root or snapshot_dir(owner)
+    root.mkdir(parents=True, exist_ok=True)
+    with _dir_lock(root):
+        man = load_manifest(root)
+        if man is None or _is_stale(man, owner):
+            for name in os.listdir(root):
+                if name.endswith(".f32"):
+                    (root / name).unlink()
+            man = _empty_manifest()
+
+        max_id = HandSample.objects.filter(owner=owner).aggregate(m=Max("id"))["m"]
+        if max_id is None or max_id <= man["high_water_id"]:
+            if not (root / MANIFEST).exists():
+                _write_manifest(root, man)
+            return man
+
+        dim = man["dim"]
+        start_rows = {L: info["rows"] for L, info in man["letters"].items()}
+        rows_by_letter = dict(start_rows)
+        handles = {}
+        db_rows = 0
+
+        def counted(chunks):
+            nonlocal db_rows
+            for rows in chunks:
+                db_rows += len(rows)
+                yield rows
+
+        try:
+            for pairs in _reextract(_decode(counted(iter_sample_chunks(chunk_size, max_id, man["high_water_id"], owner)))):
+                per_letter: Dict[str, list] = {}
+                for letter, fv in pairs:
+                    if dim is None:
+                        dim = len(fv)
+                    if len(fv) != dim:
+                        continue
+                    per_letter.setdefault(letter, []).append(fv)
+                for letter, vecs in per_letter.items():
+                    f = handles.get(letter)
+                    if f is None:
+                        path = root / _letter_file(letter)
+                        f = open(path, "r+b" if path.exists() else "w+b")
+                        # Descarta restos de una escritura interrumpida más allá del manifest
+                        f.truncate(rows_by_letter.get(letter, 0) * dim * 4)
+                        f.seek(0, os.SEEK_END)
+                        handles[letter] = f
+                    f.write(np.asarray(vecs, dtype=np.float32).tobytes())
+                    rows_by_letter[letter] = rows_by_letter.get(letter, 0) + len(vecs)
+            for f in handles.values():
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            for f in handles.values():
+                f.close()
+
+        appended = sum(rows_by_letter.values()) - sum(start_rows.values())
+        man["dim"] = dim
+        man["skipped"] += db_rows - appended
+        man["db_rows"] += db_rows
+        man["high_water_id"] = max_id
+        man["letters"] = {L: {"file": _letter_file(L), "rows": n} for L, n in sorted(rows_by_letter.items())}
+        if appended:
+            man["segments"].append({
+                "high_water_id": max_id,
+                "offsets": {L: start_rows.get(L, 0) for L in rows_by_letter},
+                "rows": {L: n - start_rows.get(L, 0) for L, n in rows_by_letter.items() if n != start_rows.get(L, 0)},
+            })
+            man["segments"] = man["segments"][-MAX_SEGMENTS:]
+        _write_manifest(root, man)
+        return man
+
+
+def open_arrays(man: Optional[dict] = None, root: Optional[Path] = None) -> Dict[str, np.memmap]:
+    """Matrices (filas, dim) de solo lectura por letra, mapeadas en memoria."""
+    root = root or snapshot_dir()
+    man = man or load_manifest(root)
+    if not man or not man["dim"]:
+        return {}
+    arrays = {}
+    for letter, info in man["letters"].items():
+        if info["rows"]:
+            arrays[letter] = np.memmap(root / info["file"], dtype=np.float32, mode="r", shape=(info["rows"], man["dim"]))
+    return arrays
+
+
+def snapshot_stream(
+    chunk_size: int = CHUNK_SIZE, man: Optional[dict] = None, root: Optional[Path] = None
+) -> Iterator[LetterArrays]:
+    """Mismo formato que training.sample_stream, leído desde el snapshot."""
+    for letter, mm in open_arrays(man, root).items():
+        for start in range(0, len(mm), chunk_size):
+            yield [(letter, np.asarray(mm[start:start + chunk_size], dtype=np.float64))]
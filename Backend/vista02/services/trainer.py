@@ -50,53 +50,68 @@ _TIPS_SPACING_IDX = [12, 13, 14]  # fingertip spacing adjacents
 _ANGLE_REL_IDX = [15, 16, 17]     # inter-finger direction cosines
 
 
+# Tolerancias estrictas de forma por grupo de features (|fv_i - mu_i| <= tol)
+SHAPE_TOLERANCES: Dict[str, float] = {
+    "curl": 0.14,   # curl de cada dedo
+    "ext": 0.16,    # extensión
+    "opp": 0.12,    # oposición del pulgar (más estricta para casos como 'B')
+    "tips": 0.12,   # espaciamiento de puntas (evita dedos demasiado abiertos)
+    "angle": 0.12,  # relaciones angulares entre dedos
+}
+SHAPE_GROUPS: Dict[str, List[int]] = {
+    "curl": _CURL_IDX,
+    "ext": _EXT_IDX,
+    "opp": _OPP_IDX,
+    "tips": _TIPS_SPACING_IDX,
+    "angle": _ANGLE_REL_IDX,
+}
+# Longitud mínima del vector para poder verificar la forma
+SHAPE_MIN_DIM = 19
+
+
 def _matches_shape(fv: List[float], centroid: List[float]) -> bool:
     """Verifica coincidencia estricta por dedo.
     Reglas:
-      - Cada curl debe estar cerca del centroid: |curl_i - mu_i| <= CURL_TOL
-      - Cada extensión también: |ext_i - mu_i| <= EXT_TOL
+      - Cada curl debe estar cerca del centroid: |curl_i - mu_i| <= SHAPE_TOLERANCES['curl']
+      - Cada extensión también: |ext_i - mu_i| <= SHAPE_TOLERANCES['ext']
+      - Igual para oposición del pulgar, espaciado de puntas y ángulos entre dedos
     Si alguna regla falla, se rechaza aunque la distancia global pase el umbral.
     """
     if not fv or not centroid:
         return False
     m = min(len(fv), len(centroid))
-    if m < 19:
+    if m < SHAPE_MIN_DIM:
         # vector incompleto
         return False
-    CURL_TOL = 0.14   # tolerancia estricta de forma para curl de cada dedo
-    EXT_TOL = 0.16    # tolerancia estricta para extensión
-    OPP_TOL = 0.12    # oposición del pulgar (más estricta para casos como 'B')
-    TIPS_TOL = 0.12   # espaciamiento de puntas (evita dedos demasiado abiertos)
-    ANGL_TOL = 0.12   # relaciones angulares entre dedos
-    for i in _CURL_IDX:
-        if abs(float(fv[i]) - float(centroid[i])) > CURL_TOL:
-            return False
-    for i in _EXT_IDX:
-        if abs(float(fv[i]) - float(centroid[i])) > EXT_TOL:
-            return False
-    for i in _OPP_IDX:
-        if abs(float(fv[i]) - float(centroid[i])) > OPP_TOL:
-            return False
-    for i in _TIPS_SPACING_IDX:
-        if abs(float(fv[i]) - float(centroid[i])) > TIPS_TOL:
-            return False
-    for i in _ANGLE_REL_IDX:
-        if abs(float(fv[i]) - float(centroid[i])) > ANGL_TOL:
-            return False
+    for group, idxs in SHAPE_GROUPS.items():
+        tol = SHAPE_TOLERANCES[group]
+        for i in idxs:
+            if abs(float(fv[i]) - float(centroid[i])) > tol:
+                return False
     return True
 
 
+# Percentil por defecto para los umbrales y umbral mínimo (depende de la escala del feature)
+DEFAULT_PERCENTILE = 0.90
+MIN_THRESH = 0.60
+
+
+def percentile_rank(n: int, percentile: float) -> int:
+    """Índice (0-based) dentro de n distancias ordenadas que corresponde al percentil."""
+    p = max(0.0, min(1.0, percentile))
+    return int(round(p * (n - 1)))
+
+
 def compute_thresholds(
     by_letter: Dict[str, List[List[float]]],
     centroids: Dict[str, List[float]],
-    percentile: float = 0.90,
+    percentile: float = DEFAULT_PERCENTILE,
 ) -> Dict[str, float]:
     """Calcula umbral por letra usando percentil (por defecto P95) de las distancias al centroide.
 
     Esto hace el reconocimiento más estricto y robusto a outliers que media+std.
     """
     thresholds: Dict[str, float] = {}
-    MIN_THRESH = 0.60  # umbral mínimo (depende de la escala del feature)
     for letter, vecs in by_letter.items():
         c = centroids.get(letter)
         if not c or not vecs:
@@ -104,9 +119,7 @@ def compute_thresholds(
         ds = sorted(_l2(v, c) for v in vecs)
         if not ds:
             continue
-        p = max(0.0, min(1.0, percentile))
-        idx = int(round(p * (len(ds) - 1)))
-        thr = max(MIN_THRESH, ds[idx])
+        thr = max(MIN_THRESH, ds[percentile_rank(len(ds), percentile)])
         thresholds[letter] = thr
     return thresholds
 
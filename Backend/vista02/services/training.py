@@ -0,0 +1,475 @@
+"""Entrenamiento del modelo de centroides a partir de las muestras HandSample.
+
+La tabla se recorre en streaming, por bloques de `values_list` ordenados por id,
+a través de una cadena de generadores:
+
+    filas -> decodificación -> re-extracción opcional -> matrices por letra
+
+Los centroides salen de sumas acumuladas por letra (primera pasada) y los umbrales
+por percentil se calculan en pasadas posteriores sobre el mismo stream, refinando
+un histograma de distancias hasta aislar el valor exacto. La memoria pico depende
+del tamaño de bloque y del número de letras, no del número de muestras.
+
+Con `threshold_sketch` (settings.VISTA02_THRESHOLD_SKETCH) los umbrales salen en una
+sola pasada de sketches KLL fusionables por letra (ver quantile_sketch), a cambio de un
+error de rango del orden del 1 %.
+"""
+
+import logging
+from itertools import chain
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+
+from ..models import DEFAULT_OWNER, HandSample, TrainingModel
+from .feature_extractor import FEATURE_VERSION, extract_feature_vector
+from .quantile_sketch import DEFAULT_K, KLLSketch
+from .trainer import DEFAULT_PERCENTILE, MIN_THRESH, percentile_rank
+
+# Filas por consulta a la BD
+CHUNK_SIZE = 2000
+# Resolución del histograma de distancias en cada pasada de refinamiento
+HIST_BINS = 1024
+# Cuando el intervalo del percentil contiene a lo sumo estas distancias, se guardan y ordenan
+EXACT_BUFFER = 4096
+# Tras tantos refinamientos el intervalo está al nivel de la precisión de float64
+MAX_REFINE_DEPTH = 6
+# Veces que se reinicia el refinamiento de una letra si su conteo cambia entre pasadas
+MAX_REFINE_RESTARTS = 3
+
+logger = logging.getLogger(__name__)
+
+Row = Tuple[int, str, Optional[List[float]]]
+LetterArrays = List[Tuple[str, np.ndarray]]
+
+
+def _noop_progress(**_fields) -> None:
+    return None
+
+
+# ========== Etapas del stream ==========
+def iter_sample_chunks(
+    chunk_size: int = CHUNK_SIZE, max_id: Optional[int] = None, after_id: int = 0, owner: str = DEFAULT_OWNER
+) -> Iterator[list]:
+    """Bloques de filas (id, letter, feature_vector) de un propietario por id ascendente (paginación por clave).
+
+    `max_id` fija el corte de la tabla para que varias pasadas vean las mismas filas
+    aunque se inserten muestras nuevas mientras tanto; `after_id` permite leer solo
+    las filas nuevas.
+    """
+    qs = HandSample.objects.filter(owner=owner).order_by("id")
+    if max_id is not None:
+        qs = qs.filter(id__lte=max_id)
+    last_id = after_id
+    while True:
+        rows = list(qs.filter(id__gt=last_id).values_list("id", "letter", "feature_vector")[:chunk_size])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield rows
+
+
+def _decode(chunks: Iterable[list]) -> Iterator[List[Row]]:
+    """Normaliza el feature guardado a lista de floats; None si hay que recalcularlo."""
+    for rows in chunks:
+        out: List[Row] = []
+        for sid, letter, fv in rows:
+            if isinstance(fv, list):
+                try:
+                    fv = [float(x) for x in fv]
+                except (TypeError, ValueError):
+                    fv = None
+            else:
+                fv = None
+            out.append((sid, letter, fv))
+        yield out
+
+
+def _reextract(chunks: Iterable[List[Row]]) -> Iterator[List[Tuple[str, List[float]]]]:
+    """Recalcula el feature desde los landmarks solo para las filas que no lo traen."""
+    for rows in chunks:
+        missing = [sid for sid, _letter, fv in rows if fv is None]
+        landmarks = {}
+        if missing:
+            landmarks = dict(HandSample.objects.filter(id__in=missing).values_list("id", "landmarks"))
+        out = []
+        for sid, letter, fv in rows:
+            if fv is None:
+                try:
+                    fv = extract_feature_vector(landmarks.get(sid))
+                except Exception:
+                    continue
+            out.append((letter, fv))
+        yield out
+
+
+def _group(chunks: Iterable[List[Tuple[str, List[float]]]]) -> Iterator[LetterArrays]:
+    """Agrupa cada bloque en matrices (n, dim) por letra y longitud de vector."""
+    for pairs in chunks:
+        groups: Dict[Tuple[str, int], List[List[float]]] = {}
+        for letter, fv in pairs:
+            groups.setdefault((letter, len(fv)), []).append(fv)
+        yield [(letter, np.asarray(vecs, dtype=np.float64)) for (letter, _dim), vecs in groups.items()]
+
+
+def sample_stream(
+    chunk_size: int = CHUNK_SIZE, max_id: Optional[int] = None, owner: str = DEFAULT_OWNER
+) -> Iterator[LetterArrays]:
+    return _group(_reextract(_decode(iter_sample_chunks(chunk_size, max_id, owner=owner))))
+
+
+# ========== Pasada 1: centroides ==========
+def accumulate_letter_stats(stream: Iterable[LetterArrays]) -> Dict[str, dict]:
+    """Suma, conteo y caja envolvente por letra.
+
+    La dimensión de cada letra la fija el primer vector visto; los vectores de otra
+    longitud se descartan.
+    """
+    stats: Dict[str, dict] = {}
+    for groups in stream:
+        for letter, X in groups:
+            st = stats.get(letter)
+            if st is None:
+                stats[letter] = {"n": len(X), "sum": X.sum(axis=0), "min": X.min(axis=0), "max": X.max(axis=0)}
+                continue
+            if X.shape[1] != st["sum"].shape[0]:
+                continue
+            st["n"] += len(X)
+            st["sum"] += X.sum(axis=0)
+            np.minimum(st["min"], X.min(axis=0), out=st["min"])
+            np.maximum(st["max"], X.max(axis=0), out=st["max"])
+    return stats
+
+
+# ========== Pasadas 2+: percentil exacto de distancias ==========
+def _bin_index(d: np.ndarray, lo: float, hi: float) -> np.ndarray:
+    w = hi - lo
+    if w <= 0:
+        return np.zeros(d.shape, dtype=np.int64)
+    return np.clip(np.floor((d - lo) * (HIST_BINS / w)).astype(np.int64), 0, HIST_BINS - 1)
+
+
+def _in_path(d: np.ndarray, path: List[Tuple[float, float, int]]) -> np.ndarray:
+    # Reaplica la misma cadena de bins de pasadas anteriores (evita errores de borde en float)
+    mask = np.ones(d.shape, dtype=bool)
+    for lo, hi, j in path:
+        mask &= _bin_index(d, lo, hi) == j
+    return mask
+
+
+def _restart_refine(st: dict, n: int, bound: float) -> None:
+    # El conteo de la letra cambió (filas borradas o archivadas entre pasadas): el rango
+    # se reescala al nuevo tamaño y el refinamiento empieza de nuevo sobre todo el rango
+    st["rank"] = min(n - 1, int(round(st["rank"] * (n - 1) / max(1, st["n"] - 1))))
+    st.update(n=n, path=[], lo=0.0, hi=float(bound), k=st["rank"], collect=False)
+    st["restarts"] += 1
+
+
+def kth_distances(
+    stream_factory: Callable[[], Iterable[LetterArrays]],
+    centroids: Dict[str, np.ndarray],
+    ranks: Dict[str, int],
+    bounds: Dict[str, float],
+    on_letter_done: Optional[Callable[[int], None]] = None,
+    sketches: Optional[Dict[str, KLLSketch]] = None,
+    counts: Optional[Dict[str, int]] = None,
+) -> Dict[str, float]:
+    """Distancia al centroide de rango `ranks[L]` (0-based) para cada letra.
+
+    Cada pasada construye un histograma de las distancias que caen en el intervalo
+    que aún contiene al rango buscado y se queda con el bin que lo contiene; cuando
+    el bin tiene pocas distancias, la pasada siguiente las guarda y se ordenan.
+    Si se pasan `sketches`, la primera pasada (que ve todas las distancias) los alimenta.
+
+    `counts[L]` es el número de filas sobre el que se calculó `ranks[L]` (por defecto,
+    las que vea la primera pasada). Cada pasada vuelve a contar las filas de la letra; si
+    el conteo cambia, el rango se reescala y el refinamiento de esa letra se reinicia
+    (hasta `MAX_REFINE_RESTARTS` veces; después el rango se acota a las filas vistas).
+    """
+    pending = {
+        L: {
+            "path": [], "lo": 0.0, "hi": float(bounds[L]), "k": int(ranks[L]), "collect": False,
+            "rank": int(ranks[L]), "n": None if counts is None else int(counts[L]), "restarts": 0,
+        }
+        for L in ranks
+    }
+    result: Dict[str, float] = {}
+    first = True
+    while pending:
+        hist = {L: np.zeros(HIST_BINS, dtype=np.int64) for L, st in pending.items() if not st["collect"]}
+        bufs: Dict[str, List[np.ndarray]] = {L: [] for L, st in pending.items() if st["collect"]}
+        seen = dict.fromkeys(pending, 0)
+        for groups in stream_factory():
+            for letter, X in groups:
+                st = pending.get(letter)
+                c = centroids.get(letter)
+                if st is None or X.shape[1] != c.shape[0]:
+                    continue
+                d = np.sqrt(((X - c) ** 2).sum(axis=1))
+                seen[letter] += len(d)
+                if first and sketches is not None and letter in sketches:
+                    sketches[letter].update(d)
+                d = d[_in_path(d, st["path"])]
+                if st["collect"]:
+                    bufs[letter].append(d)
+                else:
+                    hist[letter] += np.bincount(_bin_index(d, st["lo"], st["hi"]), minlength=HIST_BINS)
+        first = False
+
+        for L in list(pending):
+            st = pending[L]
+            n = seen[L]
+            if st["n"] is None:
+                st["n"] = n
+            if n != st["n"] and n and st["restarts"] < MAX_REFINE_RESTARTS:
+                _restart_refine(st, n, bounds[L])
+                continue
+            if st["collect"]:
+                vals = np.sort(np.concatenate(bufs[L]))
+                if len(vals):
+                    result[L] = float(vals[min(st["k"], len(vals) - 1)])
+                else:
+                    result[L] = (st["lo"] + st["hi"]) / 2.0
+            else:
+                h = hist[L]
+                cum = np.cumsum(h)
+                if not cum[-1]:
+                    # Ninguna fila de la letra cayó en el intervalo: queda la mejor estimación
+                    result[L] = (st["lo"] + st["hi"]) / 2.0
+                else:
+                    st["k"] = min(st["k"], int(cum[-1]) - 1)
+                    j = int(np.searchsorted(cum, st["k"], side="right"))
+                    w = (st["hi"] - st["lo"]) / HIST_BINS
+                    st["path"].append((st["lo"], st["hi"], j))
+                    st["k"] -= int(cum[j - 1]) if j else 0
+                    st["lo"], st["hi"] = st["lo"] + j * w, st["lo"] + (j + 1) * w
+                    if int(h[j]) <= EXACT_BUFFER:
+                        st["collect"] = True
+                        continue
+                    if w > 0 and len(st["path"]) < MAX_REFINE_DEPTH:
+                        continue
+                    # Intervalo degenerado: todas las distancias restantes son (casi) iguales
+                    result[L] = st["lo"] if w <= 0 else (st["lo"] + st["hi"]) / 2.0
+            del pending[L]
+            if on_letter_done is not None:
+                on_letter_done(len(result))
+    return result
+
+
+# ========== Pasada 2 alternativa: sketches de cuantiles ==========
+def sketch_distances(
+    stream: Iterable[LetterArrays], centroids: Dict[str, np.ndarray], k: int = DEFAULT_K
+) -> Dict[str, KLLSketch]:
+    """Sketch KLL de las distancias al centroide por letra, en una pasada.
+
+    Cada bloque se añade a su sketch; los sketches de varios streams (otro proceso u
+    otra partición) pueden combinarse con `merge_sketches`.
+    """
+    sketches: Dict[str, KLLSketch] = {}
+    for groups in stream:
+        for letter, X in groups:
+            c = centroids.get(letter)
+            if c is None or X.shape[1] != c.shape[0]:
+                continue
+            sk = sketches.get(letter)
+            if sk is None:
+                sk = sketches[letter] = KLLSketch(k)
+            sk.update(np.sqrt(((X - c) ** 2).sum(axis=1)))
+    return sketches
+
+
+def merge_sketches(parts: Iterable[Dict[str, KLLSketch]]) -> Dict[str, KLLSketch]:
+    """Fusiona por letra los sketches de varias particiones."""
+    merged: Dict[str, KLLSketch] = {}
+    for part in parts:
+        for letter, sk in part.items():
+            if letter in merged:
+                merged[letter].merge(sk)
+            else:
+                merged[letter] = KLLSketch(sk.k).merge(sk)
+    return merged
+
+
+def _exact_kth(passes, stats, centroids, percentile, report, sketches) -> Dict[str, float]:
+    """Percentil exacto por letra con el refinamiento de histogramas de `kth_distances`."""
+    ranks = {L: percentile_rank(st["n"], percentile) for L, st in stats.items()}
+    # Cota superior de la distancia al centroide a partir de la caja envolvente
+    bounds = {
+        L: float(np.sqrt((np.maximum(st["max"] - centroids[L], centroids[L] - st["min"]) ** 2).sum()))
+        for L, st in stats.items()
+    }
+    return kth_distances(
+        passes,
+        centroids,
+        ranks,
+        bounds,
+        on_letter_done=lambda done: report(letters_done=done),
+        sketches=sketches,
+        counts={L: st["n"] for L, st in stats.items()},
+    )
+
+
+# ========== Entrenamiento completo ==========
+# (primera pasada, fábrica de pasadas, mayor HandSample.id incluido)
+StreamSource = Tuple[Iterable[LetterArrays], Callable[[], Iterable[LetterArrays]], int]
+
+
+def _db_source(chunk_size: int, report: Callable[..., None], owner: str) -> Optional[StreamSource]:
+    """(primera pasada con progreso, fábrica de pasadas) leyendo HandSample directamente."""
+    max_id = HandSample.objects.filter(owner=owner).aggregate(m=Max("id"))["m"]
+    if max_id is None:
+        return None
+
+    def counted(chunks):
+        read = 0
+        for rows in chunks:
+            read += len(rows)
+            report(samples_read=read)
+            yield rows
+
+    first = _group(_reextract(_decode(counted(iter_sample_chunks(chunk_size, max_id, owner=owner)))))
+    return first, lambda: sample_stream(chunk_size, max_id, owner), max_id
+
+
+def _snapshot_source(chunk_size: int, report: Callable[..., None], owner: str) -> StreamSource:
+    """Igual que _db_source pero desde el snapshot en disco, sincronizado antes de leer."""
+    from . import snapshot
+
+    root = snapshot.snapshot_dir(owner)
+    man = snapshot.refresh(root, chunk_size=chunk_size, owner=owner)
+
+    def counted():
+        read = 0
+        for groups in snapshot.snapshot_stream(chunk_size, man, root):
+            read += sum(len(X) for _L, X in groups)
+            report(samples_read=read)
+            yield groups
+
+    return counted(), lambda: snapshot.snapshot_stream(chunk_size, man, root), man["high_water_id"]
+
+
+def _with_archive(source: Optional[StreamSource], chunk_size: int, owner: str) -> Optional[StreamSource]:
+    """Añade al stream las muestras archivadas en segmentos comprimidos (ver archive)."""
+    from . import archive
+
+    if not archive.totals(owner):
+        return source
+    first, passes, max_id = source or ((), lambda: (), 0)
+    return (
+        chain(first, archive.archive_stream(chunk_size, owner)),
+        lambda: chain(passes(), archive.archive_stream(chunk_size, owner)),
+        max_id,
+    )
+
+
+def train_from_samples(
+    progress: Optional[Callable[..., None]] = None,
+    chunk_size: int = CHUNK_SIZE,
+    percentile: float = DEFAULT_PERCENTILE,
+    use_snapshot: Optional[bool] = None,
+    owner: str = DEFAULT_OWNER,
+    threshold_sketch: Optional[bool] = None,
+    include_archive: Optional[bool] = None,
+) -> Optional[TrainingModel]:
+    """Recalcula centroides y umbrales por letra con las muestras de `owner` y persiste
+    un nuevo TrainingModel para ese propietario.
+
+    `progress(**campos)` recibe actualizaciones parciales:
+    samples_read, letters_total, letters_done.
+    Con `use_snapshot` (por defecto settings.VISTA02_TRAIN_FROM_SNAPSHOT) los datos se
+    leen del snapshot columnar en disco; si no está disponible se usa la BD.
+    Con `threshold_sketch` (por defecto settings.VISTA02_THRESHOLD_SKETCH) los umbrales
+    se aproximan con sketches KLL en una sola pasada en lugar del refinamiento exacto.
+    Con `include_archive` (por defecto settings.VISTA02_TRAIN_INCLUDE_ARCHIVE) se leen
+    también las muestras archivadas fuera de la tabla.
+    Devuelve None si no hay muestras utilizables.
+    """
+    report = progress or _noop_progress
+    if use_snapshot is None:
+        use_snapshot = getattr(settings, "VISTA02_TRAIN_FROM_SNAPSHOT", True)
+    if threshold_sketch is None:
+        threshold_sketch = getattr(settings, "VISTA02_THRESHOLD_SKETCH", False)
+    if include_archive is None:
+        include_archive = getattr(settings, "VISTA02_TRAIN_INCLUDE_ARCHIVE", False)
+
+    source = None
+    if use_snapshot:
+        try:
+            source = _snapshot_source(chunk_size, report, owner)
+        except OSError as e:
+            logger.warning(f"Vista02: snapshot no disponible, se entrena desde la BD: {e}")
+    if source is None:
+        source = _db_source(chunk_size, report, owner)
+    if include_archive:
+        source = _with_archive(source, chunk_size, owner)
+    if source is None:
+        return None
+    first_pass, passes, max_id = source
+
+    stats = accumulate_letter_stats(first_pass)
+    if not stats:
+        return None
+    report(letters_total=len(stats))
+
+    centroids = {L: st["sum"] / st["n"] for L, st in stats.items()}
+    # La distribución de distancias se guarda con el modelo para poder cambiar umbrales sin reentrenar
+    k = getattr(settings, "VISTA02_THRESHOLD_SKETCH_K", DEFAULT_K)
+    if threshold_sketch:
+        sketches = sketch_distances(passes(), centroids, k)
+        kth = {L: sk.quantile(percentile) for L, sk in sketches.items()}
+        report(letters_done=len(kth))
+    else:
+        sketches = {L: KLLSketch(k) for L in stats}
+        kth = _exact_kth(passes, stats, centroids, percentile, report, sketches)
+    thresholds = {L: max(MIN_THRESH, d) for L, d in kth.items()}
+
+    letters = sorted(stats.keys())
+    return TrainingModel.objects.create(
+        owner=owner,
+        feature_version=FEATURE_VERSION,
+        centroids={L: centroids[L].tolist() for L in letters},
+        letters=letters,
+        thresholds={L: thresholds[L] for L in letters},
+        threshold_method="percentile",
+        threshold_param=percentile,
+        min_threshold=MIN_THRESH,
+        trained_max_sample_id=max_id,
+        letter_counts={L: int(stats[L]["n"]) for L in letters},
+        distance_sketches={L: sketches[L].to_compact() for L in letters},
+    )
+
+
+def rethreshold(model: TrainingModel, percentile: float, min_thresh: float = MIN_THRESH) -> TrainingModel:
+    """Nuevo TrainingModel con los centroides de `model` y umbrales recalculados desde las
+    distribuciones de distancia que guardó al entrenarse, sin leer HandSample.
+
+    Las letras con hasta VISTA02_THRESHOLD_SKETCH_K muestras guardan todas sus distancias y dan
+    el mismo umbral que un entrenamiento con ese percentil; por encima el sketch está compactado
+    y el umbral es el de un rango aproximado (error de rango ~1 %, acotado en RethresholdTests).
+
+    Lanza ValueError si el modelo no guarda esas distribuciones (entrenado antes de guardarlas).
+    """
+    sketches = model.distance_sketches or {}
+    missing = [L for L in model.letters if L not in sketches]
+    if missing:
+        raise ValueError(f"el modelo {model.id} no guarda distribuciones de distancia para {', '.join(missing)}")
+    thresholds = {
+        L: max(min_thresh, KLLSketch.from_compact(sketches[L]).quantile(percentile)) for L in model.letters
+    }
+    return TrainingModel.objects.create(
+        owner=model.owner,
+        feature_version=model.feature_version,
+        centroids=model.centroids,
+        letters=model.letters,
+        thresholds=thresholds,
+        feature_stds=model.feature_stds,
+        threshold_method="percentile",
+        threshold_param=percentile,
+        min_threshold=min_thresh,
+        trained_max_sample_id=model.trained_max_sample_id,
+        letter_counts=model.letter_counts,
+        distance_sketches=sketches,
+    )
+
@@ -1,3 +1,1241 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import marshal
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.management import call_command
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .models import HandSample, PredictionLog, TrainingModel
+from .services import (
+    admission, archive, autotrain, batching, evaluation, jobs, model_bundle, prediction_log, profiling, snapshot,
+    training,
+)
+from .services.model_cache import ModelCache, estimate_size, get_model_cache
+from .services.prediction_log import PredictionLogger
+from .services.quantile_sketch import KLLSketch
+from .services.smoothing import SessionSmoother
+from .services.feature_extractor import FEATURE_DIM, FEATURE_VERSION, extract_feature_vector, extractor_checksum
+from .services.trainer import compute_centroids, compute_thresholds, percentile_rank, predict_with_thresholds
+from .views import views
+
+
+def _random_landmarks(rng):
+    return [{"x": rng.random(), "y": rng.random(), "z": rng.random() * 0.1} for _ in range(21)]
+
+
+def _populate(n_per_letter, letters="ABC", seed=0, with_missing=True):
+    """Crea muestras aleatorias; con `with_missing` una de cada cuatro no trae feature."""
+    rng = random.Random(seed)
+    objs = []
+    for L in letters:
+        for i in range(n_per_letter):
+            lm = _random_landmarks(rng)
+            fv = None if (with_missing and i % 4 == 0) else extract_feature_vector(lm)
+            objs.append(HandSample(letter=L, landmarks=lm, feature_vector=fv))
+    HandSample.objects.bulk_create(objs, batch_size=500)
+
+
+def _populate_features(n_per_letter, letters="ABC", seed=0, dim=19, owner=""):
+    """Variante rápida: features sintéticos ya calculados, sin landmarks reales."""
+    rng = random.Random(seed)
+    objs = [
+        HandSample(owner=owner, letter=L, landmarks=[], feature_vector=[rng.random() for _ in range(dim)])
+        for L in letters
+        for _ in range(n_per_letter)
+    ]
+    HandSample.objects.bulk_create(objs, batch_size=500)
+
+
+class StreamingTrainingTests(TestCase):
+    def test_matches_in_memory_training(self):
+        _populate(120)
+        model = training.train_from_samples(chunk_size=37, use_snapshot=False)
+
+        by_letter = {}
+        for hs in HandSample.objects.all():
+            fv = hs.feature_vector or extract_feature_vector(hs.landmarks)
+            by_letter.setdefault(hs.letter, []).append(fv)
+        centroids = compute_centroids(by_letter)
+        thresholds = compute_thresholds(by_letter, centroids)
+
+        self.assertEqual(model.letters, ["A", "B", "C"])
+        for L in model.letters:
+            for a, b in zip(model.centroids[L], centroids[L]):
+                self.assertAlmostEqual(a, b, places=9)
+            self.assertAlmostEqual(model.thresholds[L], thresholds[L], places=9)
+
+    def test_exact_percentile_after_refinement(self):
+        # Forzar varias pasadas de histograma con un buffer exacto diminuto
+        _populate(300, letters="A", with_missing=False)
+        old = training.EXACT_BUFFER
+        training.EXACT_BUFFER = 3
+        try:
+            model = training.train_from_samples(chunk_size=64, percentile=0.5, use_snapshot=False)
+        finally:
+            training.EXACT_BUFFER = old
+        vecs = [hs.feature_vector for hs in HandSample.objects.all()]
+        centroids = compute_centroids({"A": vecs})
+        expected = compute_thresholds({"A": vecs}, centroids, percentile=0.5)
+        self.assertAlmostEqual(model.thresholds["A"], expected["A"], places=9)
+
+    def test_no_samples_returns_none(self):
+        self.assertIsNone(training.train_from_samples(use_snapshot=False))
+
+    def test_rows_deleted_between_passes(self):
+        # Entre la primera pasada de refinamiento y la siguiente se borra un tercio de la letra
+        _populate_features(300, letters="A")
+        real = training.iter_sample_chunks
+        calls = []
+
+        def deleting(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 3:
+                HandSample.objects.filter(id__in=list(HandSample.objects.values_list("id", flat=True)[:100])).delete()
+            return real(*args, **kwargs)
+
+        old = training.EXACT_BUFFER
+        training.EXACT_BUFFER = 3
+        try:
+            with mock.patch.object(training, "iter_sample_chunks", deleting):
+                model = training.train_from_samples(chunk_size=64, percentile=0.5, use_snapshot=False)
+        finally:
+            training.EXACT_BUFFER = old
+        self.assertGreater(len(calls), 3)
+        # El rango se reescala a las filas que quedan, medido contra el centroide ya fijado
+        c = np.asarray(model.centroids["A"])
+        X = np.asarray([hs.feature_vector for hs in HandSample.objects.all()])
+        d = np.sort(np.sqrt(((X - c) ** 2).sum(axis=1)))
+        self.assertEqual(len(d), 200)
+        self.assertAlmostEqual(model.thresholds["A"], float(d[percentile_rank(200, 0.5)]), places=9)
+
+    def test_kth_distances_when_rows_keep_disappearing(self):
+        # Cada pasada ve menos filas: agotados los reinicios, el rango se acota a lo visto
+        rng = np.random.default_rng(0)
+        X = rng.random((5000, 3))
+        passes = []
+
+        def factory():
+            passes.append(1)
+            keep = max(0, 5000 - 1500 * len(passes))
+            return iter([[("A", X[:keep])]]) if keep else iter([])
+
+        result = training.kth_distances(factory, {"A": np.zeros(3)}, {"A": 4500}, {"A": 2.0})
+        self.assertIn("A", result)
+        self.assertGreaterEqual(result["A"], 0.0)
+        self.assertLessEqual(result["A"], 2.0)
+
+    def test_peak_memory_is_bounded(self):
+        def peak_for(n_per_letter):
+            HandSample.objects.all().delete()
+            _populate_features(n_per_letter, seed=n_per_letter)
+            tracemalloc.start()
+            try:
+                training.train_from_samples(chunk_size=200, use_snapshot=False)
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        peak_for(50)  # calentar cachés de Django/numpy
+        small = peak_for(200)
+        large = peak_for(2000)
+        # 10x más muestras no deben mover la memoria pico más allá del tamaño de bloque
+        self.assertLess(large, small * 1.5 + 256 * 1024)
+        self.assertLess(large, 4 * 1024 * 1024)
+
+
+def _wait_job(job_id, states, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.get_job(job_id)
+        if job["state"] in states:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"el trabajo {job_id} no llegó a {states}")
+
+
+class TrainingJobTests(TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.calls = []
+        self.addCleanup(self.release.set)  # no dejar hilos colgados si un test falla
+
+    def _fake_train(self, result="model"):
+        def train(progress=None, owner="", include_archive=None):
+            self.calls.append(owner)
+            progress(samples_read=7, letters_total=2)
+            self.release.wait(10)
+            if result == "error":
+                raise RuntimeError("falló")
+            return None if result is None else mock.Mock(id=42)
+        return train
+
+    def test_one_active_job_per_owner(self):
+        with mock.patch.object(jobs, "train_from_samples", self._fake_train()):
+            first, created = jobs.start_training_job(owner="a")
+            self.assertTrue(created)
+            again, created = jobs.start_training_job(owner="a")
+            self.assertEqual((again["job_id"], created), (first["job_id"], False))
+            other, created = jobs.start_training_job(owner="b")
+            self.assertTrue(created)
+            self.release.set()
+            self.assertEqual(_wait_job(first["job_id"], (jobs.SUCCEEDED,))["model_id"], 42)
+            _wait_job(other["job_id"], (jobs.SUCCEEDED,))
+        self.assertIsNone(jobs.active_job("a"))
+        self.assertEqual(sorted(self.calls), ["a", "b"])
+
+    def test_slot_limit_queues_other_owners(self):
+        old = jobs._SLOTS
+        jobs._SLOTS = threading.BoundedSemaphore(1)
+        self.addCleanup(setattr, jobs, "_SLOTS", old)
+        with mock.patch.object(jobs, "train_from_samples", self._fake_train()):
+            a, _ = jobs.start_training_job(owner="a")
+            _wait_job(a["job_id"], (jobs.RUNNING,))
+            b, _ = jobs.start_training_job(owner="b")
+            time.sleep(0.05)
+            self.assertEqual(jobs.get_job(b["job_id"])["state"], jobs.QUEUED)
+            self.release.set()
+            _wait_job(a["job_id"], (jobs.SUCCEEDED,))
+            _wait_job(b["job_id"], (jobs.SUCCEEDED,))
+
+    def test_cache_invalidated_only_on_success(self):
+        for result, state in (("model", jobs.SUCCEEDED), (None, jobs.FAILED), ("error", jobs.FAILED)):
+            on_success = mock.Mock()
+            with mock.patch.object(jobs, "train_from_samples", self._fake_train(result)):
+                job, _ = jobs.start_training_job(on_success=on_success, owner="c")
+                self.release.set()
+                done = _wait_job(job["job_id"], (jobs.SUCCEEDED, jobs.FAILED))
+            self.release.clear()
+            self.assertEqual(done["state"], state)
+            self.assertEqual(on_success.call_count, 1 if state == jobs.SUCCEEDED else 0)
+        self.assertEqual(done["error"], "falló")
+
+
+class TrainingJobEndpointTests(TransactionTestCase):
+    def setUp(self):
+        # El trabajo entrena desde el snapshot: que no escriba en el del proyecto
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(
+            VISTA02_SNAPSHOT_DIR=Path(tmp.name) / "snapshots", VISTA02_ARCHIVE_DIR=Path(tmp.name) / "archive"
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_progress_is_reported_until_the_model_is_stored(self):
+        _populate_features(30, letters="AB")
+        client = Client(HTTP_HOST="localhost")
+        r = client.post("/vista02/api/train")
+        self.assertEqual(r.status_code, 202)
+        job_id = r.json()["job_id"]
+        _wait_job(job_id, (jobs.SUCCEEDED, jobs.FAILED))
+        status = client.get(f"/vista02/api/train/{job_id}").json()
+        self.assertEqual(status["state"], jobs.SUCCEEDED)
+        self.assertEqual((status["samples_read"], status["letters_total"], status["letters_done"]), (60, 2, 2))
+        self.assertEqual(status["model_id"], TrainingModel.objects.get().id)
+        self.assertEqual(client.get("/vista02/api/train/nope").status_code, 404)
+        # Sin muestras no se lanza ningún trabajo
+        self.assertEqual(client.post("/vista02/api/train", HTTP_X_PROFILE_ID="vacio").status_code, 400)
+
+    def _train(self, client, body=None):
+        r = client.post("/vista02/api/train", json.dumps(body) if body is not None else "", content_type="application/json")
+        self.assertEqual(r.status_code, 202)
+        job = _wait_job(r.json()["job_id"], (jobs.SUCCEEDED, jobs.FAILED))
+        self.assertEqual(job["state"], jobs.SUCCEEDED)
+        return job, TrainingModel.objects.get(id=job["model_id"])
+
+    def test_include_archive_per_request(self):
+        _populate_features(30, letters="AB")
+        HandSample.objects.filter(letter="B").update(created_at=timezone.now() - timedelta(days=40))
+        archive.archive_samples(older_than_days=30)
+        client = Client(HTTP_HOST="localhost")
+
+        job, model = self._train(client)
+        self.assertIsNone(job["include_archive"])
+        self.assertEqual(model.letters, ["A"])
+        job, model = self._train(client, {"include_archive": True})
+        self.assertIs(job["include_archive"], True)
+        self.assertEqual((model.letters, model.letter_counts), (["A", "B"], {"A": 30, "B": 30}))
+        with override_settings(VISTA02_TRAIN_INCLUDE_ARCHIVE=True):
+            _job, model = self._train(client, {"include_archive": False})
+            self.assertEqual(model.letters, ["A"])
+
+        r = client.post("/vista02/api/train", json.dumps({"include_archive": "si"}), content_type="application/json")
+        self.assertEqual(r.status_code, 400)
+        # Un perfil con todo archivado solo puede entrenar si pide el archivo
+        HandSample.objects.filter(letter="A").update(created_at=timezone.now() - timedelta(days=40))
+        archive.archive_samples(older_than_days=30)
+        self.assertEqual(client.post("/vista02/api/train").status_code, 400)
+        _job, model = self._train(client, {"include_archive": True})
+        self.assertEqual(model.letters, ["A", "B"])
+
+
+class EvaluationSweepTests(TestCase):
+    def test_sweep_matches_scalar_predictor(self):
+        rng = np.random.default_rng(1)
+        letters = ["A", "B", "C"]
+        centers = rng.random((3, 19))
+        y = rng.integers(0, 3, 450)
+        X = centers[y] + rng.normal(0, 0.08, (450, 19))
+        pcts, scales = [0.7, 0.9], [0.5, 1.0, 2.0]
+        result = evaluation.sweep(X, y, letters, k=3, percentiles=pcts, tolerances=evaluation.tolerance_grid(scales))
+
+        folds = evaluation.stratified_folds(y, 3, 0)
+        for p_idx, p in enumerate(pcts):
+            correct = rejected = 0
+            for f in range(3):
+                train = folds != f
+                by_letter = {}
+                for xi, yi in zip(X[train], y[train]):
+                    by_letter.setdefault(letters[yi], []).append(xi.tolist())
+                centroids = compute_centroids(by_letter)
+                thresholds = compute_thresholds(by_letter, centroids, percentile=p)
+                for xi, yi in zip(X[~train], y[~train]):
+                    letter, _d, _t, _ok = predict_with_thresholds(xi.tolist(), centroids, thresholds)
+                    rejected += letter is None
+                    correct += letter == letters[yi]
+            # La escala 1.0 reproduce las tolerancias actuales de trainer.py
+            self.assertAlmostEqual(result["accuracy"][p_idx, 1], correct / 450)
+            self.assertAlmostEqual(result["rejection"][p_idx, 1], rejected / 450)
+        summary = evaluation.config_summary(result, 1, 1)
+        self.assertEqual(sum(sum(row.values()) for row in summary["confusion"].values()), 450)
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        override = override_settings(VISTA02_SNAPSHOT_DIR=self.root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_incremental_append_and_memmap(self):
+        _populate(40, letters="AB", seed=3)
+        man = snapshot.refresh(chunk_size=16)
+        self.assertEqual(man["letters"]["A"]["rows"], 40)
+        first_hwm = man["high_water_id"]
+
+        _populate(10, letters="BC", seed=4)
+        man = snapshot.refresh(chunk_size=16)
+        self.assertGreater(man["high_water_id"], first_hwm)
+        self.assertEqual({L: i["rows"] for L, i in man["letters"].items()}, {"A": 40, "B": 50, "C": 10})
+        self.assertEqual(man["segments"][-1]["offsets"]["B"], 40)
+
+        arrays = snapshot.open_arrays(man)
+        expected = [
+            hs.feature_vector or extract_feature_vector(hs.landmarks)
+            for hs in HandSample.objects.filter(letter="B").order_by("id")
+        ]
+        np.testing.assert_allclose(arrays["B"], np.asarray(expected, dtype=np.float32))
+
+    def test_rebuilds_after_deletes(self):
+        _populate(20, letters="AB")
+        snapshot.refresh()
+        HandSample.objects.filter(letter="A").delete()
+        man = snapshot.refresh()
+        self.assertEqual(list(man["letters"]), ["B"])
+
+    def test_training_from_snapshot_matches_db(self):
+        _populate(60, letters="ABC", seed=5)
+        from_db = training.train_from_samples(use_snapshot=False)
+        from_snap = training.train_from_samples(use_snapshot=True)
+        for L in from_db.letters:
+            np.testing.assert_allclose(from_snap.centroids[L], from_db.centroids[L], atol=1e-6)
+            self.assertAlmostEqual(from_snap.thresholds[L], from_db.thresholds[L], places=5)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(VISTA02_ARCHIVE_DIR=Path(tmp.name))
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_per_letter_cap_moves_oldest_rows(self):
+        _populate(50, letters="AB", seed=6)
+        newest = set(HandSample.objects.filter(letter="A").order_by("-id").values_list("id", flat=True)[:20])
+        res = archive.archive_samples(per_letter_cap=20, chunk_size=16, segment_rows=30)
+        self.assertEqual((res["archived"], res["skipped"]), (60, 0))
+        self.assertGreater(res["segments"], 1)
+        self.assertEqual(set(HandSample.objects.filter(letter="A").values_list("id", flat=True)), newest)
+        self.assertEqual(archive.totals(), res["by_letter"])
+
+        rows = {}
+        for groups in archive.archive_stream(chunk_size=7):
+            for L, X in groups:
+                rows[L] = rows.get(L, 0) + len(X)
+        self.assertEqual(rows, res["by_letter"])
+        # Nada más que archivar con la misma política
+        self.assertEqual(archive.archive_samples(per_letter_cap=20)["archived"], 0)
+
+    def test_training_with_archive_matches_full_table(self):
+        _populate_features(40, letters="ABC", seed=7)
+        before = training.train_from_samples(use_snapshot=False)
+        HandSample.objects.filter(letter="C").update(created_at=timezone.now() - timedelta(days=40))
+        res = archive.archive_samples(older_than_days=30)
+        self.assertEqual(res["by_letter"], {"C": 40})
+        self.assertEqual(HandSample.objects.count(), 80)
+
+        hot = training.train_from_samples(use_snapshot=False)
+        self.assertEqual(hot.letters, ["A", "B"])
+        full = training.train_from_samples(use_snapshot=False, include_archive=True)
+        self.assertEqual(full.letters, before.letters)
+        for L in before.letters:
+            np.testing.assert_allclose(full.centroids[L], before.centroids[L], atol=1e-6)
+            self.assertAlmostEqual(full.thresholds[L], before.thresholds[L], places=5)
+
+
+    def _segment(self):
+        root = archive.archive_dir()
+        seg = json.loads((root / "manifest.json").read_text())["segments"][0]
+        with np.load(root / seg["file"]) as z:
+            return seg, {k: z[k] for k in z.files}
+
+    def test_keeps_landmarks_and_never_deletes_unarchived_rows(self):
+        _populate(8, letters="A", seed=2)
+        lm = _random_landmarks(random.Random(9))
+        no_fv = HandSample.objects.create(letter="A", landmarks=lm, feature_vector=[0.5] * 5)  # dim distinta
+        no_lm = HandSample.objects.create(letter="A", landmarks=[], feature_vector=[0.25] * FEATURE_DIM)
+        nothing = HandSample.objects.create(letter="A", landmarks=[{"x": "?"}], feature_vector=None)
+        HandSample.objects.update(created_at=timezone.now() - timedelta(days=10))
+
+        res = archive.archive_samples(older_than_days=1)
+        self.assertEqual((res["archived"], res["skipped"]), (10, 1))
+        self.assertEqual(list(HandSample.objects.values_list("id", flat=True)), [nothing.id])
+
+        seg, z = self._segment()
+        self.assertEqual((seg["feature_version"], seg["feature_checksum"]), (FEATURE_VERSION, extractor_checksum()))
+        ids = list(z["ids_0041"])
+        self.assertEqual((z["lm_0041"].shape, z["lm_0041"].dtype), ((10, 21, 3), np.float32))
+        row = ids.index(no_fv.id)
+        np.testing.assert_array_equal(z["lm_0041"][row], np.asarray([[p["x"], p["y"], p["z"]] for p in lm], dtype=np.float32))
+        np.testing.assert_allclose(z["letter_0041"][row], extract_feature_vector(lm), rtol=1e-6)  # re-extraído
+        self.assertTrue(np.isnan(z["lm_0041"][ids.index(no_lm.id)]).all())
+
+        streamed = np.concatenate([X for groups in archive.archive_stream() for _L, X in groups])
+        self.assertEqual(len(streamed), 10)
+
+    def test_other_extractor_segments_are_recomputed_from_landmarks(self):
+        _populate(8, letters="A", seed=3, with_missing=False)
+        HandSample.objects.create(letter="A", landmarks=[], feature_vector=[0.25] * FEATURE_DIM)
+        HandSample.objects.update(created_at=timezone.now() - timedelta(days=10))
+        archive.archive_samples(older_than_days=1)
+        expected = np.sort(np.asarray([
+            extract_feature_vector([{"x": float(x), "y": float(y), "z": float(zz)} for x, y, zz in lm])
+            for lm in self._segment()[1]["lm_0041"] if np.isfinite(lm).all()
+        ]), axis=0)
+
+        root = archive.archive_dir()
+        man = json.loads((root / "manifest.json").read_text())
+        man["segments"][0]["feature_checksum"] = "otro"
+        (root / "manifest.json").write_text(json.dumps(man))
+        streamed = np.concatenate([X for groups in archive.archive_stream() for _L, X in groups])
+        # La fila sin landmarks se omite; el resto sale del extractor vigente
+        self.assertEqual(len(streamed), 8)
+        np.testing.assert_array_equal(np.sort(streamed, axis=0), expected)
+
+    def test_pending_segment_only_deletes_its_rows(self):
+        _populate(6, letters="A", seed=4)
+        keep = HandSample.objects.create(letter="A", landmarks=[], feature_vector=None)
+        HandSample.objects.update(created_at=timezone.now() - timedelta(days=10))
+        with mock.patch.object(archive, "_delete_ids", side_effect=RuntimeError("interrumpido")):
+            with self.assertRaises(RuntimeError):
+                archive.archive_samples(older_than_days=1)  # segmento escrito, borrado sin hacer
+        self.assertEqual(HandSample.objects.count(), 7)
+        self.assertEqual(archive.totals(), {})
+        res = archive.archive_samples(older_than_days=1)
+        self.assertEqual((res["archived"], res["skipped"]), (0, 1))
+        self.assertEqual(list(HandSample.objects.values_list("id", flat=True)), [keep.id])
+        self.assertEqual(archive.totals(), {"A": 6})
+
+
+class QuantileSketchTests(TestCase):
+    QS = (0.5, 0.88, 0.9, 0.95, 0.99)
+
+    def _rank_error(self, sk, ordered):
+        return max(abs(np.searchsorted(ordered, sk.quantile(q)) / len(ordered) - q) for q in self.QS)
+
+    def test_rank_error_single_and_merged(self):
+        rng = np.random.default_rng(5)
+        x = rng.gamma(2.0, 1.0, 100000)
+        ordered = np.sort(x)
+        single = KLLSketch(200)
+        for i in range(0, len(x), 2000):
+            single.update(x[i:i + 2000])
+        parts = [KLLSketch(200, seed=j).update(p) for j, p in enumerate(np.array_split(x, 10))]
+        merged = training.merge_sketches({"A": p} for p in parts)["A"]
+        self.assertEqual(merged.n, len(x))
+        # Error de rango medido ~0.5 % con k=200; la cota del test deja margen
+        self.assertLess(self._rank_error(single, ordered), 0.01)
+        self.assertLess(self._rank_error(merged, ordered), 0.01)
+        self.assertLess(single.size, 3 * 200)
+        restored = KLLSketch.from_dict(json.loads(json.dumps(merged.to_dict())))
+        self.assertEqual(restored.quantile(0.9), merged.quantile(0.9))
+
+    def test_exact_below_capacity_and_training_thresholds(self):
+        x = np.random.default_rng(1).random(150)
+        sk = KLLSketch(200).update(x)
+        self.assertEqual(sk.quantile(0.9), np.sort(x)[percentile_rank(150, 0.9)])
+
+        _populate_features(400, letters="ABC", seed=4)
+        exact = training.train_from_samples(use_snapshot=False, threshold_sketch=False)
+        approx = training.train_from_samples(use_snapshot=False, threshold_sketch=True, chunk_size=97)
+        for L in "ABC":
+            self.assertAlmostEqual(approx.thresholds[L], exact.thresholds[L], delta=0.02 * exact.thresholds[L])
+
+
+class RethresholdTests(TestCase):
+    def setUp(self):
+        self.client = Client(HTTP_HOST="localhost")
+        get_model_cache().invalidate("")
+
+    def _post(self, payload):
+        return self.client.post("/vista02/api/model/rethreshold", json.dumps(payload), content_type="application/json")
+
+    def test_rethreshold_matches_exact_percentile_and_swaps_model(self):
+        _populate_features(60, letters="AB", seed=8)
+        model = training.train_from_samples(use_snapshot=False)
+        self.assertEqual(model.threshold_param, 0.90)
+        self.assertEqual(self.client.get("/vista02/api/model").json()["model_id"], model.id)
+
+        expected = {}
+        for L in "AB":
+            X = np.asarray(list(HandSample.objects.filter(letter=L).values_list("feature_vector", flat=True)))
+            d = np.sort(np.sqrt(((X - np.asarray(model.centroids[L])) ** 2).sum(axis=1)))
+            expected[L] = d[percentile_rank(len(d), 0.5)]
+        HandSample.objects.all().delete()  # el recálculo no lee muestras
+        r = self._post({"percentile": 0.5, "min_threshold": 0.0}).json()
+        self.assertNotEqual(r["model_id"], model.id)
+        for L in "AB":
+            self.assertEqual(r["thresholds"][L], expected[L])  # <= k muestras: distancias exactas
+        served = self.client.get("/vista02/api/model").json()
+        self.assertEqual((served["model_id"], served["threshold_param"]), (r["model_id"], 0.5))
+
+    def test_same_percentile_keeps_thresholds_and_bounds_drift_above_k(self):
+        _populate_features(60, letters="A", seed=3)
+        _populate_features(3000, letters="B", seed=5)
+        model = training.train_from_samples(use_snapshot=False)
+        self.assertEqual(model.distance_sketches["A"]["dtype"], "<f8")
+        self.assertEqual(model.distance_sketches["B"]["dtype"], "<f4")
+
+        r = self._post({}).json()
+        self.assertEqual(r["thresholds"]["A"], model.thresholds["A"])
+        # Por encima de k el sketch está compactado: se acota el rango, no el valor
+        X = np.asarray(list(HandSample.objects.filter(letter="B").values_list("feature_vector", flat=True)))
+        d = np.sort(np.sqrt(((X - np.asarray(model.centroids["B"])) ** 2).sum(axis=1)))
+        for p in (0.5, 0.9, 0.95):
+            thr = self._post({"percentile": p, "min_threshold": 0.0}).json()["thresholds"]["B"]
+            self.assertLess(abs(np.searchsorted(d, thr) / len(d) - p), 0.02)
+
+    def test_reads_float32_sketches_of_older_models(self):
+        _populate_features(30, letters="A", seed=2)
+        model = training.train_from_samples(use_snapshot=False)
+        sk = KLLSketch.from_compact(model.distance_sketches["A"])
+        legacy = {"k": sk.k, "n": sk.n, "levels": [base64.b64encode(lv.astype("<f4").tobytes()).decode("ascii") for lv in sk.levels]}
+        TrainingModel.objects.filter(id=model.id).update(distance_sketches={"A": legacy})
+        r = self._post({}).json()
+        self.assertAlmostEqual(r["thresholds"]["A"], model.thresholds["A"], places=5)
+
+    def test_rejects_models_without_distributions(self):
+        self.assertEqual(self._post({}).status_code, 404)
+        _populate_features(10, letters="A")
+        model = training.train_from_samples(use_snapshot=False)
+        get_model_cache().invalidate("")  # la caché recordaba que no había modelo
+        self.assertEqual(self._post({"percentile": 1.5}).status_code, 400)
+        TrainingModel.objects.filter(id=model.id).update(distance_sketches={})
+        self.assertEqual(self._post({"percentile": 0.8}).status_code, 409)
+
+
+class OwnerModelTests(TestCase):
+    def test_training_is_scoped_to_owner(self):
+        _populate_features(30, letters="AB")
+        _populate_features(30, letters="C", seed=1, owner="u1")
+        model = training.train_from_samples(use_snapshot=False, owner="u1")
+        self.assertEqual(model.owner, "u1")
+        self.assertEqual(model.letters, ["C"])
+        shared = training.train_from_samples(use_snapshot=False)
+        self.assertEqual(shared.owner, "")
+        self.assertEqual(shared.letters, ["A", "B"])
+
+    def test_model_cache_lru_limits_and_metrics(self):
+        entry = {"centroids": {"A": [0.5] * 19}}
+        cache = ModelCache(max_entries=2, max_bytes=0)
+        for key in ("a", "b"):
+            cache.put(key, entry)
+        self.assertIs(cache.get("a", lambda: None), entry)  # "a" pasa a ser el más reciente
+        cache.put("c", entry)
+        self.assertIsNone(cache.get("b", lambda: None))  # expulsado; se cachea la ausencia
+        st = cache.stats()
+        self.assertEqual((st["hits"], st["misses"], st["entries"]), (1, 1, 2))
+        self.assertEqual(st["evictions"], 2)
+
+        size = estimate_size(entry)
+        cache = ModelCache(max_entries=100, max_bytes=int(size * 1.5))
+        cache.put("a", entry)
+        cache.put("b", entry)
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertLessEqual(cache.stats()["bytes"], size * 1.5)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        # Cachés de proceso: en los tests los ids se reutilizan tras cada rollback
+        views._RESPONSE_CACHE.clear()
+        get_model_cache().invalidate("")
+        self.client = Client(HTTP_HOST="localhost")
+
+    def _get(self, url, etag=None):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag) if etag else self.client.get(url)
+
+    def test_progress_304_until_samples_change(self):
+        _populate_features(5, letters="AB")
+        first = self._get("/vista02/api/progress")
+        self.assertEqual(first.json()["totals"], {"A": 5, "B": 5})
+        self.assertEqual(first["Cache-Control"], "no-cache")
+        self.assertIn("X-Profile-Id", first["Vary"])
+        again = self._get("/vista02/api/progress", first["ETag"])
+        self.assertEqual((again.status_code, again.content), (304, b""))
+        self.assertEqual(again["ETag"], first["ETag"])
+
+        _populate_features(2, letters="C", seed=1)
+        changed = self._get("/vista02/api/progress", first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], first["ETag"])
+        self.assertEqual(changed.json()["totals"], {"A": 5, "B": 5, "C": 2})  # el cuerpo en caché se rehace
+
+        self.client.post("/vista02/api/reset")
+        reset = self._get("/vista02/api/progress", changed["ETag"])
+        self.assertEqual((reset.status_code, reset.json()["total"]), (200, 0))
+
+    def test_last_detected_and_model_follow_their_generation(self):
+        _populate_features(3, letters="A")
+        last = self._get("/vista02/api/last-detected")
+        self.assertEqual(last.json()["letter"], "A")
+        _populate_features(1, letters="B", seed=2)
+        self.assertEqual(self._get("/vista02/api/last-detected", last["ETag"]).json()["letter"], "B")
+
+        first = training.train_from_samples(use_snapshot=False)
+        model = self._get("/vista02/api/model")
+        self.assertEqual(model.json()["model_id"], first.id)
+        self.assertEqual(self._get("/vista02/api/model", model["ETag"]).status_code, 304)
+        # Un modelo nuevo (el trabajo invalida la caché al terminar) cambia ETag y cuerpo
+        second = training.train_from_samples(use_snapshot=False)
+        get_model_cache().invalidate("")
+        newer = self._get("/vista02/api/model", model["ETag"])
+        self.assertEqual((newer.status_code, newer.json()["model_id"]), (200, second.id))
+        # Otro perfil no comparte la entrada en caché
+        other = self.client.get("/vista02/api/progress", HTTP_X_PROFILE_ID="u2")
+        self.assertEqual(other.json()["total"], 0)
+
+
+class AutoTrainTests(TestCase):
+    CFG = {"enabled": True, "new_samples": 10, "drift": 0.5, "debounce": 30.0, "max_delay": 120.0, "min_interval": 300.0}
+
+    def test_thresholds_against_active_model(self):
+        _populate_features(30, letters="AB")
+        model = training.train_from_samples(use_snapshot=False)
+        self.assertEqual(model.trained_max_sample_id, HandSample.objects.order_by("-id").first().id)
+        self.assertEqual(model.letter_counts, {"A": 30, "B": 30})
+
+        _populate_features(8, letters="A", seed=1)
+        st = autotrain.evaluate("", cfg=self.CFG)
+        self.assertEqual((st["new_samples"], st["reasons"]), (8, []))
+        _populate_features(8, letters="C", seed=2)  # letra nueva: 8 / DRIFT_MIN_BASE
+        st = autotrain.evaluate("", cfg=self.CFG)
+        self.assertEqual(st["reasons"], ["new_samples", "drift"])
+        self.assertIsNone(st["due_at"])  # sin ingesta pendiente en este proceso
+
+    def test_debounce_max_delay_and_min_interval(self):
+        due = autotrain.due_at({"first": 0.0, "last": 50.0}, None, self.CFG)
+        self.assertEqual(due, 80.0)  # 30 s de calma tras la última ingesta
+        due = autotrain.due_at({"first": 0.0, "last": 110.0}, None, self.CFG)
+        self.assertEqual(due, 120.0)  # ráfaga continua: como mucho max_delay
+        due = autotrain.due_at({"first": 0.0, "last": 50.0}, 10.0, self.CFG)
+        self.assertEqual(due, 310.0)  # separación mínima entre reentrenamientos
+
+    @override_settings(
+        VISTA02_AUTOTRAIN_ENABLED=True, VISTA02_AUTOTRAIN_NEW_SAMPLES=5,
+        VISTA02_AUTOTRAIN_DEBOUNCE_SECONDS=0, VISTA02_AUTOTRAIN_MIN_INTERVAL_SECONDS=0,
+    )
+    def test_pending_survives_a_running_job(self):
+        _populate_features(10, letters="A")
+        self.addCleanup(autotrain.forget, "")
+        autotrain._PENDING[""] = {"first": 0.0, "last": 0.0}
+        busy = ({"job_id": "manual"}, False)
+        with mock.patch.object(autotrain, "start_training_job", return_value=busy):
+            self.assertEqual(autotrain.tick(now=10.0), 0)
+        self.assertIn("", autotrain._PENDING)  # se reintenta en el próximo tick
+        with mock.patch.object(autotrain, "start_training_job", return_value=({"job_id": "auto"}, True)):
+            self.assertEqual(autotrain.tick(now=20.0), 1)
+        self.assertNotIn("", autotrain._PENDING)
+        self.assertEqual(autotrain._LAST_RUN[""]["job_id"], "auto")
+
+
+class SmoothingTests(TestCase):
+    def test_flicker_is_stabilized_within_window(self):
+        sm = SessionSmoother(max_sessions=4, window_frames=8, window_seconds=0.5)
+        for i, letter in enumerate("AABAANAA"):
+            out = sm.update("s", None if letter == "N" else letter, 0.8, now=1.0 + i * 0.05)
+        self.assertEqual((out["letter"], out["frames"]), ("A", 8))
+        self.assertAlmostEqual(out["stability"], 6 / 8)
+        self.assertTrue(out["stable"])
+        # Frames fuera de la ventana temporal ya no votan
+        out = sm.update("s", "B", 0.8, now=3.0)
+        self.assertEqual((out["letter"], out["frames"], out["stability"]), ("B", 1, 1.0))
+
+    def test_sessions_expire_and_memory_is_fixed(self):
+        sm = SessionSmoother(max_sessions=100, window_frames=8, ttl=10.0)
+        size = sm.stats()["bytes"]
+        for i in range(1000):
+            sm.update(f"cam-{i}", "A", 1.0, now=float(i) / 100)
+        st = sm.stats()
+        self.assertEqual((st["sessions"], st["bytes"]), (100, size))
+        self.assertEqual(st["recycled"], 900)
+        sm.update("late", "A", 1.0, now=100.0)
+        self.assertEqual(sm.stats()["sessions"], 1)  # el resto superó el TTL
+        self.assertEqual(sm.stats()["expired"], 100)
+
+
+class AsyncEndpointTests(TestCase):
+    def setUp(self):
+        get_model_cache().invalidate("")
+        views._RESPONSE_CACHE.clear()
+        self.client = AsyncClient()
+        self.rng = random.Random(11)
+
+    # AsyncClient no aplica las cabeceras del constructor al scope ASGI: van en cada petición
+    def _get(self, path):
+        return self.client.get(path, headers={"X-Profile-Id": "cam"})
+
+    def _post(self, path, body=None):
+        return self.client.post(path, json.dumps(body or {}), content_type="application/json", headers={"X-Profile-Id": "cam"})
+
+    def _batch(self, letter, n, **extra):
+        body = {"letter": letter, "samples": [{"landmarks": _random_landmarks(self.rng)} for _ in range(n)], **extra}
+        return self._post("/vista02/api/samples/batch", body)
+
+    async def test_samples_batch_extracts_and_inserts(self):
+        r = await self._batch("a", 5)
+        self.assertEqual((r.status_code, r.json()["inserted"], r.json()["totals"]), (200, 5, {"A": 5}))
+        rows = [hs async for hs in HandSample.objects.filter(owner="cam")]
+        self.assertEqual(len(rows), 5)
+        for hs in rows:
+            self.assertEqual(hs.feature_vector, extract_feature_vector(hs.landmarks))
+
+        # Un feature sin negociar se ignora y se recalcula; negociado se guarda tal cual
+        lm = _random_landmarks(self.rng)
+        fake = [0.5] * FEATURE_DIM
+        body = {"letter": "B", "samples": [{"landmarks": lm, "feature": fake}]}
+        await self._post("/vista02/api/samples/batch", body)
+        body.update(feature_version=FEATURE_VERSION, feature_checksum=extractor_checksum())
+        await self._post("/vista02/api/samples/batch", body)
+        fvs = [hs.feature_vector async for hs in HandSample.objects.filter(owner="cam", letter="B").order_by("id")]
+        self.assertEqual(fvs, [extract_feature_vector(lm), fake])
+
+        self.assertEqual((await self._batch("1", 1)).status_code, 400)
+        bad = {"letter": "A", "samples": [{"landmarks": [{"x": 0}]}]}
+        r = await self._post("/vista02/api/samples/batch", bad)
+        self.assertEqual(r.status_code, 400)
+        r = await self._batch("A", 1, feature_version="v0", feature_checksum="x")
+        self.assertEqual(r.status_code, 409)
+
+    async def test_concurrent_batches_are_all_inserted(self):
+        responses = await asyncio.gather(*[self._batch(L, 20) for L in "ABCDABCD"])
+        self.assertEqual({r.status_code for r in responses}, {200})
+        r = await self._get("/vista02/api/progress")
+        self.assertEqual((r.json()["total"], r.json()["totals"]), (160, {L: 40 for L in "ABCD"}))
+        last = (await self._get("/vista02/api/last-detected")).json()
+        self.assertIn(last["letter"], "ABCD")
+
+    async def test_reset_clears_samples_models_and_files(self):
+        await self._batch("A", 30)
+        await self._batch("B", 30)
+        other = HandSample(owner="otro", letter="A", landmarks=[], feature_vector=[0.0] * FEATURE_DIM)
+        await other.asave()
+        await sync_to_async(training.train_from_samples)(owner="cam", use_snapshot=False)
+        self.assertEqual((await self._get("/vista02/api/model")).status_code, 200)
+        with tempfile.TemporaryDirectory() as tmp, override_settings(
+            VISTA02_SNAPSHOT_DIR=Path(tmp) / "snap", VISTA02_ARCHIVE_DIR=Path(tmp) / "arch"
+        ):
+            await sync_to_async(snapshot.refresh)(owner="cam")
+            self.assertIsNotNone(snapshot.load_manifest(snapshot.snapshot_dir("cam")))
+            await HandSample.objects.filter(owner="cam", letter="A").aupdate(created_at=timezone.now() - timedelta(days=9))
+            await sync_to_async(archive.archive_samples)("cam", older_than_days=1)
+            self.assertTrue(archive.totals("cam"))
+
+            r = await self._post("/vista02/api/reset")
+            self.assertEqual(r.json()["status"], "ok")
+            self.assertFalse(archive.totals("cam"))
+            self.assertIsNone(snapshot.load_manifest(snapshot.snapshot_dir("cam")))
+        self.assertFalse(await HandSample.objects.filter(owner="cam").aexists())
+        self.assertFalse(await TrainingModel.objects.filter(owner="cam").aexists())
+        self.assertTrue(await HandSample.objects.filter(owner="otro").aexists())
+        progress = (await self._get("/vista02/api/progress")).json()
+        self.assertEqual((progress["total"], progress["archived"]), (0, {}))
+        model = (await self._get("/vista02/api/model")).json()
+        self.assertNotEqual(model.get("owner"), "cam")
+
+    async def test_autotrain_status_counts_new_samples(self):
+        await self._batch("A", 12)
+        r = (await self._get("/vista02/api/train/schedule")).json()
+        self.assertEqual((r["owner"], r["new_samples"]), ("cam", 12))
+
+
+class AdmissionTests(TestCase):
+    async def test_newer_frame_supersedes_the_waiting_one(self):
+        gate = admission.PredictGate(max_active=1, max_waiting=4, wait_timeout=1.0)
+        self.assertEqual(await gate.enter("cam"), admission.ADMITTED)
+        older = asyncio.ensure_future(gate.enter("cam"))
+        await asyncio.sleep(0)
+        newer = asyncio.ensure_future(gate.enter("cam"))
+        self.assertEqual(await older, admission.SUPERSEDED)
+        self.assertFalse(newer.done())
+        gate.leave()
+        self.assertEqual(await newer, admission.ADMITTED)
+        gate.leave()
+        st = gate.stats()
+        self.assertEqual((st["admitted"], st["coalesced"], st["shed"], st["active"], st["waiting"]), (2, 1, 0, 0, 0))
+
+    async def test_sheds_when_queue_is_full_or_wait_times_out(self):
+        gate = admission.PredictGate(max_active=1, max_waiting=1, wait_timeout=0.05)
+        self.assertEqual(await gate.enter(), admission.ADMITTED)
+        waiting = asyncio.ensure_future(gate.enter())
+        await asyncio.sleep(0)
+        self.assertEqual(await gate.enter(), admission.SHED)  # cola llena: sin esperar
+        self.assertEqual(await waiting, admission.SHED)  # espera agotada
+        st = gate.stats()
+        self.assertEqual((st["shed_queue_full"], st["shed_timeout"], st["shed"], st["waiting"]), (1, 1, 2, 0))
+        gate.leave()
+        self.assertEqual(await gate.enter(), admission.ADMITTED)
+
+    async def test_cancelled_waiter_frees_its_place(self):
+        gate = admission.PredictGate(max_active=1, max_waiting=1, wait_timeout=1.0)
+        await gate.enter()
+        waiting = asyncio.ensure_future(gate.enter())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        gate.leave()
+        self.assertEqual(gate.stats()["active"], 0)
+        self.assertEqual(await gate.enter(), admission.ADMITTED)
+
+    def test_waiters_in_other_event_loops_are_woken(self):
+        # Bajo WSGI cada vista async corre en su propio loop y hilo
+        gate = admission.PredictGate(max_active=1, max_waiting=4, wait_timeout=2.0)
+        self.assertEqual(asyncio.run(gate.enter()), admission.ADMITTED)
+        out = []
+        t = threading.Thread(target=lambda: out.append(asyncio.run(gate.enter("cam"))))
+        t.start()
+        while gate.stats()["waiting"] == 0:
+            time.sleep(0.001)
+        gate.leave()
+        t.join(2)
+        self.assertEqual(out, [admission.ADMITTED])
+
+
+class PredictAdmissionEndpointTests(TestCase):
+    def setUp(self):
+        get_model_cache().invalidate("")
+        _populate(20, letters="AB", seed=1)
+        training.train_from_samples(use_snapshot=False)
+        self.gate = admission.PredictGate(max_active=1, max_waiting=2, wait_timeout=1.0)
+        patcher = mock.patch.object(views, "get_predict_gate", return_value=self.gate)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.body = json.dumps({"landmarks": _random_landmarks(random.Random(3))})
+
+    def _post(self, client, cid):
+        return client.post("/vista02/api/predict", self.body, content_type="application/json", headers={"X-Client-Id": cid})
+
+    async def test_superseded_frames_get_200_and_shed_ones_503(self):
+        client = AsyncClient(headers={"Host": "localhost"})
+        self.assertEqual(await self.gate.enter(), admission.ADMITTED)  # plaza ocupada
+        first = asyncio.ensure_future(self._post(client, "cam-1"))
+        while self.gate.stats()["waiting"] < 1:
+            await asyncio.sleep(0.001)
+        second = asyncio.ensure_future(self._post(client, "cam-1"))
+        r = await first
+        self.assertEqual((r.status_code, r.json()), (200, {"status": "superseded", "letter": None}))
+        other = asyncio.ensure_future(self._post(client, "cam-2"))
+        while self.gate.stats()["waiting"] < 2:
+            await asyncio.sleep(0.001)
+        shed = await self._post(client, "cam-3")
+        self.assertEqual((shed.status_code, shed["Retry-After"]), (503, "1"))
+
+        self.gate.leave()
+        for r in await asyncio.gather(second, other):
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(r.json()["status"], "ok")
+        st = self.gate.stats()
+        self.assertEqual((st["admitted"], st["coalesced"], st["shed_queue_full"], st["active"]), (3, 1, 1, 0))
+
+
+class PredictBatchingTests(TestCase):
+    def _model(self, seed, letters="ABCDE"):
+        rng = np.random.default_rng(seed)
+        centroids = {L: rng.random(19).tolist() for L in letters}
+        centroids["E"] = list(centroids["B"])  # empate exacto: gana la primera letra en orden
+        return {"id": seed, "centroids": centroids, "thresholds": {L: 0.2 for L in letters}}
+
+    def _vectors(self, model, n, seed):
+        rng = np.random.default_rng(seed)
+        C = list(model["centroids"].values())
+        # Mitad cerca de un centroide (aceptadas), mitad lejos (rechazadas)
+        return [(np.asarray(C[i % len(C)]) + rng.normal(0, 0.02 if i % 2 else 0.3, 19)).tolist() for i in range(n)]
+
+    def test_vectorized_matches_scalar(self):
+        model = self._model(1)
+        vecs = self._vectors(model, 200, 2)
+        letters = list(model["centroids"])
+        C = np.asarray([model["centroids"][L] for L in letters])
+        got = batching.classify_many(np.asarray(vecs), letters, C, model["thresholds"])
+        expected = [batching.classify_one(fv, model["centroids"], model["thresholds"]) for fv in vecs]
+        self.assertEqual(got, expected)
+        self.assertTrue(any(r[0] is not None for r in expected))
+        self.assertNotIn("E", {r[4] for r in expected})
+
+    def _check(self, batcher, jobs, results, max_batch):
+        for (model, fv), res in zip(jobs, results):
+            self.assertEqual(res, batching.classify_one(fv, model["centroids"], model["thresholds"]))
+        st = batcher.stats()
+        self.assertEqual(st["items"], len(jobs))
+        self.assertLess(st["batches"], len(jobs))
+        self.assertLessEqual(max(int(k) for k in st["batch_sizes"]), max_batch)
+        self.assertEqual(sum(st["queue_delay_ms"]["buckets"].values()), len(jobs))
+
+    def _jobs(self, n):
+        models = [self._model(3), self._model(4)]
+        return [(models[i % 2], fv) for i, fv in enumerate(self._vectors(models[0], n, 5))]
+
+    async def test_concurrent_calls_are_coalesced(self):
+        jobs = self._jobs(24)
+        batcher = batching.PredictBatcher(window_ms=50, max_batch=8)
+        results = await asyncio.gather(*[batcher.classify(*job) for job in jobs])
+        self._check(batcher, jobs, results, 8)
+        # Con la cola llena el lote sale sin esperar la ventana
+        self.assertLess(batcher.stats()["queue_delay_ms"]["max"], 50)
+
+    def test_requests_in_separate_event_loops_are_coalesced(self):
+        # Bajo WSGI cada vista async corre en su propio loop y hilo
+        jobs = self._jobs(12)
+        batcher = batching.PredictBatcher(window_ms=50, max_batch=4)
+        barrier = threading.Barrier(len(jobs))
+        results = [None] * len(jobs)
+
+        def call(i):
+            barrier.wait()
+            results[i] = asyncio.run(batcher.classify(*jobs[i]))
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(len(jobs))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+        self._check(batcher, jobs, results, 4)
+
+    async def test_cancelled_requests_do_not_stall_the_queue(self):
+        jobs = self._jobs(6)
+        batcher = batching.PredictBatcher(window_ms=20, max_batch=2)
+        tasks = [asyncio.ensure_future(batcher.classify(*job)) for job in jobs]
+        await asyncio.sleep(0)
+        tasks[0].cancel()  # líder del primer lote
+        tasks[3].cancel()
+        done = await asyncio.gather(*tasks, return_exceptions=True)
+        for i in (1, 2, 4, 5):
+            model, fv = jobs[i]
+            self.assertEqual(done[i], batching.classify_one(fv, model["centroids"], model["thresholds"]))
+
+    async def test_disabled_batcher_classifies_each_call(self):
+        model, fv = self._jobs(1)[0]
+        batcher = batching.PredictBatcher(window_ms=0, max_batch=8)
+        self.assertEqual(await batcher.classify(model, fv), batching.classify_one(fv, model["centroids"], model["thresholds"]))
+        self.assertEqual(batcher.stats()["batches"], 0)
+
+
+class PredictBatchingEndpointTests(TestCase):
+    async def test_batched_predict_matches_unbatched(self):
+        get_model_cache().invalidate("")
+        await sync_to_async(_populate)(30, letters="ABC", seed=6)
+        await sync_to_async(training.train_from_samples)(use_snapshot=False)
+        client = AsyncClient()
+        rng = random.Random(8)
+        bodies = [json.dumps({"landmarks": _random_landmarks(rng)}) for _ in range(12)]
+
+        async def run(batcher):
+            with mock.patch.object(views, "get_predict_batcher", return_value=batcher):
+                rs = await asyncio.gather(*[
+                    client.post("/vista02/api/predict", b, content_type="application/json") for b in bodies
+                ])
+            return [r.json() for r in rs]
+
+        batcher = batching.PredictBatcher(window_ms=30, max_batch=16)
+        self.assertEqual(await run(batcher), await run(batching.PredictBatcher(0, 16)))
+        self.assertLess(batcher.stats()["batches"], len(bodies))
+
+
+class ModelBundleTests(TestCase):
+    def _jitter(self, rng, lm, s):
+        return [{"x": p["x"] + rng.gauss(0, s), "y": p["y"] + rng.gauss(0, s), "z": p["z"]} for p in lm]
+
+    def test_quantized_bundle_bounds_accuracy_loss(self):
+        rng = random.Random(3)
+        bases = {L: _random_landmarks(rng) for L in "ABCDEF"}
+        HandSample.objects.bulk_create([
+            HandSample(letter=L, landmarks=lm, feature_vector=extract_feature_vector(lm))
+            for L, b in bases.items() for lm in (self._jitter(rng, b, 0.01) for _ in range(30))
+        ])
+        model = training.train_from_samples(use_snapshot=False)
+        entry = {"id": model.id, "centroids": model.centroids, "thresholds": model.thresholds}
+        probes = [extract_feature_vector(self._jitter(rng, b, 0.015)) for b in bases.values() for _ in range(100)]
+        ref = [predict_with_thresholds(fv, model.centroids, model.thresholds) for fv in probes]
+        dim = len(probes[0])
+        for encoding, min_agreement in (("int8", 0.99), ("float16", 0.995)):
+            data = model_bundle.encode(entry, encoding)
+            self.assertEqual(model_bundle.encode(entry, encoding), data)  # determinista
+            self.assertLess(len(data), len(json.dumps(model.centroids)) / 2)
+            dec = model_bundle.decode(data)
+            self.assertEqual(dec["thresholds"], model.thresholds)
+            out = [predict_with_thresholds(fv, dec["centroids"], dec["thresholds"]) for fv in probes]
+            agreement = sum(a[0] == b[0] for a, b in zip(ref, out)) / len(ref)
+            self.assertGreaterEqual(agreement, min_agreement, encoding)
+            if encoding == "int8":
+                # Error por componente <= scale/2, así que la distancia cambia como mucho sqrt(dim)*max(scale)/2
+                C = np.asarray([model.centroids[L] for L in sorted(model.centroids)])
+                bound = np.sqrt(dim) * (C.max(axis=0) - C.min(axis=0)).max() / 255 / 2 + 1e-6
+                self.assertLessEqual(max(abs(a[1] - b[1]) for a, b in zip(ref, out)), bound)
+
+    def test_bundle_endpoint_is_content_addressed(self):
+        _populate_features(10, letters="AB")
+        training.train_from_samples(use_snapshot=False)
+        client = Client(HTTP_HOST="localhost")
+        r = client.get("/vista02/api/model/bundle")
+        self.assertEqual(r.status_code, 302)
+        digest = r["X-Bundle-Digest"]
+        r = client.get(f"/vista02/api/model/bundle/{digest}")
+        self.assertIn("immutable", r["Cache-Control"])
+        self.assertEqual(model_bundle.digest(r.content), digest)
+        self.assertEqual(model_bundle.decode(r.content)["letters"], ["A", "B"])
+        self.assertEqual(client.get("/vista02/api/model/bundle/0000").status_code, 404)
+
+
+class NegotiatedFeatureTests(TestCase):
+    def setUp(self):
+        _populate(20, letters="AB", seed=6, with_missing=False)
+        training.train_from_samples(use_snapshot=False)
+        self.client = Client(HTTP_HOST="localhost")
+        self.lms = _random_landmarks(random.Random(9))
+
+    def _predict(self, payload):
+        return self.client.post("/vista02/api/predict", json.dumps(payload), content_type="application/json")
+
+    def test_negotiated_feature_matches_server_extraction(self):
+        advertised = self.client.get("/vista02/api/model").json()["extractor"]
+        self.assertEqual(advertised["feature_checksum"], extractor_checksum())
+        by_server = self._predict({"landmarks": self.lms}).json()
+        by_client = self._predict({
+            "feature": extract_feature_vector(self.lms),
+            "feature_version": advertised["feature_version"],
+            "feature_checksum": advertised["feature_checksum"],
+        }).json()
+        self.assertEqual(by_client, by_server)
+
+    def test_mismatch_and_unnegotiated_feature_are_rejected(self):
+        fv = extract_feature_vector(self.lms)
+        r = self._predict({"feature": fv, "feature_version": FEATURE_VERSION, "feature_checksum": "00000000"})
+        self.assertEqual(r.status_code, 409)
+        self.assertEqual(r.json()["feature_checksum"], extractor_checksum())
+        self.assertEqual(self._predict({"feature": fv}).status_code, 400)
+
+
+class PredictionLogTests(TestCase):
+    RESULT = {"letter": "A", "distance": 0.1, "threshold": 0.5, "shape_ok": True, "candidate": "A"}
+    real_ensure_thread = staticmethod(PredictionLogger._ensure_thread)
+
+    def setUp(self):
+        # Sin hilo de fondo: los tests vacían el buffer a mano
+        patcher = mock.patch.object(PredictionLogger, "_ensure_thread")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_full_buffer_drops_and_counts(self):
+        lg = PredictionLogger(sample_rate=1.0, capacity=3)
+        accepted = [lg.record("", 1, self.RESULT) for _ in range(5)]
+        self.assertEqual(accepted, [True, True, True, False, False])
+        st = lg.stats()
+        self.assertEqual((st["enqueued"], st["dropped"], st["buffered"]), (3, 2, 3))
+        self.assertFalse(PredictionLogger(sample_rate=0.0).record("", 1, self.RESULT))
+
+    def test_db_sink_writes_in_batches(self):
+        lg = PredictionLogger(sample_rate=1.0, batch_size=4, with_features=False)
+        for i in range(10):
+            lg.record("u1", 7, {**self.RESULT, "distance": float(i)}, feature=[0.5] * 19)
+        self.assertEqual(lg.flush(), 10)
+        self.assertEqual(lg.stats()["flushes"], 3)
+        rows = list(PredictionLog.objects.order_by("distance"))
+        self.assertEqual(len(rows), 10)
+        self.assertEqual((rows[0].owner, rows[0].model_id, rows[0].letter, rows[0].feature_vector), ("u1", 7, "A", None))
+
+    def test_file_sink_writes_jsonl_and_rotates(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        root = Path(tmp.name)
+        lg = PredictionLogger(sample_rate=1.0, sink="file", file_path=root / "pred.jsonl", file_max_bytes=2000, file_backups=2)
+        for _ in range(30):
+            lg.record("", 3, self.RESULT, feature=[0.25] * 19)
+        self.assertEqual(lg.flush(), 30)
+        lg._handler.close()
+        self.assertTrue((root / "pred.jsonl.1").exists())
+        last = json.loads((root / "pred.jsonl").read_text().splitlines()[-1])
+        self.assertEqual((last["model_id"], last["letter"], last["feature_vector"]), (3, "A", [0.25] * 19))
+        self.assertEqual(PredictionLog.objects.count(), 0)
+
+    def test_flush_thread_survives_errors_and_is_restarted(self):
+        lg = PredictionLogger(sample_rate=1.0)
+        with mock.patch("vista02.services.prediction_log.close_old_connections", side_effect=RuntimeError("bd caída")):
+            with self.assertLogs("vista02.services.prediction_log", "WARNING"):
+                lg._flush_once()  # no propaga: el hilo sigue en su bucle
+        dead = threading.Thread(target=lambda: None)
+        dead.start()
+        dead.join()
+        lg._thread = dead
+        with mock.patch.object(lg, "_loop", lambda: None):
+            self.real_ensure_thread(lg)
+        self.assertIsNot(lg._thread, dead)
+
+    def _rows(self, ages_hours, now):
+        PredictionLog.objects.bulk_create(
+            [PredictionLog(owner="u", letter="A", created_at=now - timedelta(hours=h)) for h in ages_hours]
+        )
+
+    def test_purge_by_age_and_row_cap(self):
+        now = timezone.now()
+        self._rows([50] * 5 + [3, 2, 1, 0], now)
+        counts = prediction_log.purge_prediction_logs(
+            now=now, retention_seconds=24 * 3600, max_rows=None, batch_size=2, max_batches=2
+        )
+        self.assertEqual(counts, {"expired": 4, "over_cap": 0})
+        counts = prediction_log.purge_prediction_logs(now=now, retention_seconds=24 * 3600, max_rows=2, batch_size=2)
+        self.assertEqual(counts, {"expired": 1, "over_cap": 2})
+        # Quedan las más recientes
+        ages = sorted(round((now - t).total_seconds() / 3600) for t in PredictionLog.objects.values_list("created_at", flat=True))
+        self.assertEqual(ages, [0, 1])
+        with override_settings(VISTA02_PREDICTION_LOG_RETENTION_SECONDS=None, VISTA02_PREDICTION_LOG_MAX_ROWS=None):
+            self.assertEqual(prediction_log.purge_prediction_logs(), {"expired": 0, "over_cap": 0})
+        out = StringIO()
+        call_command("purge_prediction_logs", "--max-rows", "0", stdout=out)
+        self.assertIn("por encima del tope: 2", out.getvalue())
+        self.assertEqual(PredictionLog.objects.count(), 0)
+
+    def test_flush_thread_purges_the_table_periodically(self):
+        with mock.patch.object(prediction_log, "purge_prediction_logs", return_value={"expired": 3, "over_cap": 1}) as purge:
+            lg = PredictionLogger(sample_rate=1.0, purge_seconds=60)
+            lg._flush_once()
+            purge.assert_not_called()  # aún no toca
+            lg._last_purge -= 61
+            lg._flush_once()
+            lg._flush_once()
+            self.assertEqual((purge.call_count, lg.stats()["purged"]), (1, 4))
+            for other in (PredictionLogger(sample_rate=1.0, sink="file", purge_seconds=60),
+                          PredictionLogger(sample_rate=1.0, purge_seconds=0)):
+                other._last_purge -= 61
+                other._flush_once()
+            self.assertEqual(purge.call_count, 1)
+
+
+@override_settings(VISTA02_PROFILER_TOKEN="s3cret", VISTA02_PROFILER_VIEWS=("predict",))
+class ProfilerTests(TestCase):
+    def setUp(self):
+        get_model_cache().invalidate("")
+        profiling.reset()
+        self.addCleanup(profiling.reset)
+        _populate(20, letters="AB", seed=2)
+        training.train_from_samples(use_snapshot=False)
+        self.client = Client(HTTP_HOST="localhost", HTTP_X_PROFILER_TOKEN="s3cret")
+        self.body = json.dumps({"landmarks": _random_landmarks(random.Random(4))})
+
+    def _predict(self, client=None):
+        r = (client or self.client).post("/vista02/api/predict", self.body, content_type="application/json")
+        self.assertEqual(r.status_code, 200)
+
+    def test_cprofile_includes_work_done_in_the_cpu_pool(self):
+        self._predict()
+        self._predict(Client(HTTP_HOST="localhost"))  # sin token: no se perfila
+        self.assertEqual(profiling.summary()["profiled_requests"], {"predict": 1})
+
+        text = self.client.get("/vista02/api/profiler/predict?format=text&limit=200").content.decode()
+        self.assertIn("extract_feature_vector", text)
+        self.assertIn("classify_one", text)
+        self.assertEqual(self.client.get("/vista02/api/profiler/predict?sort=time").status_code, 200)
+        self.assertEqual(self.client.get("/vista02/api/profiler/predict?sort=bogus").status_code, 400)
+
+        r = self.client.get("/vista02/api/profiler/predict?format=pstats")
+        stats = marshal.loads(r.content)
+        by_name = {func[2]: v for func, v in stats.items()}
+        self.assertEqual(by_name["extract_feature_vector"][1], 1)  # llamadas primitivas
+        self.assertEqual(self.client.get("/vista02/api/profiler/predict?format=collapsed").status_code, 404)
+
+    def test_batched_classification_is_profiled_for_the_profiled_request(self):
+        batcher = batching.PredictBatcher(window_ms=30, max_batch=8)
+        plain = AsyncClient()
+
+        async def both():
+            await asyncio.gather(
+                plain.post("/vista02/api/predict", self.body, content_type="application/json"),
+                plain.post("/vista02/api/predict", self.body, content_type="application/json",
+                           headers={"X-Profiler-Token": "s3cret"}),
+            )
+
+        with mock.patch.object(views, "get_predict_batcher", return_value=batcher):
+            async_to_sync(both)()
+        self.assertEqual(batcher.stats()["batches"], 1)
+        text = profiling.pstats_text("predict", limit=200)
+        self.assertIn("classify_many", text)
+
+    @override_settings(VISTA02_PROFILER_MODE="sample", VISTA02_PROFILER_INTERVAL=0.001)
+    def test_sampler_records_pool_thread_stacks(self):
+        def slow_extract(lms):
+            time.sleep(0.05)
+            return extract_feature_vector(lms)
+
+        with mock.patch.object(views, "extract_feature_vector", slow_extract):
+            self._predict()
+        text = self.client.get("/vista02/api/profiler/predict?format=collapsed").content.decode()
+        lines = text.splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            self.assertGreater(int(line.rsplit(" ", 1)[1]), 0)
+        self.assertIn("slow_extract", text)  # pila del hilo del pool
+        self.assertEqual(self.client.get("/vista02/api/profiler/predict?format=pstats").status_code, 404)
+
+    def test_pool_calls_are_untouched_without_an_active_profile(self):
+        fn = lambda: None  # noqa: E731
+        self.assertIs(profiling.bind(fn), fn)
+
+
+class ProfilerTokenTests(TestCase):
+    @override_settings(VISTA02_PROFILER_TOKEN="s3cret")
+    def test_token_is_required(self):
+        client = Client(HTTP_HOST="localhost")
+        self.assertEqual(client.get("/vista02/api/profiler").status_code, 403)
+        self.assertEqual(client.get("/vista02/api/profiler", HTTP_X_PROFILER_TOKEN="s3creX").status_code, 403)
+        self.assertEqual(client.get("/vista02/api/profiler", HTTP_X_PROFILER_TOKEN="s3cret").status_code, 200)
+
+    @override_settings(VISTA02_PROFILER_TOKEN="")
+    def test_disabled_without_token(self):
+        r = Client(HTTP_HOST="localhost").get("/vista02/api/profiler", HTTP_X_PROFILER_TOKEN="")
+        self.assertEqual(r.status_code, 404)
@@ -2,12 +2,22 @@ from django.urls import path
 from ..views.views import (
     samples_batch,
     train_model,
+    train_status,
+    autotrain_status,
     progress,
     get_model,
+    get_model_bundle,
+    rethreshold_model,
+    model_bundle_by_digest,
     last_detected,
     demo,
     reset_data,
     predict,
+    predict_stats,
+    model_cache_stats,
+    profiler_summary,
+    profiler_view,
+    profiler_reset,
 )
 
 app_name = "vista02"
@@ -15,10 +25,20 @@ app_name = "vista02"
 urlpatterns = [
     path("api/samples/batch", samples_batch, name="samples_batch"),
     path("api/train", train_model, name="train_model"),
+    path("api/train/schedule", autotrain_status, name="autotrain_status"),
+    path("api/train/<str:job_id>", train_status, name="train_status"),
     path("api/progress", progress, name="progress"),
     path("api/model", get_model, name="get_model"),
+    path("api/model/cache", model_cache_stats, name="model_cache_stats"),
+    path("api/model/rethreshold", rethreshold_model, name="rethreshold_model"),
+    path("api/model/bundle", get_model_bundle, name="model_bundle"),
+    path("api/model/bundle/<str:digest>", model_bundle_by_digest, name="model_bundle_by_digest"),
     path("api/last-detected", last_detected, name="last_detected"),
     path("api/reset", reset_data, name="reset_data"),
     path("api/predict", predict, name="predict"),
+    path("api/predict/stats", predict_stats, name="predict_stats"),
+    path("api/profiler", profiler_summary, name="profiler_summary"),
+    path("api/profiler/reset", profiler_reset, name="profiler_reset"),
+    path("api/profiler/<str:view_name>", profiler_view, name="profiler_view"),
     path("demo/", demo, name="demo"),
 ]
@@ -1,48 +1,227 @@
-_MODEL_CACHE: dict | None = None  # {'id':int,'centroids':dict,'thresholds':dict,'letters':list,'feature_version':str}
+"""Views for vista02 with lightweight in-process caches for per-profile TrainingModels (LRU) and GET responses.
 
-def _load_latest_model_from_db():
-    model = TrainingModel.objects.order_by("-created_at").only(
-        "id", "feature_version", "centroids", "letters", "thresholds", "created_at"
-    ).first()
+Samples and models are scoped to a profile (X-Profile-Id header or ?profile=); requests
+without one use the shared profile ''. `predict` falls back to the shared model while a
+profile has none of its own.
+
+The I/O-bound endpoints (samples_batch, progress, get_model, last_detected, reset_data) are
+async views: under ASGI (core/asgi.py) they use Django's async ORM and hand feature extraction
+to a bounded thread pool, so slow inserts do not hold a worker that could serve `predict`.
+`predict` is async too: it waits for admission on the event loop and runs extraction and
+classification in the same pool, so the admission gate can queue, supersede and shed.
+
+What still runs on threads: Django's sync middlewares and every async ORM call (including a
+model-cache miss) go through `sync_to_async`, on a per-request thread. The warm `predict` path
+does not touch the ORM. See API_DOCUMENTATION.md for the measured effect of concurrent recorders.
+"""
+
+from django.shortcuts import render
+from django.http import HttpResponse, HttpResponseNotModified, HttpResponseRedirect, JsonResponse
+from django.views.decorators.http import require_http_methods
+from django.views.decorators.csrf import csrf_exempt
+from django.db.models import Count, Max
+import json
+
+from ..models import DEFAULT_OWNER, OWNER_MAX_LENGTH, HandSample, TrainingModel
+from ..services.feature_extractor import (
+    FEATURE_DIM,
+    FEATURE_VERSION,
+    extract_feature_vector,
+    extractor_checksum,
+    validate_client_feature,
+)
+from ..services.trainer import MIN_THRESH
+from ..services.training import rethreshold
+from ..services.jobs import start_training_job, get_job
+from ..services import snapshot
+from ..services.executor import run_cpu
+from ..services.admission import get_predict_gate, SHED, SUPERSEDED
+from ..services.batching import get_predict_batcher
+from ..services.model_cache import get_model_cache
+from ..services.prediction_log import get_prediction_logger
+from ..services import smoothing
+from ..services import model_bundle
+from ..services import profiling
+from ..services import autotrain
+from ..services import archive
+from ..services.profiling import profiled
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from core.static_pages import serve_static_page
+import os
+import re
+import threading
+import time
+
+
+_MODEL_FIELDS = (
+    "id", "owner", "feature_version", "centroids", "letters", "thresholds",
+    "threshold_method", "threshold_param", "min_threshold", "created_at",
+)
+
+
+def _model_cache_entry(model):
     if not model:
         return None
     return {
         "id": model.id,
+        "owner": model.owner,
         "feature_version": model.feature_version,
         "centroids": model.centroids,
         "letters": model.letters,
         "thresholds": getattr(model, 'thresholds', {}) or {},
+        "threshold_method": model.threshold_method,
+        "threshold_param": model.threshold_param,
+        "min_threshold": model.min_threshold,
         "created_at": model.created_at,
     }
 
-def _get_cached_model():
-    global _MODEL_CACHE
-    if _MODEL_CACHE is None:
-        _MODEL_CACHE = _load_latest_model_from_db()
-    return _MODEL_CACHE
+def _latest_model_qs(owner):
+    return TrainingModel.objects.filter(owner=owner).order_by("-created_at").only(*_MODEL_FIELDS)
 
-def _invalidate_model_cache():
-    global _MODEL_CACHE
-    _MODEL_CACHE = None
-"""Views for vista02 with lightweight in-process cache for the latest TrainingModel."""
+async def _aload_latest_model_from_db(owner):
+    return _model_cache_entry(await _latest_model_qs(owner).afirst())
 
-from django.shortcuts import render
-from django.http import JsonResponse
-from django.views.decorators.http import require_http_methods
-from django.views.decorators.csrf import csrf_exempt
-from django.db.models import Count
-import json
+async def _aget_cached_model(owner):
+    """Modelo de `owner` desde la caché LRU; si el perfil aún no tiene uno, el compartido."""
+    cache = get_model_cache()
+    model = await cache.aget(owner, lambda: _aload_latest_model_from_db(owner))
+    if model is None and owner != DEFAULT_OWNER:
+        model = await cache.aget(DEFAULT_OWNER, lambda: _aload_latest_model_from_db(DEFAULT_OWNER))
+    return model
+
+def _invalidate_model_cache(owner):
+    get_model_cache().invalidate(owner)
+
+
+# Cuerpos JSON ya serializados por (endpoint, perfil) para la generación vigente: clave -> (generación, bytes)
+_RESPONSE_CACHE: dict = {}
+# Tope de entradas (una por endpoint y perfil); al superarlo se descarta la más antigua
+_RESPONSE_CACHE_MAX = 1024
+
+
+async def _data_generation(owner):
+    """Generación de las muestras de `owner`: su id máximo (los ids no se reutilizan y las muestras
+    de un perfil solo crecen o se vacían por completo), así que cambia con cada inserción o reinicio.
+    El archivado borra filas viejas sin mover el máximo, por eso se añade la generación del archivo."""
+    max_id = (await HandSample.objects.filter(owner=owner).aaggregate(m=Max("id")))["m"] or 0
+    return f"{max_id}.{archive.generation(owner)}"
+
+
+def _etag_matches(request, etag):
+    inm = request.META.get("HTTP_IF_NONE_MATCH")
+    if not inm:
+        return False
+    if inm.strip() == "*":
+        return True
+    return etag in {t.strip().removeprefix("W/") for t in inm.split(",")}
+
+
+async def _cached_json(request, key, owner, generation, build):
+    """Responde 304 si el cliente tiene la generación vigente; si no, sirve el cuerpo
+    serializado en caché (o lo construye con `await build()` una sola vez por generación)."""
+    etag = f'"{key}-{owner}-{generation}"' if owner else f'"{key}-{generation}"'
+    if _etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        entry = _RESPONSE_CACHE.get((key, owner))
+        if entry is None or entry[0] != generation:
+            entry = (generation, JsonResponse(await build()).content)
+            _RESPONSE_CACHE[(key, owner)] = entry
+            if len(_RESPONSE_CACHE) > _RESPONSE_CACHE_MAX:
+                del _RESPONSE_CACHE[next(iter(_RESPONSE_CACHE))]
+        response = HttpResponse(entry[1], content_type="application/json")
+    response["ETag"] = etag
+    # La misma URL sirve datos distintos según el perfil
+    response["Vary"] = "X-Profile-Id"
+    # El cliente puede guardar la respuesta pero debe revalidarla siempre
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+_OWNER_RE = re.compile(r"^[A-Za-z0-9_.-]{1,%d}$" % OWNER_MAX_LENGTH)
+
+
+def _owner_id(request):
+    """Perfil del llamador: cabecera X-Profile-Id o parámetro ?profile=. '' es el perfil compartido.
+
+    Devuelve None si el identificador no es válido.
+    """
+    owner = (request.META.get("HTTP_X_PROFILE_ID") or request.GET.get("profile") or "").strip()
+    if not owner:
+        return DEFAULT_OWNER
+    return owner if _OWNER_RE.match(owner) and owner not in (".", "..") else None
+
+
+def _invalid_owner():
+    return JsonResponse({"status": "error", "message": "Perfil inválido"}, status=400)
+
+
+def _extractor_mismatch():
+    return JsonResponse({
+        "status": "error",
+        "message": "Extractor de features incompatible",
+        "feature_version": FEATURE_VERSION,
+        "feature_checksum": extractor_checksum(),
+    }, status=409)
+
+
+def _negotiated(payload):
+    """None si el cliente no negocia el extractor; True si coincide; False si no coincide."""
+    version = payload.get("feature_version")
+    checksum = payload.get("feature_checksum")
+    if version is None and checksum is None:
+        return None
+    return version == FEATURE_VERSION and checksum == extractor_checksum()
 
-from ..models import HandSample, TrainingModel
-from ..services.feature_extractor import extract_feature_vector
-from ..services.trainer import compute_centroids, compute_thresholds, predict_with_thresholds
-from django.conf import settings
-import os
+
+def _build_samples(letter, samples, owner, trust_feature=False):
+    """Valida el lote y calcula en CPU los features que falten.
+
+    El feature del cliente solo se usa si negoció el extractor (`trust_feature`).
+    """
+    to_create = []
+    for s in samples:
+        lm = s.get("landmarks") if isinstance(s, dict) else None
+        fv = s.get("feature") if isinstance(s, dict) else None
+        if not isinstance(lm, list) or len(lm) != 21:
+            continue
+        if fv is not None and trust_feature:
+            try:
+                fv = validate_client_feature(fv)
+            except (TypeError, ValueError):
+                fv = None
+        else:
+            fv = None
+        # Si no viene un feature utilizable, lo calculamos aquí
+        if fv is None:
+            try:
+                fv = extract_feature_vector(lm)
+            except Exception:
+                continue
+        to_create.append(HandSample(owner=owner, letter=letter, landmarks=lm, feature_vector=fv))
+    return to_create
+
+
+# SQLite admite un solo escritor y su espera (busy timeout) no es equitativa: con muchos
+# lotes concurrentes alguno esperaba más de 5 s y fallaba. En el proceso se insertan por turnos.
+_INSERT_LOCK = threading.Lock()
+
+
+def _insert_samples(objs):
+    with _INSERT_LOCK:
+        HandSample.objects.bulk_create(objs, batch_size=200)
+
+
+async def _sample_totals(owner):
+    qs = HandSample.objects.filter(owner=owner).values("letter").annotate(c=Count("id"))
+    return {row["letter"]: row["c"] async for row in qs}
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def samples_batch(request):
+@profiled("samples_batch")
+async def samples_batch(request):
     """
     Recibe un lote de muestras para una letra.
     Body JSON:
@@ -51,15 +230,18 @@ def samples_batch(request):
     "samples": [
         {"landmarks": [ {"x":..,"y":..,"z":..}, ... (21) ... ], "feature": [ ... ]},
         ...
-    ]
+    ],
+    "feature_version": "v1", "feature_checksum": "..."  // opcional: sin ellos se ignora "feature"
     }
     """
+    owner = _owner_id(request)
+    if owner is None:
+        return _invalid_owner()
     try:
         payload = json.loads(request.body.decode("utf-8"))
     except Exception:
         return JsonResponse({"status": "error", "message": "JSON inválido"}, status=400)
 
-    import re
     letter = str(payload.get("letter", "")).upper()
     # Aceptar letras estáticas A..Z y Ñ (ampliable si añaden más)
     if not re.match(r"^[A-ZÑ]$", letter):
@@ -69,27 +251,20 @@ def samples_batch(request):
     if not isinstance(samples, list) or not samples:
         return JsonResponse({"status": "error", "message": "samples vacío"}, status=400)
 
-    to_create = []
-    for s in samples:
-        lm = s.get("landmarks")
-        fv = s.get("feature")
-        if not isinstance(lm, list) or len(lm) != 21:
-            continue
-        # Si no viene feature, lo calculamos aquí
-        if fv is None:
-            try:
-                fv = extract_feature_vector(lm)
-            except Exception:
-                continue
-        to_create.append(HandSample(letter=letter, landmarks=lm, feature_vector=fv))
+    negotiated = _negotiated(payload)
+    if negotiated is False:
+        return _extractor_mismatch()
+
+    # La extracción es CPU: fuera del event loop, en el pool acotado
+    to_create = await run_cpu(_build_samples, letter, samples, owner, bool(negotiated))
 
     if not to_create:
         return JsonResponse({"status": "error", "message": "No se pudieron procesar muestras válidas"}, status=400)
 
-    HandSample.objects.bulk_create(to_create, batch_size=200)
+    await sync_to_async(_insert_samples)(to_create)
+    autotrain.notify_samples(owner)
 
-    counts = HandSample.objects.values("letter").annotate(c=Count("id"))
-    summary = {row["letter"]: row["c"] for row in counts}
+    summary = await _sample_totals(owner)
 
     return JsonResponse({
         "status": "ok",
@@ -100,99 +275,250 @@ def samples_batch(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@profiled("train_model")
 def train_model(request):
     """
-    Recalcula centroides por letra a partir de HandSample.feature_vector y guarda TrainingModel.
-    """
-    # Recolectar features por letra
-    by_letter = {}
-    qs = HandSample.objects.all().only("letter", "feature_vector")
-    for hs in qs:
-        fv = hs.feature_vector
-        if not isinstance(fv, list):
-            # Recalcular si no existe
-            try:
-                fv = extract_feature_vector(hs.landmarks)
-            except Exception:
-                continue
-        by_letter.setdefault(hs.letter, []).append(fv)
+    Lanza en segundo plano el recálculo de centroides por letra del perfil y devuelve el id del trabajo.
+    Si ese perfil ya tiene un entrenamiento en curso, devuelve ese mismo trabajo.
+    El progreso se consulta en /api/train/<job_id>.
 
-    if not by_letter:
+    Body JSON opcional: {"include_archive": true} para entrenar también con las muestras
+    archivadas (por defecto settings.VISTA02_TRAIN_INCLUDE_ARCHIVE).
+    """
+    owner = _owner_id(request)
+    if owner is None:
+        return _invalid_owner()
+    include_archive = None
+    try:
+        # Sin body JSON (como el POST vacío del frontend) se usan las opciones por defecto
+        if request.content_type == "application/json":
+            include_archive = json.loads(request.body.decode("utf-8") or "{}").get("include_archive")
+    except (ValueError, AttributeError):
+        return JsonResponse({"status": "error", "message": "JSON inválido"}, status=400)
+    if include_archive is not None and not isinstance(include_archive, bool):
+        return JsonResponse({"status": "error", "message": "include_archive debe ser booleano"}, status=400)
+    with_archive = include_archive
+    if with_archive is None:
+        with_archive = getattr(settings, "VISTA02_TRAIN_INCLUDE_ARCHIVE", False)
+    if not HandSample.objects.filter(owner=owner).exists() and not (with_archive and archive.totals(owner)):
         return JsonResponse({"status": "error", "message": "No hay muestras para entrenar"}, status=400)
-
-    centroids = compute_centroids(by_letter)
-    # Calcular umbrales por percentil (usa valor por defecto en trainer.py)
-    thresholds = compute_thresholds(by_letter, centroids)  # devuelve { 'A': thrA, ... }
-    model = TrainingModel.objects.create(
-        feature_version="v1",
-        centroids=centroids,
-        letters=sorted(list(by_letter.keys())),
-        thresholds=thresholds,
-        threshold_method="percentile",
-        threshold_param=0.88,
+    job, created = start_training_job(
+        on_success=lambda: _invalidate_model_cache(owner), owner=owner, include_archive=include_archive
     )
-    _invalidate_model_cache()
+    return JsonResponse({"status": "ok", "created": created, **job}, status=202)
+
+
+@require_http_methods(["GET"])
+def train_status(request, job_id):
+    """Devuelve el estado de un trabajo de entrenamiento (muestras leídas, letras, tiempo, modelo)."""
+    job = get_job(job_id)
+    if job is None:
+        return JsonResponse({"status": "error", "message": "Trabajo no encontrado"}, status=404)
+    return JsonResponse({"status": "ok", **job})
+
+
+@require_http_methods(["GET"])
+async def autotrain_status(request):
+    """Estado del reentrenamiento automático del perfil: muestras nuevas, deriva y cuándo toca."""
+    owner = _owner_id(request)
+    if owner is None:
+        return _invalid_owner()
+    state = await sync_to_async(autotrain.evaluate)(owner)
+    return JsonResponse({"status": "ok", "owner": owner, **state})
+
+
+@require_http_methods(["GET"])
+async def progress(request):
+    """Devuelve conteo por letra y total (304 si no hubo muestras nuevas desde el ETag del cliente)."""
+    owner = _owner_id(request)
+    if owner is None:
+        return _invalid_owner()
+
+    async def build():
+        summary = await _sample_totals(owner)
+        total = sum(summary.values())
+        archived = await sync_to_async(archive.totals, thread_sensitive=False)(owner)
+        return {"status": "ok", "totals": summary, "total": total, "archived": archived}
+
+    return await _cached_json(request, "progress", owner, await _data_generation(owner), build)
+
+
+@require_http_methods(["GET"])
+async def get_model(request):
+    """Devuelve el último modelo del perfil, o el compartido si aún no tiene (ETag por id de modelo)."""
+    owner = _owner_id(request)
+    if owner is None:
+        return _invalid_owner()
+    model_cached = await _aget_cached_model(owner)
+    if not model_cached:
+        return JsonResponse({"status": "error", "message": "Modelo no encontrado"}, status=404)
+
+    async def build():
+        return {
+            "status": "ok",
+            "model_id": model_cached["id"],
+            "owner": model_cached["owner"],
+            "feature_version": model_cached.get("feature_version"),
+            # Extractor vigente en el servidor: los clientes con la misma huella pueden enviar "feature"
+            "extractor": {"feature_version": FEATURE_VERSION, "feature_checksum": extractor_checksum(), "dim": FEATURE_DIM},
+            "centroids": model_cached.get("centroids"),
+            "letters": model_cached.get("letters"),
+            "thresholds": model_cached.get("thresholds", {}),
+            "threshold_method": model_cached.get("threshold_method"),
+            "threshold_param": model_cached.get("threshold_param"),
+            "min_threshold": model_cached.get("min_threshold"),
+            "created_at": model_cached.get("created_at").isoformat() if model_cached.get("created_at") else None,
+        }
+
+    # La huella del extractor forma parte de la generación: cambia si se despliega otro extractor
+    return await _cached_json(request, "model", owner, f'{model_cached["id"]}-{extractor_checksum()}', build)
+
+
+def _rethreshold_latest(owner, percentile, min_thresh):
+    base = TrainingModel.objects.filter(owner=owner).order_by("-created_at").first()
+    if base is None:
+        return None, None
+    return base, rethreshold(base, percentile, min_thresh)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def rethreshold_model(request):
+    """Crea un modelo con los centroides del vigente y umbrales nuevos, sin reentrenar.
+
+    Body JSON: {"percentile": 0.9, "min_threshold": 0.6} (ambos opcionales; por defecto
+    los del modelo vigente). Los umbrales salen de las distribuciones de distancias
+    guardadas al entrenar y el modelo nuevo reemplaza al anterior en la caché.
+    """
+    owner = _owner_id(request)
+    if owner is None:
+        return _invalid_owner()
+    try:
+        payload = json.loads(request.body.decode("utf-8") or "{}")
+        percentile = payload.get("percentile")
+        min_thresh = payload.get("min_threshold")
+        percentile = None if percentile is None else float(percentile)
+        min_thresh = None if min_thresh is None else float(min_thresh)
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({"status": "error", "message": "JSON inválido"}, status=400)
+    if percentile is not None and not 0.0 < percentile <= 1.0:
+        return JsonResponse({"status": "error", "message": "percentile debe estar en (0, 1]"}, status=400)
+    if min_thresh is not None and not min_thresh >= 0.0:
+        return JsonResponse({"status": "error", "message": "min_threshold debe ser >= 0"}, status=400)
+
+    current = await _aget_cached_model(owner)
+    if not current or current["owner"] != owner:
+        return JsonResponse({"status": "error", "message": "El perfil no tiene modelo entrenado"}, status=404)
+    if percentile is None:
+        percentile = current.get("threshold_param")
+    if min_thresh is None:
+        min_thresh = current.get("min_threshold")
+    if min_thresh is None:
+        min_thresh = MIN_THRESH
+
+    started = time.perf_counter()
+    try:
+        base, model = await sync_to_async(_rethreshold_latest)(owner, percentile, min_thresh)
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": f"{e}; hay que reentrenar"}, status=409)
+    if model is None:
+        return JsonResponse({"status": "error", "message": "El perfil no tiene modelo entrenado"}, status=404)
+    # Cambio en caliente: la próxima predicción carga el modelo nuevo
+    _invalidate_model_cache(owner)
     return JsonResponse({
         "status": "ok",
         "model_id": model.id,
-        "letters": model.letters,
-        "centroids": model.centroids,
+        "previous_model_id": base.id,
+        "threshold_param": model.threshold_param,
+        "min_threshold": model.min_threshold,
         "thresholds": model.thresholds,
-        "created_at": model.created_at.isoformat(),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
     })
 
 
-@require_http_methods(["GET"])
-def progress(request):
-    """Devuelve conteo por letra y total."""
-    counts = HandSample.objects.values("letter").annotate(c=Count("id"))
-    summary = {row["letter"]: row["c"] for row in counts}
-    total = sum(summary.values())
-    return JsonResponse({"status": "ok", "totals": summary, "total": total})
+_BUNDLE_IMMUTABLE = "public, max-age=31536000, immutable"
 
 
 @require_http_methods(["GET"])
-def get_model(request):
-    """Devuelve el último modelo entrenado."""
-    model_cached = _get_cached_model()
+async def get_model_bundle(request):
+    """Redirige al paquete binario compacto del modelo vigente (?encoding=int8|float16).
+
+    El destino está direccionado por contenido (`bundle/<digest>`) y se cachea para siempre;
+    esta redirección no se cachea, así que un modelo nuevo cambia el destino.
+    """
+    owner = _owner_id(request)
+    if owner is None:
+        return _invalid_owner()
+    encoding = request.GET.get("encoding", "int8")
+    if encoding not in model_bundle.ENCODINGS:
+        return JsonResponse({"status": "error", "message": "encoding debe ser int8 o float16"}, status=400)
+    model_cached = await _aget_cached_model(owner)
     if not model_cached:
         return JsonResponse({"status": "error", "message": "Modelo no encontrado"}, status=404)
-    return JsonResponse({
-        "status": "ok",
-        "model_id": model_cached["id"],
-        "feature_version": model_cached.get("feature_version"),
-        "centroids": model_cached.get("centroids"),
-        "letters": model_cached.get("letters"),
-        "thresholds": model_cached.get("thresholds", {}),
-        "threshold_method": 'percentile',
-        "threshold_param": 0.88,
-        "created_at": model_cached.get("created_at").isoformat() if model_cached.get("created_at") else None,
-    })
+    digest, _ = model_bundle.bundle_for(model_cached, encoding)
+    # Relativa a .../model/bundle para funcionar con y sin el prefijo /vista02/api/
+    resp = HttpResponseRedirect(f"bundle/{digest}")
+    resp["Cache-Control"] = "no-cache"
+    resp["Vary"] = "X-Profile-Id"
+    resp["X-Bundle-Digest"] = digest
+    return resp
 
 
 @require_http_methods(["GET"])
-def last_detected(request):
-    """Devuelve la última letra que se guardó (última muestra)."""
-    hs = HandSample.objects.order_by("-created_at").first()
-    if not hs:
-        return JsonResponse({"status": "ok", "letter": None})
-    return JsonResponse({"status": "ok", "letter": hs.letter, "created_at": hs.created_at.isoformat()})
+async def model_bundle_by_digest(request, digest):
+    """Paquete inmutable por digest. Si no está en memoria se reconstruye desde el modelo del perfil."""
+    etag = f'"{digest}"'
+    if _etag_matches(request, etag):
+        resp = HttpResponseNotModified()
+        resp["ETag"] = etag
+        return resp
+    data = model_bundle.lookup(digest)
+    if data is None:
+        owner = _owner_id(request)
+        model_cached = await _aget_cached_model(owner) if owner is not None else None
+        for encoding in model_bundle.ENCODINGS if model_cached else ():
+            d, candidate = model_bundle.bundle_for(model_cached, encoding)
+            if d == digest:
+                data = candidate
+                break
+    if data is None:
+        return JsonResponse({"status": "error", "message": "Paquete no encontrado"}, status=404)
+    resp = HttpResponse(data, content_type="application/octet-stream")
+    resp["ETag"] = etag
+    resp["Cache-Control"] = _BUNDLE_IMMUTABLE
+    return resp
+
+
+@require_http_methods(["GET"])
+async def last_detected(request):
+    """Devuelve la última letra que se guardó (última muestra del perfil)."""
+    owner = _owner_id(request)
+    if owner is None:
+        return _invalid_owner()
+
+    async def build():
+        hs = await HandSample.objects.filter(owner=owner).order_by("-created_at").only("letter", "created_at").afirst()
+        if not hs:
+            return {"status": "ok", "letter": None}
+        return {"status": "ok", "letter": hs.letter, "created_at": hs.created_at.isoformat()}
+
+    return await _cached_json(request, "last-detected", owner, await _data_generation(owner), build)
 
 # Create your views here.
 
 
 @require_http_methods(["GET"])
 def demo(request):
-    """Sirve el archivo ejemplo2_frontend.html desde la raíz del proyecto para evitar CORS."""
+    """Sirve el archivo ejemplo2_frontend.html desde la raíz del proyecto para evitar CORS.
+
+    Se sirve desde caché en memoria, precomprimido y con ETag/Last-Modified (304 en visitas repetidas).
+    """
     root = str(getattr(settings, 'BASE_DIR', '.'))
     html_path = os.path.join(root, 'ejemplo2_frontend.html')
-    if not os.path.exists(html_path):
-        return JsonResponse({"status": "error", "message": "ejemplo2_frontend.html no encontrado"}, status=404)
     try:
-        with open(html_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        from django.http import HttpResponse
-        return HttpResponse(content, content_type='text/html; charset=utf-8')
+        return serve_static_page(request, html_path, content_type='text/html; charset=utf-8')
+    except FileNotFoundError:
+        return JsonResponse({"status": "error", "message": "ejemplo2_frontend.html no encontrado"}, status=404)
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
 
@@ -205,27 +531,159 @@ def demo(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def reset_data(request):
-    """Elimina todas las muestras y modelos entrenados."""
+async def reset_data(request):
+    """Elimina todas las muestras y modelos entrenados del perfil."""
+    owner = _owner_id(request)
+    if owner is None:
+        return _invalid_owner()
     try:
-        HandSample.objects.all().delete()
-        TrainingModel.objects.all().delete()
-        _invalidate_model_cache()
+        await HandSample.objects.filter(owner=owner).adelete()
+        await TrainingModel.objects.filter(owner=owner).adelete()
+        _invalidate_model_cache(owner)
+        autotrain.forget(owner)
+        await sync_to_async(snapshot.clear, thread_sensitive=False)(snapshot.snapshot_dir(owner))
+        await sync_to_async(archive.clear, thread_sensitive=False)(archive.archive_dir(owner))
         return JsonResponse({"status": "ok", "message": "Datos reiniciados"})
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
 
 
+def _client_id(request):
+    """Identificador para agrupar frames del mismo cliente: cabecera X-Client-Id o sesión."""
+    cid = (request.META.get("HTTP_X_CLIENT_ID") or "").strip()
+    if cid:
+        return cid[:128]
+    session = getattr(request, "session", None)
+    return session.session_key if session is not None else None
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@profiled("predict")
+async def predict(request):
+    """Reconocimiento en backend con control de admisión.
+
+    Vista async: la espera de turno no ocupa un hilo y la extracción y la clasificación van
+    al pool de CPU. Si el mismo cliente envía un frame más nuevo mientras este espera turno,
+    se responde {"status":"superseded","letter":null} sin procesarlo. Si el servidor está
+    saturado se responde 503 con Retry-After.
+    """
+    owner = _owner_id(request)
+    if owner is None:
+        return _invalid_owner()
+    gate = get_predict_gate()
+    verdict = await gate.enter(_client_id(request))
+    if verdict == SUPERSEDED:
+        return JsonResponse({"status": "superseded", "letter": None})
+    if verdict == SHED:
+        resp = JsonResponse({"status": "error", "message": "Servidor ocupado, reintente"}, status=503)
+        resp["Retry-After"] = "1"
+        return resp
+    try:
+        return await _predict(request, owner)
+    finally:
+        gate.leave()
+
+
+@require_http_methods(["GET"])
+def predict_stats(request):
+    """Contadores del control de admisión de `predict` (admitidas, descartadas, agrupadas),
+    del registro de predicciones (encoladas, escritas, descartadas por buffer lleno),
+    del suavizado por sesión (sesiones vivas, expiradas, recicladas) y de los micro-lotes
+    (tamaño de lote y espera añadida en cola)."""
+    return JsonResponse({
+        "status": "ok",
+        **get_predict_gate().stats(),
+        "log": get_prediction_logger().stats(),
+        "smoothing": smoothing.get_smoother().stats(),
+        "batching": get_predict_batcher().stats(),
+    })
+
+
+@require_http_methods(["GET"])
+def model_cache_stats(request):
+    """Métricas de la caché LRU de modelos (entradas, bytes, aciertos, fallos, expulsiones)."""
+    return JsonResponse({"status": "ok", **get_model_cache().stats()})
+
+
+def _profiler_forbidden(request):
+    """None si la petición trae el token del perfilador; si no, la respuesta de error."""
+    if not getattr(settings, "VISTA02_PROFILER_TOKEN", ""):
+        return JsonResponse({"status": "error", "message": "Perfilador deshabilitado"}, status=404)
+    if not profiling.token_matches(request):
+        return JsonResponse({"status": "error", "message": "Token inválido"}, status=403)
+    return None
+
+
+@require_http_methods(["GET"])
+def profiler_summary(request):
+    """Configuración del perfilador y peticiones perfiladas por vista (requiere X-Profiler-Token)."""
+    denied = _profiler_forbidden(request)
+    if denied:
+        return denied
+    return JsonResponse({"status": "ok", **profiling.summary()})
+
+
+@require_http_methods(["GET"])
+def profiler_view(request, view_name):
+    """Perfil agregado de una vista.
+
+    ?format=text (por defecto, top por tiempo acumulado), pstats (archivo para `python -m pstats`)
+    o collapsed (pilas colapsadas para flamegraph, modo "sample").
+    """
+    denied = _profiler_forbidden(request)
+    if denied:
+        return denied
+    fmt = request.GET.get("format", "text")
+    if fmt == "pstats":
+        data = profiling.pstats_bytes(view_name)
+        if data is not None:
+            response = HttpResponse(data, content_type="application/octet-stream")
+            response["Content-Disposition"] = f'attachment; filename="{view_name}.pstats"'
+            return response
+    elif fmt == "collapsed":
+        text = profiling.collapsed_stacks(view_name)
+        if text is not None:
+            return HttpResponse(text, content_type="text/plain; charset=utf-8")
+    elif fmt == "text":
+        try:
+            limit = int(request.GET.get("limit", 40))
+        except ValueError:
+            limit = 40
+        try:
+            text = profiling.pstats_text(view_name, limit=limit, sort=request.GET.get("sort", "cumulative"))
+        except ValueError as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+        if text is not None:
+            return HttpResponse(text, content_type="text/plain; charset=utf-8")
+    else:
+        return JsonResponse({"status": "error", "message": "Formato inválido"}, status=400)
+    return JsonResponse({"status": "error", "message": "Sin datos de perfil para esa vista"}, status=404)
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
-def predict(request):
+def profiler_reset(request):
+    """Descarta los perfiles acumulados (requiere X-Profiler-Token)."""
+    denied = _profiler_forbidden(request)
+    if denied:
+        return denied
+    profiling.reset()
+    return JsonResponse({"status": "ok"})
+
+
+async def _predict(request, owner):
     """Reconocimiento en backend.
 
-    Body JSON:
-    {
-      "landmarks": [ {"x":..,"y":..,"z":..}, ... 21 ... ],
-      "feature": [ ... ]  // opcional
-    }
+    Body JSON, una de dos formas:
+    {"landmarks": [ {"x":..,"y":..,"z":..}, ... 21 ... ]}             // el servidor extrae el feature
+    {"feature": [ ... ], "feature_version": "v1", "feature_checksum": "..."}  // cliente negociado
+
+    Los valores de versión y checksum son los que anuncia GET /api/model en "extractor";
+    si no coinciden se responde 409. Un "feature" sin negociar no se acepta.
+
+    Con "smooth": true y un identificador de cliente (X-Client-Id o sesión) se añade
+    "smoothed": la letra estabilizada de los últimos frames de ese cliente.
 
     Devuelve: {"status":"ok", "letter": "A" | null, "distance": float, "threshold": float}
     """
@@ -235,39 +693,38 @@ def predict(request):
         return JsonResponse({"status": "error", "message": "JSON inválido"}, status=400)
 
     lms = payload.get("landmarks")
-    fv = payload.get("feature")
     dynamic = bool(payload.get("dynamic", False))
-    # Preferimos extraer en servidor para asegurar coherencia con el modelo entrenado
-    if isinstance(lms, list) and len(lms) == 21:
+    negotiated = _negotiated(payload)
+    if negotiated is False:
+        return _extractor_mismatch()
+    if negotiated:
+        # Mismo extractor que el servidor: se usa el feature del cliente sin recalcular
+        try:
+            fv = validate_client_feature(payload.get("feature"))
+        except (TypeError, ValueError) as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+    elif isinstance(lms, list) and len(lms) == 21:
         try:
-            fv = extract_feature_vector(lms)
+            fv = await run_cpu(extract_feature_vector, lms)
         except Exception:
             return JsonResponse({"status": "error", "message": "no se pudo extraer feature"}, status=400)
-    elif fv is None:
+    elif payload.get("feature") is not None:
+        return JsonResponse({
+            "status": "error",
+            "message": "feature requiere feature_version y feature_checksum (ver GET /api/model)",
+        }, status=400)
+    else:
         return JsonResponse({"status": "error", "message": "landmarks o feature faltan"}, status=400)
 
-    # Cargar último modelo (centroides) usando caché en memoria
-    model_cached = _get_cached_model()
+    # Cargar el modelo del perfil (centroides) usando la caché LRU en memoria
+    model_cached = await _aget_cached_model(owner)
     if not model_cached:
         return JsonResponse({"status": "ok", "letter": None, "distance": None, "threshold": None})
 
-    centroids = model_cached["centroids"] or {}
     thresholds = model_cached.get("thresholds", {}) or {}
-    letter, dist, thr, shape_ok = predict_with_thresholds(fv, centroids, thresholds)
-    # Además, calcular candidato más cercano (aunque no pase umbral) para diagnóstico
-    bestL = None
-    bestD = float('inf')
-    for L, c in centroids.items():
-        # l2 aquí replicando trainer._l2 para evitar import interno
-        m = min(len(fv), len(c))
-        s = 0.0
-        for i in range(m):
-            d = float(fv[i]) - float(c[i])
-            s += d * d
-        dL = s ** 0.5
-        if dL < bestD:
-            bestD = dL
-            bestL = L
+    # Letra aceptada y candidato más cercano (aunque no pase umbral) para diagnóstico; con
+    # micro-lotes activos se clasifica junto con las peticiones concurrentes (en el pool de CPU)
+    letter, dist, thr, shape_ok, bestL, bestD = await get_predict_batcher().classify(model_cached, fv)
     # Aceptación suave para gestos dinámicos (p. ej., 'J') cuando dynamic=true
     accepted_dynamic = False
     DYNAMIC_LETTERS = {"J", "Ñ", "Z"}
@@ -282,7 +739,7 @@ def predict(request):
             shape_ok = False
             accepted_dynamic = True
 
-    return JsonResponse({
+    result = {
         "status": "ok",
         "letter": letter,
         "distance": dist,
@@ -292,4 +749,12 @@ def predict(request):
         "candidate_distance": bestD,
         "accepted_dynamic": accepted_dynamic,
         "dynamic": dynamic,
-    })
+    }
+    if payload.get("smooth"):
+        cid = _client_id(request)
+        result["smoothed"] = None if cid is None else smoothing.get_smoother().update(
+            (owner, cid), letter, smoothing.confidence(dist, thr) if letter else 0.0
+        )
+    # Registro muestreado para análisis offline: solo encola, nunca bloquea
+    get_prediction_logger().record(owner, model_cached["id"], result, fv)
+    return JsonResponse(result)
@@ -1,11 +1,18 @@
 export const API_BASE = import.meta.env.VITE_API_BASE ?? '/vista02/api'
 
+// Perfil (propietario) de muestras y modelo; vacío = conjunto compartido
+let PROFILE_ID = ''
+
+function setProfile(id: string) { PROFILE_ID = id.trim() }
+
 // Robust fetch with timeout and status checks for production
 async function request(path: string, init?: RequestInit, timeoutMs = 8000) {
   const ctrl = new AbortController()
   const id = setTimeout(() => ctrl.abort(), timeoutMs)
+  const headers: Record<string, string> = { ...((init?.headers as Record<string, string>) || {}) }
+  if (PROFILE_ID) headers['X-Profile-Id'] = PROFILE_ID
   try {
-    const resp = await fetch(`${API_BASE}${path}`, { ...(init || {}), signal: ctrl.signal })
+    const resp = await fetch(`${API_BASE}${path}`, { ...(init || {}), headers, signal: ctrl.signal })
     if (!resp.ok) {
       // Try to parse JSON error, fallback to text
       let body: any = null
@@ -27,7 +34,7 @@ async function request(path: string, init?: RequestInit, timeoutMs = 8000) {
 export type Landmark = { x: number; y: number; z: number }
 
 export type PredictResponse = {
-  status: 'ok' | 'error'
+  status: 'ok' | 'error' | 'superseded'
   letter: string | null
   distance?: number
   threshold?: number
@@ -35,9 +42,26 @@ export type PredictResponse = {
   candidate?: string
   candidate_distance?: number
   accepted_dynamic?: boolean
+  // Solo con opts.smooth: letra estabilizada por el servidor en la ventana reciente de este cliente
+  smoothed?: { letter: string | null; confidence: number; stability: number; stable: boolean; frames: number } | null
+}
+
+// Modo de features negociado con el servidor: 'client' si su extractor tiene la misma huella
+let featureMode: 'unknown' | 'client' | 'server' = 'unknown'
+let localChecksum: string | null = null
+
+function negotiate(model: any) {
+  const ex = model?.extractor
+  if (!ex) return
+  localChecksum = localChecksum ?? featureChecksum()
+  featureMode = (ex.feature_version === FEATURE_VERSION && ex.feature_checksum === localChecksum) ? 'client' : 'server'
 }
 
-async function getModel() { return request(`/model`) }
+async function getModel() {
+  const data = await request(`/model`)
+  if (data && data.status === 'ok') negotiate(data)
+  return data
+}
 
 async function progress() { return request(`/progress`) }
 
@@ -51,18 +75,43 @@ async function samplesBatch(letter: string, samples: any[]) {
   })
 }
 
-async function train() { return request(`/train`, { method: 'POST' }) }
+// El entrenamiento corre en segundo plano: se lanza el trabajo y se consulta hasta que termina
+async function train(pollMs = 500, maxWaitMs = 300000) {
+  const job = await request(`/train`, { method: 'POST' })
+  if (!job || job.status !== 'ok' || !job.job_id) return job
+  const started = Date.now()
+  let st: any = job
+  while (st.state !== 'succeeded' && st.state !== 'failed') {
+    if (Date.now() - started > maxWaitMs) return { status: 'error', message: 'timeout', ...st }
+    await new Promise(r => setTimeout(r, pollMs))
+    st = await request(`/train/${job.job_id}`)
+  }
+  return st.state === 'succeeded' ? st : { ...st, status: 'error', message: st.error }
+}
+
+// Identificador por pestaña: el backend descarta frames viejos de un mismo cliente si llega uno nuevo
+const CLIENT_ID = (globalThis.crypto?.randomUUID?.() ?? `${Date.now()}-${Math.random().toString(36).slice(2)}`)
 
 async function predict(
   landmarksOrPayload: Landmark[] | any,
-  opts?: { dynamic?: boolean },
+  opts?: { dynamic?: boolean; smooth?: boolean },
   signal?: AbortSignal,
 ) {
-  const body = Array.isArray(landmarksOrPayload) && landmarksOrPayload.length === 21
+  if (featureMode === 'unknown') {
+    try { await getModel() } catch { featureMode = 'server' }
+  }
+  const isLandmarks = Array.isArray(landmarksOrPayload) && landmarksOrPayload.length === 21
+  const body = isLandmarks
     ? (() => {
+        // Cliente negociado: se envía solo el feature y el servidor no recalcula
+        if (featureMode !== 'client') {
+          const payload: any = { landmarks: landmarksOrPayload }
+          if (opts?.dynamic) payload.dynamic = true
+          return payload
+        }
         const fv = extractFeatureVector(landmarksOrPayload as Landmark[])
         if (!fv) return null
-        const payload: any = { landmarks: landmarksOrPayload, feature: fv }
+        const payload: any = { feature: fv, feature_version: FEATURE_VERSION, feature_checksum: localChecksum }
         if (opts?.dynamic) payload.dynamic = true
         return payload
       })()
@@ -72,56 +121,162 @@ async function predict(
         return payload
       })()
   if (!body) return { status: 'error' } as PredictResponse
-  return await request(`/predict`, {
+  if (opts?.smooth) body.smooth = true
+  const send = (b: any) => request(`/predict`, {
     method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify(body),
+    headers: { 'Content-Type': 'application/json', 'X-Client-Id': CLIENT_ID },
+    body: JSON.stringify(b),
     signal,
-  }) as PredictResponse
+  }) as Promise<PredictResponse>
+  try {
+    return await send(body)
+  } catch (err: any) {
+    // 409: el servidor cambió de extractor; volver a enviar landmarks
+    if (err?.status === 409 && isLandmarks && featureMode === 'client') {
+      featureMode = 'server'
+      const payload: any = { landmarks: landmarksOrPayload }
+      if (opts?.dynamic) payload.dynamic = true
+      if (opts?.smooth) payload.smooth = true
+      return await send(payload)
+    }
+    throw err
+  }
 }
 
 async function reset() { return request(`/reset`, { method: 'POST' }) }
 
-export const api = { getModel, progress, lastDetected, samplesBatch, train, predict, reset }
+// ===== Paquete compacto del modelo (vista02/services/model_bundle.py, formato 1) =====
+export type ModelBundle = {
+  model_id: number
+  encoding: 'int8' | 'float16'
+  feature_version: string
+  feature_checksum: string
+  letters: string[]
+  centroids: Record<string, number[]>
+  thresholds: Record<string, number>
+  shape: { min_dim: number; groups: Record<string, { tol: number; idx: number[] }> }
+}
+
+function halfToFloat(h: number) {
+  const s = (h & 0x8000) ? -1 : 1, e = (h >> 10) & 0x1f, f = h & 0x3ff
+  if (e === 0) return s * f * 2 ** -24
+  if (e === 31) return f ? NaN : s * Infinity
+  return s * (1 + f / 1024) * 2 ** (e - 15)
+}
+
+export function decodeModelBundle(buf: ArrayBuffer): ModelBundle {
+  const view = new DataView(buf)
+  const magic = String.fromCharCode(...new Uint8Array(buf, 0, 4))
+  if (magic !== 'V2MB' || view.getUint16(4, true) !== 1) throw new Error('paquete de modelo no reconocido')
+  const hlen = view.getUint32(6, true)
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buf, 10, hlen)))
+  const n = header.letters.length, dim = header.dim
+  let pos = 10 + hlen
+  const rows: number[][] = []
+  if (header.encoding === 'int8') {
+    const offset = new Float32Array(buf.slice(pos, pos + 4 * dim))
+    const scale = new Float32Array(buf.slice(pos + 4 * dim, pos + 8 * dim))
+    const q = new Int8Array(buf, pos + 8 * dim, n * dim)
+    for (let r = 0; r < n; r++) rows.push(Array.from({ length: dim }, (_, i) => offset[i] + (q[r * dim + i] + 128) * scale[i]))
+  } else {
+    for (let r = 0; r < n; r++, pos += 2 * dim) rows.push(Array.from({ length: dim }, (_, i) => halfToFloat(view.getUint16(pos + 2 * i, true))))
+  }
+  const centroids: Record<string, number[]> = {}, thresholds: Record<string, number> = {}
+  header.letters.forEach((L: string, i: number) => { centroids[L] = rows[i]; thresholds[L] = header.thresholds[i] })
+  return { ...header, centroids, thresholds }
+}
+
+// Sigue la redirección a `bundle/<digest>`, que el navegador cachea como inmutable
+async function getModelBundle(encoding: 'int8' | 'float16' = 'int8'): Promise<ModelBundle> {
+  const headers: Record<string, string> = {}
+  if (PROFILE_ID) headers['X-Profile-Id'] = PROFILE_ID
+  const resp = await fetch(`${API_BASE}/model/bundle?encoding=${encoding}`, { headers })
+  if (!resp.ok) {
+    const err = new Error(`HTTP ${resp.status} ${resp.statusText} for /model/bundle`)
+    ;(err as any).status = resp.status
+    throw err
+  }
+  return decodeModelBundle(await resp.arrayBuffer())
+}
+
+export const api = { getModel, getModelBundle, progress, lastDetected, samplesBatch, train, predict, reset, setProfile }
 export default api
 
-// ===== Feature extraction (same as ejemplo2_frontend.html) =====
-function dist(a: number[], b: number[]) {
+// ===== Feature extraction (port exacto de vista02/services/feature_extractor.py, "v1") =====
+export const FEATURE_VERSION = 'v1'
+
+type Vec3 = [number, number, number]
+
+function dist(a: Vec3, b: Vec3) {
   const dx = a[0] - b[0], dy = a[1] - b[1], dz = a[2] - b[2]
   return Math.sqrt(dx*dx + dy*dy + dz*dz)
 }
+function sub(a: Vec3, b: Vec3): Vec3 { return [a[0] - b[0], a[1] - b[1], a[2] - b[2]] }
+function dot(a: Vec3, b: Vec3) { return a[0]*b[0] + a[1]*b[1] + a[2]*b[2] }
+function norm(v: Vec3): Vec3 {
+  const n = Math.sqrt(v[0]*v[0] + v[1]*v[1] + v[2]*v[2])
+  if (n < 1e-9) return [0, 0, 0]
+  return [v[0]/n, v[1]/n, v[2]/n]
+}
+function angleCos(a: Vec3, b: Vec3) { return Math.max(-1, Math.min(1, dot(norm(a), norm(b)))) }
+function cross(a: Vec3, b: Vec3): Vec3 {
+  return [a[1]*b[2] - a[2]*b[1], a[2]*b[0] - a[0]*b[2], a[0]*b[1] - a[1]*b[0]]
+}
+
 export function extractFeatureVector(landmarks: Landmark[] | null) {
   if (!Array.isArray(landmarks) || landmarks.length !== 21) return null
-  const pts = landmarks.map(p => [p.x, p.y, p.z])
+  const pts: Vec3[] = landmarks.map(p => [Number(p.x ?? 0), Number(p.y ?? 0), Number(p.z ?? 0)])
   const wrist = pts[0]
-  const rel = pts.map(p => [p[0]-wrist[0], p[1]-wrist[1], p[2]-wrist[2]])
+  const rel: Vec3[] = pts.map(p => [p[0]-wrist[0], p[1]-wrist[1], p[2]-wrist[2]])
 
-  const middle_mcp = rel[9]
-  const base = dist([0,0,0], middle_mcp)
+  // escala: tamaño de palma + separación de MCPs
+  const base = dist([0, 0, 0], rel[9])
   const mcps = [rel[5], rel[9], rel[13], rel[17]]
-  const spread = (dist(mcps[0], mcps[1]) + dist(mcps[1], mcps[2]) + dist(mcps[2], mcps[3])) / 3
-  const scale = Math.max(1e-6, base + spread)
-  const n = rel.map(p => [p[0]/scale, p[1]/scale, p[2]/scale])
-
-  const fingers: Record<string, number[]> = {
-    thumb: [2,3,4],
-    index: [5,6,8],
-    middle: [9,10,12],
-    ring: [13,14,16],
-    pinky: [17,18,20],
-  }
+  let spreadSum = 0
+  for (let i = 0; i < 3; i++) spreadSum += dist(mcps[i], mcps[i + 1])
+  const scale = Math.max(1e-6, base + spreadSum / 3)
+  const pn: Vec3[] = rel.map(p => [p[0]/scale, p[1]/scale, p[2]/scale])
+
+  // marco canónico de la palma
+  const vx = norm(sub(pn[17], pn[5]))
+  const vyTemp = norm(sub(pn[9], [0, 0, 0]))
+  const vz = norm(cross(vx, vyTemp))
+  const vy = norm(cross(vz, vx))
+  const P: Vec3[] = pn.map(p => [dot(p, vx), dot(p, vy), dot(p, vz)])
+
+  const fingers: [number, number, number][] = [[2,3,4], [5,6,8], [9,10,12], [13,14,16], [17,18,20]]
   const feat: number[] = []
-  for (const key of Object.keys(fingers)) {
-    const [mcp, pip, tip] = fingers[key]
-    feat.push(dist(n[tip], n[pip]))
-    feat.push(dist(n[pip], n[mcp]))
-  }
-  const tips = [8,12,16,20]
-  for (let i=0;i<tips.length-1;i++) feat.push(dist(n[tips[i]], n[tips[i+1]]))
+  for (const [mcp, pip, tip] of fingers) feat.push(angleCos(sub(P[pip], P[mcp]), sub(P[tip], P[pip])))
+  for (const [mcp, , tip] of fingers) feat.push(dist(P[tip], P[mcp]))
+  feat.push(dist(P[4], P[8]), dist(P[4], P[12]))
+  for (const [a, b] of [[8,12], [12,16], [16,20]]) feat.push(dist(P[a], P[b]))
+  const dirs = [sub(P[8], P[5]), sub(P[12], P[9]), sub(P[16], P[13]), sub(P[20], P[17])]
+  feat.push(angleCos(dirs[0], dirs[1]), angleCos(dirs[1], dirs[2]), angleCos(dirs[2], dirs[3]))
 
-  const zs = n.map(p => p[2])
-  const meanZ = zs.reduce((a,b)=>a+b,0)/zs.length
-  const varZ = zs.reduce((a,z)=>a+(z-meanZ)*(z-meanZ),0)/zs.length
-  feat.push(varZ)
+  let sumZ = 0
+  for (const p of P) sumZ += p[2]
+  const meanZ = sumZ / P.length
+  let varZ = 0
+  for (const p of P) varZ += (p[2] - meanZ) * (p[2] - meanZ)
+  feat.push(varZ / P.length)
   return feat
 }
+
+// Huella del extractor: misma fórmula que feature_extractor.fingerprint() en el backend
+function probeLandmarks(): Landmark[] {
+  return Array.from({ length: 21 }, (_, i) => ({
+    x: 0.3 + ((i * 7) % 11) / 25,
+    y: 0.2 + ((i * 5) % 13) / 20,
+    z: ((i * 3) % 7 - 3) / 100,
+  }))
+}
+
+export function featureChecksum() {
+  const text = (extractFeatureVector(probeLandmarks()) || []).map(v => v.toFixed(6)).join(',')
+  let h = 0x811c9dc5
+  for (let i = 0; i < text.length; i++) {
+    h ^= text.charCodeAt(i)
+    h = Math.imul(h, 0x01000193) >>> 0
+  }
+  return h.toString(16).padStart(8, '0')
+}